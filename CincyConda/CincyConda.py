@@ -12,24 +12,106 @@ Help
     methods. If a search term is provided, only prints the docstring for that method.
     (not implemented yet)
 Setup
-    Runs the conda comands necessary to set up the CincyPy channel and the restricted
-    channel on the server. This method should only be run once, and will not work if
-    the CincyPy channel and restricted channel are already set up.
+    Sets up conda for the CincyPy channel and the restricted channel on the server, by
+    writing the .condarc and repo config directly. Safe to run again: settings that
+    are already right are left alone.
+Lock
+    Writes a lock file with the exact URL and checksums of every package in the
+    environment.
+FromLock
+    Creates an environment from a lock file written by Lock, without solving.
+Pack, Unpack
+    Pack an environment into a relocatable archive, and unpack it somewhere else
+    (eg on another node) without solving or downloading anything.
+Prefetch
+    Downloads everything an environment needs into a local mirror, which envs can
+    then be built from at local disk speed, also without network access.
+CreateMany
+    Creates many environments at once, concurrently, downloading shared packages once.
+CreateAsync, InstallAsync, updateAsync
+    Start Create, Install or update in the background and return an Operation that
+    streams progress events and can be awaited or cancelled.
+Activate
+    Activates an environment in the notebook's own process, so the commands it starts
+    afterwards run in that environment.
+Run
+    Runs a command inside an environment, like `conda run` but without starting conda.
+Sync
+    Makes an environment match a list of package specs, changing only what differs,
+    in a single conda transaction (and without running conda at all if nothing does).
+Packages
+    Lists the packages installed in an environment, read from its conda-meta folder.
+FindPackage
+    Finds every environment with a package matching a spec, eg 'pandas<2'.
+SyncKernels
+    Makes the Jupyter kernels match the conda environments: adds kernels for new envs
+    and removes the dead kernels of envs that no longer exist.
+Analyze, Compact
+    Report the real disk use of every environment (unique, shared through hardlinks,
+    reclaimable), and hardlink copied package files back to the package cache.
+Verify
+    Checks that the files of an environment (or of every environment) are still the
+    ones conda installed, and says which packages to reinstall.
+BenchmarkBackends
+    Solves the same packages with every available solver backend (libmamba, mamba,
+    micromamba, classic conda) and reports the solve time and memory of each.
+StartWorker, StopWorker
+    Start (or stop) a background worker that keeps conda loaded and runs the conda
+    commands of the notebooks that opt in (worker=True), instead of each command
+    starting conda from scratch.
+Request, Requests
+    Request packages for the CincyPy channel (several at once), and page through the
+    requests by status, package or user to triage them.
 
 
 """
 
 import sys
 import os
-import subprocess
-from collections import namedtuple
-from typing import List, Union, Optional, Tuple, Dict, Any
-import pandas as pd
-
-from get_tech_contacts import get_tech_contacts
+import json
+import time
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, List, Union, Optional, Tuple, Dict, Any
+
+from get_tech_contacts import get_tech_contacts_async, TECH_CONTACTS_TIMEOUT
+from explicit import (pkgs_dirs, writable_pkgs_dir, plan_records, write_explicit,
+                      read_explicit, is_extracted, dist_name, conda_root)
+from channel_index import ChannelIndex, get_channel_index, platform_subdir
+from conda_meta import read_records, meta_dir
+from specs import sync_plan, SyncPlan
+from inventory import PackageTable, env_packages, scan
+from activation import activation_delta, apply_delta, activate
+from pypi import get_pypi_index, project_name
+from condarc import (condarc_path, repo_config_path, shell_initialized, update_yaml,
+                     cincypy_condarc, cincypy_repo_config)
+from solve_cache import SolveCache, config_fingerprint, channel_urls, channels_fingerprint
+from runner import run, CommandResult
+from backends import Backend, select_backend, detect_backends, BACKEND_PREFERENCE
+from envs import CondaEnv, discover_envs, get_env_index, register_env, is_cached, seed_envs
+from kernels import write_kernel, remove_kernels_for, sync_kernels, has_ipykernel
+
+if TYPE_CHECKING:
+    # only for the annotations: these modules are imported in the methods that use
+    # them, so that importing CincyConda stays cheap
+    from operation import Operation
+    from provision import CreateResult
+    from footprint import EnvFootprint
+    from verify import EnvReport
+    from request_store import RequestStore, PackageRequest
 
 CONDA_INSTALL_PATH = "/rsystem/Rapps/anaconda310/bin/conda"
 
+# the package request store shared by every analyst, a SQLite database on a local disk
+# of the server (see request_store.py). $CINCYCONDA_REQUESTS_DB overrides it; when
+# neither is set, Request only works with a local (file://) CincyPy channel
+REQUESTS_DB_PATH = None
+
+# the name of the CincyPy channel on the repo server at channel_alias
+CINCYPY_CHANNEL = "restricted_channel"
+
+# the default lock file written by CincyConda.Lock and read by CincyConda.FromLock
+DEFAULT_LOCKFILE = "cincyconda-lock.txt"
+
 DEFAULT_PACKAGES = ['numpy',
                     'pandas',
                     'matplotlib',
@@ -41,6 +123,44 @@ DEFAULT_PACKAGES = ['numpy',
                     'notebook',
                     'ipykernel']
 
+
+def _current_operation():
+    """
+    Returns the Operation running on this thread, if any. Operations are only started
+    by the *Async methods, which import operation.py first, so until then there is
+    none and operation.py (and concurrent.futures) need not be imported.
+    """
+    operation = sys.modules.get("operation")
+    return operation.current_operation() if operation is not None else None
+
+
+@contextmanager
+def _phase(timings: dict, name: str):
+    """
+    Times the body of a `with` block and records the wall time (in seconds) under
+    `name` in the `timings` dict.
+    """
+    op = _current_operation()
+    if op is not None:
+        op.emit("phase", name)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = timings.get(name, 0.0) + time.perf_counter() - start
+
+
+def _print_timings(timings: dict) -> None:
+    """
+    Prints a small table of phase timings, as recorded by `_phase`.
+    """
+    total = sum(timings.values())
+    print("CincyConda timings:")
+    for name, seconds in timings.items():
+        print(f"    {name:<20} {seconds:8.2f}s")
+    print(f"    {'total':<20} {total:8.2f}s")
+
+
 class CincyConda:
     def __init__(self,
                  packages: list = None,
@@ -49,6 +169,12 @@ class CincyConda:
                  channel_alias: str = None,
                  name: str = ".env",
                  path: str = "./.env/",
+                 lazy: bool = False,
+                 solve_cache: bool = True,
+                 timeout: float = None,
+                 backend: str = "auto",
+                 mirror: Union[bool, str] = False,
+                 worker: bool = False,
                  ):
         self.packages = packages
         self.conda = conda_install_path
@@ -57,16 +183,50 @@ class CincyConda:
         self.name = name
         self.path = path
 
-        # set the tech contacts (only works if the node server is running)
-        try:
-            self.tech_contacts = get_tech_contacts()
-        except Exception as e:
-            print("Could not get tech contacts. The node server may not be running:\n",
-                   e)
-            self.tech_contacts = None
+        # start fetching the tech contacts in the background (only works if the node
+        # server is running). Reading self.tech_contacts waits for the result. In lazy
+        # mode nothing is fetched until self.tech_contacts is actually read
+        self.lazy = lazy
+        self._tech_contacts = None
+        self._tech_contacts_future = None if lazy else get_tech_contacts_async()
+        self._tech_contacts_fetched = not lazy
 
         self.conda_envs = None
 
+        # phase -> seconds for the most recent Create, see _phase
+        self.timings = {}
+
+        # every external command this object runs, see _run
+        self.timeout = timeout
+        self.stream = True
+        self.commands = []
+
+        # solver results shared with everyone using the same cache directory
+        self.solve_cache = SolveCache() if solve_cache else None
+
+        # the solver backend, see the backend property
+        self.backend_name = backend
+        self._backend = None
+
+        # build envs from the local mirror (a folder, or True for the default one),
+        # see Prefetch
+        self.mirror = None
+        if mirror:
+            # imported here so that importing CincyConda stays cheap
+            from mirror import Mirror
+            self.mirror = Mirror(mirror if isinstance(mirror, str) else None)
+
+        # the package request store, opened on first use, see _request_store
+        self._requests = None
+
+        # with worker=True, send conda commands to the CincyConda worker when one is
+        # running, see StartWorker. Nothing is connected until a command runs
+        self._worker = None
+        if worker:
+            # imported here so that importing CincyConda stays cheap
+            from worker import WorkerClient
+            self._worker = WorkerClient(self.conda)
+
     def __post_init__(self):
         # if the base env is not activated, activate it
         self._activate_base()
@@ -79,12 +239,128 @@ class CincyConda:
         if 'ipykernel' not in self.packages:
             self.packages.append('ipykernel')
 
+    @property
+    def tech_contacts(self) -> Optional[dict]:
+        """
+        The technical contacts for the CincyConda project, or None if they could not be
+        fetched. Blocks for at most a few seconds the first time it is read.
+        """
+        if not self._tech_contacts_fetched:
+            self._tech_contacts_fetched = True
+            self._tech_contacts_future = get_tech_contacts_async()
+        if self._tech_contacts_future is not None:
+            future, self._tech_contacts_future = self._tech_contacts_future, None
+            try:
+                self._tech_contacts = future.result(timeout=TECH_CONTACTS_TIMEOUT + 1)
+            except Exception as e:
+                print("Could not get tech contacts. The node server may not be running:\n",
+                      e)
+                self._tech_contacts = None
+        return self._tech_contacts
+
+    @tech_contacts.setter
+    def tech_contacts(self, value: Optional[dict]) -> None:
+        self._tech_contacts_fetched = True
+        self._tech_contacts_future = None
+        self._tech_contacts = value
+
+    @property
+    def backend(self) -> Backend:
+        """
+        The backend that runs the solving commands (create, install, update): the
+        fastest available one unless a backend was named when creating the object.
+        Detected on first use.
+        """
+        if self._backend is None:
+            self._backend = select_backend(self.conda, self.backend_name)
+        return self._backend
+
+    @backend.setter
+    def backend(self, value: Union[str, Backend]) -> None:
+        if isinstance(value, str):
+            self.backend_name = value
+            self._backend = None
+        else:
+            self._backend = value
+
+    def _channel_args(self) -> List[str]:
+        """
+        Returns the conda options that point a solve at the local mirror, if this
+        object uses one.
+        """
+        if self.mirror is None:
+            return []
+        # no --offline: the mirror channels are local anyway, and with --offline the
+        # libmamba solver only reads file:// repodata it has cached before
+        args = ["--override-channels"]
+        for url in self.mirror.channels().values():
+            args += ["-c", url]
+        return args
+
+    def _solver_command(self, subcommand: str, *args: str) -> List[str]:
+        """
+        Returns the command line for a solving conda command, run with the solver
+        backend and, if this object uses one, from the local mirror.
+        """
+        return self.backend.command(subcommand, *self._channel_args(), *args)
+
     def __str__(self):
         return f"CincyConda({self.name})"
 
     def __repr__(self):
         return f"CincyConda({self.name})"
 
+    def _run(self,
+             args: list,
+             stream: bool = None,
+             timeout: float = None,
+             **kwargs) -> CommandResult:
+        """
+        Runs an external command through runner.run (or the CincyConda worker, if it
+        is running and runs this command, see StartWorker) and records the result in
+        self.commands, so the cost of every conda call can be looked at afterwards,
+        eg with `for c in env.commands: print(c.summary())`.
+
+        Parameters
+        ----------
+        args : list
+            The command and its arguments
+        stream : bool, optional
+            Whether to print the command's output as it runs, by default self.stream
+        timeout : float, optional
+            Seconds after which the command is killed, by default self.timeout
+        **kwargs
+            Passed on to runner.run
+
+        Returns
+        -------
+        CommandResult
+            The exit code, output, wall time, CPU time and peak RSS of the command
+        """
+        # inside a background operation, send the output to its progress events
+        # instead of the notebook, and let it cancel the command
+        op = _current_operation()
+        if op is not None:
+            op.check_cancelled()
+            kwargs.setdefault("on_line", op._on_line)
+            kwargs.setdefault("on_start", op._on_start)
+            if stream is None:
+                stream = False
+
+        timeout = self.timeout if timeout is None else timeout
+        stream = self.stream if stream is None else stream
+        result = None
+        # a command in the worker can be neither killed on a timeout nor cancelled, so
+        # those (and everything the worker does not run) get a subprocess
+        if self._worker is not None and timeout is None and "on_start" not in kwargs:
+            result = self._worker.run(args, stream=stream, **kwargs)
+        if result is None:
+            result = run(args, timeout=timeout, stream=stream, **kwargs)
+        self.commands.append(result)
+        if result.timed_out:
+            print(f"Command timed out after {result.wall_time:.1f}s: {' '.join(result.args)}")
+        return result
+
     def Help(self, search_term: str = None) -> None:
         """
         Prints documentation for the CondaEnv class to the console, including a list of methods.
@@ -114,50 +390,73 @@ class CincyConda:
         #     # print the docstring
         #     print(doc)
 
-    def Setup(self):
+    def Setup(self,
+              clean: bool = False,
+              login: bool = False) -> Dict[str, bool]:
         """
-        Does the unique setup steps for setting up anaconda on the jupyterhub server.
+        Does the unique setup steps for setting up anaconda on the jupyterhub server:
+        initializes conda in the user's shell, points conda at the CincyPy repo
+        (channel_alias, and the restricted channel first in the channel list), sets the
+        repo site, and (when asked to) logs in.
 
-        This method should only be run once, and will not work if the CincyPy channel
-        and restricted channel are already set up.
-        """
-        # check that the CincyPy channel and restricted channel are not already set up
-        # get the list of channels
-        try:
-            channels = self._get_channels()
-        except Exception as _:
-            pass
+        The configuration files are written directly, each at most once and atomically,
+        instead of through one `conda config` call per setting. Running Setup again
+        only does the steps that are not done yet.
+
+        Parameters
+        ----------
+        clean : bool, optional
+            Also run `conda clean --all` to empty the package cache, by default False
+        login : bool, optional
+            Run `conda repo login` at the end, by default False. Pass True the first
+            time; the token it stores is kept, so later runs do not need it
+
+        Returns
+        -------
+        dict
+            Which steps changed something: 'init', 'condarc', 'repo_config', 'clean'
+            and 'login'
 
-        # initialize conda in the user's shell
-        self.init(help=False)
+        Raises
+        ------
+        AssertionError
+            If channel_alias is not set
+        AssertionError
+            If the shell is not one of ['bash', 'zsh', 'fish', 'powershell', 'xonsh']
+        """
+        assert self.channel_alias is not None, \
+            "channel_alias is not set. Please pass the URL of the CincyPy repo server \
+as channel_alias when creating the CincyConda object."
 
-        # close and re-open the shell
-        subprocess.run([f'{self.shell}', '-c', 'exit'])
+        changed = dict.fromkeys(["init", "condarc", "repo_config", "clean", "login"], False)
 
-        # list of commands to run
-        cmd = [
-            # clear the conda cache and channel list
-            f"{self.conda} clean --all",
+        # initialize conda in the user's shell, unless that was done before
+        if not shell_initialized(self.shell):
+            self.Init()
+            changed["init"] = True
 
-            # add the CIC repo
-            f"{self.conda} config --set channel_alias {self.channel_alias}/repo",
+        # clear the conda cache (slow, so only when asked for)
+        if clean:
+            self._run([f"{self.conda}", "clean", "--all", "-y"])
+            changed["clean"] = True
 
-            # add the restricted_channel to default channels
-            f"{self.conda} config --prepend channels default_channels restricted_channel",
+        # use the CIC repo for channel names, with the restricted_channel first
+        changed["condarc"] = update_yaml(condarc_path(),
+                                         cincypy_condarc(self.channel_alias, CINCYPY_CHANNEL))
 
-            # add the CIC repo to the default channels
-            f"{self.conda} repo config --set sites.anaconda.url {self.channel_alias}",
+        # make the CIC repo the default repo site
+        changed["repo_config"] = update_yaml(repo_config_path(),
+                                             cincypy_repo_config(self.channel_alias))
 
-            # set anaconda to be the default site
-            f"{self.conda} repo config --set default_site anaconda",
+        for step, path in (("condarc", condarc_path()), ("repo_config", repo_config_path())):
+            print(f"{'Updated' if changed[step] else 'Already up to date:'} {path}")
 
-            # log in
-            f"{self.conda} repo login"
-        ]
+        # log in
+        if login:
+            self._run([f"{self.conda}", "repo", "login"])
+            changed["login"] = True
 
-        # loop through the commands and run them
-        for c in cmd:
-            subprocess.run(c.split())
+        return changed
 
     def Init(self,
              help: bool = False) -> None:
@@ -186,12 +485,55 @@ class CincyConda:
              ['bash', 'zsh', 'fish', 'powershell', 'xonsh']"
 
         if help:
-            msg = os.system(f"{self.conda} init --help")
+            self._run([f"{self.conda}", "init", "--help"])
         else:
             # initialize conda in the user's shell
-            msg = os.system(f"{self.conda} init {self.shell}")
+            self._run([f"{self.conda}", "init", f"{self.shell}"])
 
-        print(msg)
+    def StartWorker(self) -> dict:
+        """
+        Starts the CincyConda worker for this conda installation in the background, if
+        it is not running yet. From then on the conda commands of this object, and of
+        every CincyConda object created with worker=True (in any notebook of yours), run
+        in the worker, which keeps conda loaded, instead of each starting conda from
+        scratch. See worker.py.
+
+        Returns
+        -------
+        dict
+            The worker's status: pid, whether it runs conda in-process, and how many
+            commands it has run
+
+        Raises
+        ------
+        AssertionError
+            If the worker does not start
+
+        Example Usage
+        -------------
+        >>> env = CincyConda()
+        >>> env.StartWorker()
+        {'conda': '/rsystem/Rapps/anaconda310/bin/conda', 'pid': 4242, 'in_process': True, ...}
+        >>> env.Install(package='polars')   # runs in the worker
+        """
+        # imported here so that importing CincyConda stays cheap
+        from worker import WorkerClient, start_worker
+
+        status = start_worker(self.conda)
+        if self._worker is None:
+            self._worker = WorkerClient(self.conda)
+        return status
+
+    def StopWorker(self) -> bool:
+        """
+        Stops the CincyConda worker once the commands already queued have run.
+        Returns False if it was not running. Commands then run as subprocesses again.
+        """
+        # imported here so that importing CincyConda stays cheap
+        from worker import WorkerClient
+
+        client = self._worker or WorkerClient(self.conda)
+        return client.shutdown() is not None
 
     def Create(self,
                packages: list = None,
@@ -201,6 +543,15 @@ class CincyConda:
         of packages is installed. If packages are provided, they are installed into the
         environment.
 
+        All of the packages are solved together in a single transaction: conda is asked
+        for the complete install plan once, and the resulting fully pinned package list
+        is downloaded and linked without solving again. To add more packages afterwards,
+        pass them all to `Install` at once.
+
+        The time spent in each phase (channel check, solve, download, link, kernel
+        registration) is printed when the environment is ready, and is also available
+        afterwards in `self.timings`.
+
         Parameters
         ----------
         packages : list, optional
@@ -221,7 +572,13 @@ class CincyConda:
             If an environment already exists at self.path
         AssertionError
             If the package is not in the CincyPy channel
+        AssertionError
+            If conda could not solve or install the environment
         """
+        if help:
+            self._run([f"{self.conda}", "create", "--help"])
+            return
+
         # check to see whether or not an env already exists at self.path
         assert not os.path.exists(self.path), \
             f"An environment already exists at {self.path}. Please either use this env, or \
@@ -234,34 +591,937 @@ delete it and create a new one."
             else:
                 packages = self.packages
 
-        # loop through the packages and check that they are in the CincyPy channel
+        self.timings = {}
 
-         # get the packages in the CincyPy channel
-        channel_packages = self._get_packages_in_channel()
+        with _phase(self.timings, "channel check"):
+            # get the packages in the CincyPy channel
+            channel_packages = self._get_packages_in_channel()
 
-        # loop through the packages and check that they are in the CincyPy channel
-        for package in packages:
-            # check that the package is in the CincyPy channel
-            assert package in channel_packages, \
-                f"Package: {package} is not in the \
+            # check all of the packages against the channel index at once
+            missing = channel_packages.missing(packages)
+            assert not missing, \
+                f"Package(s): {', '.join(missing)} not in the \
 CincyPy channel. Please use a package from the CincyPy channel, or submit a request \
 to add the package to the CincyPy channel using the Request method."
 
-        # create the env with name=self.name and path=self.path
-        os.system(f"{self.conda} create --prefix {self.path} -y")
+        # solve for the whole environment at once (or reuse an identical earlier solve)
+        with _phase(self.timings, "solve"):
+            records = self._cached_solve(packages, channel_packages)
+
+        if records is None:
+            # some packages in the plan could not be pinned to a URL, so let conda
+            # solve and install everything in one go instead
+            with _phase(self.timings, "download + link"):
+                self._conda_create(list(packages), solve=True)
+        else:
+            import tempfile
+            with tempfile.TemporaryDirectory() as tmp:
+                spec_file = write_explicit(os.path.join(tmp, "explicit.txt"), records)
 
-        # install the packages
-        for package in packages:
-            self.Install(package=package)
+                # fetch every package into the package cache
+                with _phase(self.timings, "download"):
+                    self._conda_create(["--file", spec_file, "--download-only"])
+
+                # link the (now cached) packages into the new env. Older versions of
+                # conda ignore --download-only for explicit lists and link right away
+                with _phase(self.timings, "link"):
+                    if not os.path.exists(self.path):
+                        self._conda_create(["--file", spec_file, "--offline"])
 
         # create the kernel - this is necessary for the notebook to recognize the env
-        os.system(f"python -m ipykernel install --user --name {self.name} \
---display-name {self.name}")
+        with _phase(self.timings, "kernel registration"):
+            self._register_kernel()
 
+        _print_timings(self.timings)
 
+    def Pack(self, archive: str = None) -> str:
+        """
+        Packs the env at self.path into a relocatable archive, to recreate it elsewhere
+        with Unpack instead of solving and downloading it again. The archive is
+        written as a stream and compressed on all cores where zstd or pigz is
+        installed.
 
-        # if the base env is not activated, activate it
-        self._activate_base()
+        Parameters
+        ----------
+        archive : str, optional
+            The archive to write, ending in .tar.zst, .tar.gz or .tar; by default
+            '<name>.tar.zst' (or .tar.gz if zstd is not available) in the current
+            folder
+
+        Returns
+        -------
+        str
+            The path of the archive
+
+        Example Usage
+        -------------
+        >>> env = CincyConda(path='./.env/', name='project')
+        >>> env.Pack()
+
+        >>> # expected output:
+        >>> # Packed ./.env/ into project.tar.zst (512.3 MiB) in 14.2s
+        """
+        # imported here so that importing CincyConda stays cheap
+        from pack import pack, default_extension
+
+        assert os.path.isdir(meta_dir(self.path)), \
+            f"There is no conda environment at {self.path} (no conda-meta folder found)."
+        archive = archive or f"{self.name.lstrip('.') or 'env'}{default_extension()}"
+
+        start = time.perf_counter()
+        pack(self.path, archive)
+        print(f"Packed {self.path} into {archive} "
+              f"({os.path.getsize(archive) / 2**20:.1f} MiB) in "
+              f"{time.perf_counter() - start:.1f}s")
+        return archive
+
+    def Unpack(self, archive: str, path: str = None) -> str:
+        """
+        Unpacks an archive written by Pack into a new env, rewriting the path the env
+        was packed from to the new one, and registers the env and its Jupyter kernel.
+
+        Parameters
+        ----------
+        archive : str
+            The archive written by Pack
+        path : str, optional
+            Where to put the env, by default self.path. Must not exist yet (or be empty)
+
+        Returns
+        -------
+        str
+            The path of the new env
+
+        Raises
+        ------
+        AssertionError
+            If the path already exists and is not empty, or the archive was not written
+            by Pack
+        """
+        # imported here so that importing CincyConda stays cheap
+        from pack import unpack
+
+        if path is not None:
+            self.path = path
+
+        start = time.perf_counter()
+        manifest = unpack(archive, self.path)
+        register_env(self.path)
+        print(f"Unpacked {archive} into {self.path} in {time.perf_counter() - start:.1f}s")
+        if manifest["skipped"]:
+            print(f"Warning: {len(manifest['skipped'])} binary files still refer to "
+                  f"{manifest['prefix']}, because the new path is longer than the old "
+                  f"one: {manifest['skipped'][:5]}")
+
+        if has_ipykernel(self.path):
+            self._register_kernel()
+        return self.path
+
+    def Prefetch(self,
+                 packages: list = None,
+                 workers: int = 8) -> Dict[str, List[str]]:
+        """
+        Downloads every package an env with `packages` needs (the packages and all
+        their dependencies, as the solver picks them) into the local mirror, several
+        at a time, checking each against its checksum. The mirror is a file:// channel
+        that envs can be built from at local disk speed, and without network access:
+        create the CincyConda object with mirror=True to use it.
+
+        Parameters
+        ----------
+        packages : list, optional
+            The package specs, by default self.packages or DEFAULT_PACKAGES
+        workers : int, optional
+            How many packages to download at once, by default 8
+
+        Returns
+        -------
+        dict
+            The file names that were 'downloaded' and the ones 'present' already
+
+        Example Usage
+        -------------
+        >>> CincyConda(channel_alias='https://repo.example.com').Prefetch()
+
+        >>> # expected output:
+        >>> # Mirrored 143 packages (143 downloaded) into ~/.cache/cincyconda/mirror
+
+        >>> env = CincyConda(channel_alias='https://repo.example.com', mirror=True)
+        >>> env.Create()
+        """
+        import tempfile
+        from mirror import Mirror
+        packages = list(packages or self.packages or DEFAULT_PACKAGES)
+        mirror = self.mirror or Mirror()
+
+        # solve against the real channels with an empty package cache, so the plan has
+        # the full record (with dependencies) of every package
+        saved, self.mirror = self.mirror, None
+        try:
+            with tempfile.TemporaryDirectory() as tmp, \
+                    _phase(self.timings, "prefetch solve"):
+                path, self.path = self.path, os.path.join(tmp, "env")
+                try:
+                    plan = self._solve(packages,
+                                       env=dict(os.environ, CONDA_PKGS_DIRS=tmp))
+                finally:
+                    self.path = path
+        finally:
+            self.mirror = saved
+
+        records = plan.get("actions", {}).get("FETCH", [])
+        with _phase(self.timings, "prefetch download"):
+            result = mirror.add(records, workers=workers)
+        print(f"Mirrored {len(records)} packages ({len(result['downloaded'])} downloaded) "
+              f"into {mirror.directory}")
+        return result
+
+    def CreateMany(self,
+                   specs: list,
+                   workers: int = None,
+                   memory_per_solve: int = None,
+                   cores_per_solve: int = None,
+                   download_workers: int = 8) -> List["CreateResult"]:
+        """
+        Creates many CincyConda environments at once, eg when a new team or class
+        onboards. The environments are solved and linked concurrently, several at a
+        time, and packages used by more than one of them are only downloaded once.
+        A failure in one environment does not stop the others.
+
+        Parameters
+        ----------
+        specs : list
+            The environments to create, as (path, packages) or (path, packages, name)
+            tuples. If packages is None, DEFAULT_PACKAGES are used. The name (used for
+            the Jupyter kernel) defaults to the folder name of the path, or of its
+            parent folder for paths like './project/.env'.
+        workers : int, optional
+            The number of environments to solve/link at the same time, by default as
+            many as the cores and available memory allow, see provision.default_workers
+        memory_per_solve : int, optional
+            Bytes of memory one solve needs, by default provision.MEMORY_PER_SOLVE
+            (2 GiB)
+        cores_per_solve : int, optional
+            CPU cores one solve needs, by default provision.CORES_PER_SOLVE (1)
+        download_workers : int, optional
+            The number of packages to download at once, by default 8
+
+        Returns
+        -------
+        list
+            One CreateResult(path, name, ok, error, timings) per spec, in the same order
+
+        Example Usage
+        -------------
+        >>> cc = CincyConda(channel_alias='https://conda.example.com')
+        >>> results = cc.CreateMany([('./alice/.env', None),
+        ...                          ('./bob/.env', ['numpy', 'pandas'])])
+        >>> [r.ok for r in results]
+        [True, True]
+        """
+        # imported here so that importing CincyConda stays cheap
+        from concurrent.futures import ThreadPoolExecutor
+        from download import fetch_to_cache
+        from provision import (CreateResult, ExtractionLocks, default_workers,
+                               MEMORY_PER_SOLVE, CORES_PER_SOLVE)
+
+        jobs = []
+        for spec in specs:
+            path, packages = spec[0], spec[1]
+            if packages is None:
+                packages = DEFAULT_PACKAGES
+            if len(spec) > 2:
+                name = spec[2]
+            else:
+                name = os.path.basename(os.path.normpath(path))
+                if name.startswith("."):
+                    name = os.path.basename(os.path.dirname(os.path.abspath(path)))
+            jobs.append({"env": self._child(path, name), "packages": list(packages),
+                         "records": None, "error": None})
+
+        workers = workers or default_workers(len(jobs), memory_per_solve or MEMORY_PER_SOLVE,
+                                             cores_per_solve or CORES_PER_SOLVE)
+        self.timings = {}
+
+        def _fail(job, error):
+            if job["error"] is None:
+                job["error"] = error
+
+        with _phase(self.timings, "channel check"):
+            channel_packages = self._get_packages_in_channel()
+            for job in jobs:
+                if os.path.exists(job["env"].path):
+                    _fail(job, f"An environment already exists at {job['env'].path}")
+                missing = channel_packages.missing(job["packages"])
+                if missing:
+                    _fail(job, f"Package(s): {', '.join(missing)} not in the CincyPy channel")
+
+        def _solve(job):
+            env = job["env"]
+            try:
+                with _phase(env.timings, "solve"):
+                    job["records"] = env._cached_solve(job["packages"], channel_packages)
+            except Exception as e:
+                _fail(job, str(e))
+
+        with _phase(self.timings, "solve"):
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                list(pool.map(_solve, [job for job in jobs if job["error"] is None]))
+
+        # download every package needed by any of the environments, once
+        with _phase(self.timings, "download"):
+            unique = {}
+            for job in jobs:
+                if job["error"] is None and job["records"]:
+                    for record in job["records"]:
+                        unique.setdefault(record["url"], record)
+
+            session = None
+            if any(not url.startswith("file://") for url in unique):
+                import requests
+                session = requests.Session()
+            cache = writable_pkgs_dir(self.conda)
+
+            def _download(record):
+                try:
+                    fetch_to_cache(record, cache, session)
+                    return None
+                except Exception as e:
+                    return record["url"], str(e)
+
+            with ThreadPoolExecutor(max_workers=download_workers) as pool:
+                failed = dict(f for f in pool.map(_download, unique.values()) if f)
+            for job in jobs:
+                for record in job["records"] or []:
+                    if record["url"] in failed:
+                        _fail(job, f"Could not download {record['url']}: \
+{failed[record['url']]}")
+
+        dirs = pkgs_dirs(self.conda)
+        locks = ExtractionLocks(lambda dist: is_extracted(dist, dirs))
+
+        def _link(job):
+            env = job["env"]
+            try:
+                if job["records"] is None:
+                    # the solve could not be pinned, so let conda do it all at once
+                    with _phase(env.timings, "download + link"):
+                        env._conda_create(job["packages"], solve=True)
+                else:
+                    import tempfile
+                    held = locks.acquire(dist_name(r["url"]) for r in job["records"])
+                    try:
+                        with _phase(env.timings, "link"), \
+                                tempfile.TemporaryDirectory() as tmp:
+                            spec_file = write_explicit(os.path.join(tmp, "explicit.txt"),
+                                                       job["records"])
+                            env._conda_create(["--file", spec_file, "--offline"])
+                    finally:
+                        locks.release(held)
+                with _phase(env.timings, "kernel registration"):
+                    env._register_kernel()
+            except Exception as e:
+                _fail(job, str(e))
+
+        with _phase(self.timings, "link"):
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                list(pool.map(_link, [job for job in jobs if job["error"] is None]))
+
+        results = []
+        for job in jobs:
+            env = job["env"]
+            self.commands.extend(env.commands)
+            results.append(CreateResult(env.path, env.name, job["error"] is None,
+                                        job["error"], env.timings))
+
+        print(f"Created {sum(r.ok for r in results)} of {len(results)} environments \
+({workers} at a time, {len(unique)} unique packages)")
+        for result in results:
+            status = "ok" if result.ok else f"FAILED: {result.error}"
+            print(f"    {result.path:<40} {sum(result.timings.values()):8.2f}s  {status}")
+        _print_timings(self.timings)
+        return results
+
+    def _child(self, path: str, name: str) -> "CincyConda":
+        """
+        Returns a CincyConda for another env at `path`, with the same settings as this
+        one. Its output is not streamed, so it can run alongside others.
+        """
+        child = CincyConda(packages=self.packages,
+                           conda_install_path=self.conda,
+                           shell=self.shell,
+                           channel_alias=self.channel_alias,
+                           name=name,
+                           path=path,
+                           lazy=True,
+                           solve_cache=False,
+                           timeout=self.timeout,
+                           backend=self.backend_name)
+        child.solve_cache = self.solve_cache
+        child._backend = self._backend
+        child.stream = False
+        return child
+
+    def _register_kernel(self) -> None:
+        """
+        Registers the env at self.path as a Jupyter kernel called self.name, by writing
+        its kernelspec directly (see kernels.py).
+        """
+        spec_dir, written = write_kernel(self.path, self.name)
+        if written:
+            print(f"Installed kernelspec {self.name} in {spec_dir}")
+
+    def SyncKernels(self, remove_stale: bool = True) -> Dict[str, List[str]]:
+        """
+        Makes the Jupyter kernels match the conda environments in one pass: every env
+        with ipykernel installed gets a kernel, and the kernels of envs that have been
+        removed are deleted. Kernels that do not belong to a conda env are left alone.
+
+        Parameters
+        ----------
+        remove_stale : bool, optional
+            Whether to delete the kernels of envs that no longer exist, by default True
+
+        Returns
+        -------
+        dict
+            The kernel names that were 'added', 'updated', 'removed' and left
+            'unchanged'
+
+        Example Usage
+        -------------
+        >>> env = CincyConda()
+        >>> env.SyncKernels()
+
+        >>> # expected output:
+        >>> # Kernels: 2 added, 0 updated, 37 removed, 12 unchanged
+        """
+        result = sync_kernels(discover_envs(self.conda, refresh=True),
+                              remove_stale=remove_stale)
+        print(f"Kernels: {len(result['added'])} added, {len(result['updated'])} updated, "
+              f"{len(result['removed'])} removed, {len(result['unchanged'])} unchanged")
+        return result
+
+    def Analyze(self,
+                envs: list = None,
+                workers: int = None) -> List["EnvFootprint"]:
+        """
+        Reports how much disk every env uses: the bytes only it holds, the bytes it
+        shares with other envs or with the package cache (through hardlinks), and the
+        bytes Compact could reclaim by relinking copied package files to the cache.
+        Envs are walked several at a time.
+
+        Parameters
+        ----------
+        envs : list, optional
+            The envs (names, paths or CondaEnvs), by default all of them
+        workers : int, optional
+            How many envs to walk at once, by default footprint.FOOTPRINT_WORKERS (8)
+
+        Returns
+        -------
+        list of EnvFootprint
+            One per env, largest unique footprint first
+
+        Example Usage
+        -------------
+        >>> env = CincyConda()
+        >>> footprints = env.Analyze()
+
+        >>> # expected output:
+        >>> # env                                   unique     shared  reclaimable
+        >>> # /home/user/project/.env            1210 MiB     84 MiB     1105 MiB
+        >>> # ...
+        >>> # 340 envs: 41.5 GiB unique, 12.1 GiB shared, 33.0 GiB reclaimable
+        """
+        return self._footprints(envs, workers, compact=False)
+
+    def Compact(self,
+                envs: list = None,
+                workers: int = None) -> List["EnvFootprint"]:
+        """
+        Replaces every file in the envs that is an identical copy of its file in the
+        package cache with a hardlink to the cache file, as conda itself links
+        packages. Files are compared byte for byte first, and each one is replaced
+        atomically, so an env is never left with a missing or partial file.
+
+        Parameters
+        ----------
+        envs : list, optional
+            The envs (names, paths or CondaEnvs), by default all of them
+        workers : int, optional
+            How many envs to compact at once, by default footprint.FOOTPRINT_WORKERS
+            (8)
+
+        Returns
+        -------
+        list of EnvFootprint
+            One per env, with the 'relinked_files' and 'relinked_bytes'
+
+        Example Usage
+        -------------
+        >>> env = CincyConda()
+        >>> env.Compact()
+
+        >>> # expected output:
+        >>> # Relinked 48211 files in 212 envs, 33.0 GiB freed.
+        """
+        footprints = self._footprints(envs, workers, compact=True)
+        relinked = [f for f in footprints if f.relinked_files]
+        print(f"Relinked {sum(f.relinked_files for f in relinked)} files in "
+              f"{len(relinked)} envs, "
+              f"{sum(f.relinked_bytes for f in relinked) / 2**30:.1f} GiB freed.")
+        return footprints
+
+    def Verify(self,
+               env: Union[str, CondaEnv, list] = None,
+               full: bool = False,
+               all_envs: bool = False,
+               workers: int = None) -> List["EnvReport"]:
+        """
+        Checks every file the packages of an env installed against the env's
+        conda-meta records, to find what is missing or damaged (eg truncated when a
+        quota ran out) before an import fails.
+
+        Parameters
+        ----------
+        env : str, CondaEnv or list, optional
+            The env(s) to check, by name or path, by default this object's env at
+            self.path
+        full : bool, optional
+            Hash every file and compare its sha256, instead of only checking that
+            files exist with the right size and were not modified after the install,
+            by default False
+        all_envs : bool, optional
+            Check every env on the server instead, by default False
+        workers : int, optional
+            How many packages to check at once, by default verify.VERIFY_WORKERS (16)
+
+        Returns
+        -------
+        list of EnvReport
+            One per env, with the problems found and `repair_command()` to fix them
+
+        Example Usage
+        -------------
+        >>> env = CincyConda()
+        >>> env.Verify()
+
+        >>> # expected output:
+        >>> # /home/user/project/.env: 3 problems in 1 packages (missing 2, size 1)
+        >>> #     numpy=1.26.4=py311h64a7726_0: lib/python3.11/site-packages/numpy/...
+        >>> #     repair: conda install -y -p /home/user/project/.env --force-reinstall ...
+        """
+        # imported here so that importing CincyConda stays cheap
+        from verify import verify, VERIFY_WORKERS
+
+        if all_envs:
+            prefixes = [e.path for e in self._all_envs(refresh=True)]
+        elif env is None:
+            prefixes = [os.path.abspath(self.path)]
+        else:
+            envs = env if isinstance(env, list) else [env]
+            prefixes = [self._env_prefix(e)[0] for e in envs]
+
+        reports = []
+        for report in verify(prefixes, full=full, workers=workers or VERIFY_WORKERS):
+            reports.append(report)
+            if report.ok and len(prefixes) > 1:
+                continue
+            print(report.summary())
+            for problem in report.problems[:5]:
+                print(f"    {problem.kind:<9}{problem.package}: {problem.path}")
+            if len(report.problems) > 5:
+                print(f"    ... and {len(report.problems) - 5} more")
+            if not report.ok:
+                print(f"    repair: {' '.join(report.repair_command(self.conda))}")
+
+        if len(prefixes) > 1:
+            broken = [r for r in reports if not r.ok]
+            print(f"Verified {len(reports)} envs: {len(broken)} need repairs.")
+        return reports
+
+    def _footprints(self, envs: list, workers: int, compact: bool) -> List["EnvFootprint"]:
+        # imported here so that importing CincyConda stays cheap
+        from footprint import analyze, FOOTPRINT_WORKERS
+
+        if envs is None:
+            prefixes = [env.path for env in self._all_envs(refresh=True)]
+        else:
+            prefixes = [self._env_prefix(env)[0] for env in envs]
+        footprints = sorted(analyze(prefixes, compact=compact, skip=pkgs_dirs(self.conda),
+                                    workers=workers or FOOTPRINT_WORKERS),
+                            key=lambda f: f.unique_bytes, reverse=True)
+        if compact:
+            return footprints
+
+        print(f"{'env':<36}{'unique':>11}{'shared':>11}{'reclaimable':>13}")
+        for f in footprints:
+            print(f"{f.prefix:<36}{f.unique_bytes / 2**20:>7.0f} MiB"
+                  f"{f.shared_bytes / 2**20:>7.0f} MiB{f.reclaimable_bytes / 2**20:>9.0f} MiB")
+        print(f"{len(footprints)} envs: "
+              f"{sum(f.unique_bytes for f in footprints) / 2**30:.1f} GiB unique, "
+              f"{sum(f.shared_bytes for f in footprints) / 2**30:.1f} GiB shared, "
+              f"{sum(f.reclaimable_bytes for f in footprints) / 2**30:.1f} GiB reclaimable")
+        return footprints
+
+    def Lock(self, lockfile: str = DEFAULT_LOCKFILE) -> str:
+        """
+        Writes a lock file for the environment at self.path: the exact URL and checksums
+        of every package in it. The lock file can be used by `FromLock` to rebuild the
+        same environment on another node (or for another analyst) without solving.
+
+        The lock file is a regular conda explicit package list, so
+        `conda create --file <lockfile>` also works with it.
+
+        Parameters
+        ----------
+        lockfile : str, optional
+            The file to write, by default DEFAULT_LOCKFILE
+
+        Returns
+        -------
+        str
+            The path of the lock file
+
+        Raises
+        ------
+        AssertionError
+            If there is no environment at self.path
+        AssertionError
+            If a package in the environment has no URL recorded (eg it was installed
+            from a local tarball), so it cannot be locked
+        """
+        records = read_records(self.path)
+
+        unlocked = [record["name"] for record in records if not record.get("url")]
+        assert not unlocked, \
+            f"Cannot lock the environment at {self.path}, these packages have no URL \
+recorded: {', '.join(unlocked)}"
+
+        header = ["CincyConda lock file - installs without solving, see CincyConda.FromLock",
+                  f"platform: {platform_subdir()}",
+                  f"prefix: {os.path.abspath(self.path)}",
+                  f"created: {time.strftime('%Y-%m-%d %H:%M:%S')}"]
+        write_explicit(lockfile, records, header)
+        print(f"Locked {len(records)} packages from {self.path} into {lockfile}")
+        return lockfile
+
+    def FromLock(self,
+                 lockfile: str = DEFAULT_LOCKFILE,
+                 workers: int = 4) -> None:
+        """
+        Creates the environment at self.path from a lock file written by `Lock`, without
+        solving. Packages missing from the package cache are downloaded in parallel,
+        and every package is checked against the sha256 (or md5) in the lock file while
+        it downloads. Conda then links the cached packages with --offline.
+
+        Parameters
+        ----------
+        lockfile : str, optional
+            The lock file to read, by default DEFAULT_LOCKFILE
+        workers : int, optional
+            The number of packages to download at once, by default 4
+
+        Returns
+        -------
+        None. Creates the environment at self.path and registers its Jupyter kernel.
+
+        Raises
+        ------
+        AssertionError
+            If an environment already exists at self.path
+        AssertionError
+            If the lock file was made on a different platform
+        download.ChecksumError
+            If a downloaded package does not match the lock file
+        """
+        # imported here so that importing CincyConda stays cheap
+        from download import fetch_to_cache
+        from concurrent.futures import ThreadPoolExecutor
+
+        assert not os.path.exists(self.path), \
+            f"An environment already exists at {self.path}. Please either use this env, or \
+delete it and create a new one."
+
+        records, header = read_explicit(lockfile)
+        platforms = [h.split(":", 1)[1].strip() for h in header if h.startswith("platform:")]
+        assert not platforms or platforms[0] == platform_subdir(), \
+            f"{lockfile} was made on {platforms[0]}, and cannot be used on \
+{platform_subdir()}."
+
+        self.timings = {}
+
+        with _phase(self.timings, "download"):
+            cache = writable_pkgs_dir(self.conda)
+            session = None
+            if any(not record["url"].startswith("file://") for record in records):
+                import requests
+                session = requests.Session()
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                downloaded = [path for path in pool.map(
+                    lambda record: fetch_to_cache(record, cache, session), records) if path]
+            print(f"Downloaded {len(downloaded)} of {len(records)} packages into {cache}")
+
+        with _phase(self.timings, "link"):
+            self._conda_create(["--file", lockfile, "--offline"])
+
+        with _phase(self.timings, "kernel registration"):
+            self._register_kernel()
+
+        _print_timings(self.timings)
+
+    def _get_packages_in_channel(self) -> ChannelIndex:
+        """
+        Returns the index of the packages in the CincyPy channel. The index is cached
+        on disk and only re-downloaded when the channel's repodata changes, so this is
+        cheap to call repeatedly.
+
+        Returns
+        -------
+        ChannelIndex
+            Supports `package in index` and `index.missing(packages)`, where the
+            packages may be plain names or specs like 'numpy>=1.20'
+
+        Raises
+        ------
+        AssertionError
+            If channel_alias is not set
+        """
+        assert self.channel_alias is not None, \
+            "channel_alias is not set. Please pass the URL of the CincyPy repo server \
+as channel_alias when creating the CincyConda object."
+        channel = f"{self.channel_alias.rstrip('/')}/repo/{CINCYPY_CHANNEL}"
+        if self.mirror is not None:
+            channel = self.mirror.url(channel)
+        return get_channel_index(channel)
+
+    def _is_packages_on_pypi(self, packages: Union[str, list]) -> Dict[str, bool]:
+        """
+        Returns {package: True if it is hosted on PyPI} for every package in `packages`.
+
+        Names are normalized as PyPI does (eg 'Scikit_Learn' is 'scikit-learn'), cached
+        answers are reused, and the rest are looked up concurrently in one batch. Set
+        CINCYCONDA_PYPI_SNAPSHOT to a snapshot of the PyPI index (see
+        pypi.save_snapshot) to check without network access.
+
+        Raises
+        ------
+        AssertionError
+            If PyPI could not be reached for some of the packages
+        """
+        if isinstance(packages, str):
+            packages = [packages]
+        return get_pypi_index().check(packages)
+
+    def _cached_solve(self,
+                      packages: list,
+                      channel_packages: ChannelIndex,
+                      command: str = "create") -> Optional[list]:
+        """
+        Returns the fully pinned package records that conda would link for `packages`,
+        from the solve cache if this exact solve has been done before, otherwise by
+        running the solver and caching the result.
+
+        Parameters
+        ----------
+        packages : list
+            The package specs to solve for
+        channel_packages : ChannelIndex
+            The index of the CincyPy channel, whose fingerprint is part of the cache key
+        command : str, optional
+            'create' for a new env, or 'install' to add packages to the env at
+            self.path, by default 'create'
+
+        Returns
+        -------
+        list or None
+            The package records to link, or None if the solve could not be turned into
+            an explicit package list (or, for installs, if it would remove or replace
+            packages), in which case conda should be run the regular way
+        """
+        key = None
+        if self.solve_cache is not None:
+            key = self._solve_key(packages, channel_packages, command)
+        if key is not None:
+            records = self.solve_cache.get(key)
+            if records is not None:
+                print(f"Reusing a cached solve for {len(records)} packages")
+                return records
+
+        plan = self._solve(packages, command=command)
+        if plan.get("actions", {}).get("UNLINK"):
+            return None
+        records = plan_records(plan, pkgs_dirs(self.conda))
+        if records is not None and key is not None:
+            self.solve_cache.put(key, records, packages)
+        return records
+
+    def _solve_key(self,
+                   packages: list,
+                   channel_packages: ChannelIndex,
+                   command: str) -> Optional[str]:
+        """
+        Returns the solve cache key for solving `packages` with `command` into the env
+        at self.path (see SolveCache.key), or None if a cached solve cannot be trusted
+        because a channel of the solve could not be checked.
+        """
+        installed = []
+        if command == "install":
+            # every installed package, with or without a URL, so an install never
+            # shares a key with a create
+            installed = [r.get("url") or f"{r.get('channel', '')}::{r.get('name')}-"
+                         f"{r.get('version')}-{r.get('build')}"
+                         for r in read_records(self.path)]
+
+        fingerprint = channel_packages.fingerprint()
+        if self.mirror is not None:
+            # the mirror replaces the configured channels (--override-channels)
+            fingerprint += self.mirror.fingerprint()
+            channels = ""
+        else:
+            channels = channels_fingerprint(channel_urls(self.conda))
+            if channels is None:
+                return None
+        return self.solve_cache.key(packages, fingerprint, platform_subdir(), installed,
+                                    command=command,
+                                    backend=self._solver_command(command),
+                                    config=f"{config_fingerprint(self.conda)}|{channels}")
+
+    def _solve(self, packages: list, command: str = "create", **kwargs) -> dict:
+        """
+        Asks conda for the complete install plan for the env at self.path containing
+        `packages`, without changing anything on disk.
+
+        Parameters
+        ----------
+        packages : list
+            The package specs to solve for
+        command : str, optional
+            'create' for a new env, or 'install' to add packages to the env at
+            self.path, by default 'create'
+        **kwargs
+            Passed on to _run, eg env
+
+        Returns
+        -------
+        dict
+            The parsed output of `conda <command> --dry-run --json`
+
+        Raises
+        ------
+        AssertionError
+            If conda could not solve the environment
+        """
+        result = self._run(self._solver_command(command, "--prefix", f"{self.path}",
+                                                "--dry-run", "--json", *packages),
+                           stream=False, **kwargs)
+        try:
+            plan = json.loads(result.stdout)
+        except ValueError:
+            plan = None
+
+        if plan is None and self.backend.name != "classic":
+            # the backend itself failed (rather than the solve), so use classic conda
+            print(f"The {self.backend.name} solver failed, falling back to classic conda.")
+            self._backend = detect_backends(self.conda)["classic"]
+            return self._solve(packages, command=command, **kwargs)
+        if plan is None:
+            plan = {"success": False, "error": result.stderr}
+
+        assert result.returncode == 0 and plan.get("success", False), \
+            f"Could not solve the environment for packages {list(packages)}:\n\
+{plan.get('error', plan)}"
+        return plan
+
+    def _conda_create(self, args: list, solve: bool = False) -> None:
+        """
+        Runs `conda create --prefix self.path -y` with the extra arguments in `args`.
+        Pass solve=True when `args` are package specs rather than an explicit file, so
+        the solver backend is used.
+
+        Raises
+        ------
+        AssertionError
+            If conda returns a non-zero exit code
+        """
+        if solve:
+            command = self._solver_command("create", "--prefix", f"{self.path}", "-y", *args)
+        else:
+            command = [f"{self.conda}", "create", "--prefix", f"{self.path}", "-y", *args]
+        result = self._run(command)
+        assert result.returncode == 0, \
+            f"conda create failed with exit code {result.returncode}"
+
+    def BenchmarkBackends(self,
+                          packages: list = None,
+                          backends: list = None,
+                          repeat: int = 1) -> List[Dict[str, Any]]:
+        """
+        Solves the same packages with each solver backend and reports how long the
+        solve took and how much memory it needed. Nothing is installed: every solve is
+        a dry run for a new env next to self.path. The solve cache is not used.
+
+        Parameters
+        ----------
+        packages : list, optional
+            The package specs to solve for, by default self.packages or DEFAULT_PACKAGES
+        backends : list, optional
+            The backends to compare, by default every available one
+        repeat : int, optional
+            How many times to solve with each backend (the fastest run is reported),
+            by default 1
+
+        Returns
+        -------
+        list
+            One dict per backend with the keys 'backend', 'ok', 'wall_time' (seconds),
+            'cpu_time' (seconds), 'peak_rss' (bytes) and 'error'
+
+        Example Usage
+        -------------
+        >>> env = CincyConda()
+        >>> env.BenchmarkBackends(packages=['numpy', 'pandas'])
+
+        >>> # expected output:
+        >>> # backend         solve       cpu    peak memory
+        >>> # libmamba        6.12s     5.80s        412 MiB
+        >>> # classic        48.77s    47.95s       1630 MiB
+        """
+        packages = packages or self.packages or DEFAULT_PACKAGES
+        available = detect_backends(self.conda)
+        if backends is None:
+            backends = [name for name in BACKEND_PREFERENCE if name in available]
+        for name in backends:
+            assert name in available, \
+                f"The '{name}' backend is not available. Please use one of the following: \
+{[name for name in BACKEND_PREFERENCE if name in available]}"
+
+        # a prefix that does not exist, so every backend solves a fresh env
+        prefix = os.path.join(os.path.dirname(os.path.abspath(self.path)),
+                              ".cincyconda-benchmark")
+
+        results = []
+        for name in backends:
+            runs = []
+            for _ in range(max(1, repeat)):
+                runs.append(self._run(available[name].command(
+                    "create", "--prefix", prefix, "--dry-run", "--json", *packages),
+                    stream=False))
+            best = min(runs, key=lambda r: r.wall_time)
+            results.append({"backend": name,
+                            "ok": best.ok,
+                            "wall_time": best.wall_time,
+                            "cpu_time": best.cpu_time,
+                            "peak_rss": best.peak_rss,
+                            "error": None if best.ok else best.stderr.strip()[-500:]})
+
+        print(f"{'backend':<12}{'solve':>10}{'cpu':>10}{'peak memory':>15}")
+        for r in results:
+            status = "" if r["ok"] else "  (failed)"
+            print(f"{r['backend']:<12}{r['wall_time']:>9.2f}s{r['cpu_time']:>9.2f}s"
+                  f"{r['peak_rss'] / 2**20:>11.0f} MiB{status}")
+        return results
 
     def Remove(self,
                env:str = None,
@@ -272,7 +1532,7 @@ to add the package to the CincyPy channel using the Request method."
         the base environment.
         """
         if help:
-            msg = os.system(f"{self.conda} env remove --help")
+            self._run([f"{self.conda}", "env", "remove", "--help"])
         else:
                 
             # make sure the env is not the base env
@@ -284,23 +1544,201 @@ to add the package to the CincyPy channel using the Request method."
                 f"Cannot remove the current environment: {self.name}"
 
             # make sure the env is in the list of envs
-            assert env in self.env(), \
+            assert env in self.Env(), \
                 f"Could not find environment: {env}. Please use one of the following: \
-{self.env()}"
+{self.Env()}"
 
-            # remove the env
-            subprocess.run([f"{self.conda}", "env", "remove",
-                            "--name", f"{env.name}", "-y"])
+            # remove the env, and its kernel once the env is gone
+            self._run([f"{self.conda}", "env", "remove",
+                       "--name", f"{env.name}", "-y"])
+            if not os.path.exists(env.path):
+                remove_kernels_for(env.path)
 
     def update(self, package):
-        # if the base env is not activated, activate it
-        self._activate_base()
+        # update the env, leaving the active environment as it is
+        result = self._run(self._solver_command("update", "--prefix", f"{self.path}",
+                                                f"{package}", "-y"))
+        assert result.returncode == 0, \
+            f"conda update failed with exit code {result.returncode}"
+
+    def Sync(self,
+             packages: list = None,
+             prune: bool = False,
+             dry_run: bool = False) -> SyncPlan:
+        """
+        Makes the env at self.path match a list of package specs. The installed
+        packages are read from the env's conda-meta records and compared with the
+        specs, and only the difference is handed to conda, in one transaction (two
+        with prune: the removals, then the installs). If the env already matches, conda
+        is not run at all.
 
-        # update the env
-        os.system(f"{self.conda} update --prefix {self.path} {package} -y")
+        Parameters
+        ----------
+        packages : list, optional
+            The package specs the env should satisfy, eg ['pandas>=2', 'numpy=1.26'],
+            by default self.packages
+        prune : bool, optional
+            Also remove every package that no spec needs, directly or as a
+            dependency, by default False
+        dry_run : bool, optional
+            Only print and return the changes, by default False
 
-        # if the base env is not activated, activate it
-        self._activate_base()
+        Returns
+        -------
+        SyncPlan
+            The specs that were added and changed and the packages that were removed
+            (empty if the env already matched)
+
+        Example Usage
+        -------------
+        >>> env = CincyConda(path='./.env/')
+        >>> env.Sync(packages=['numpy', 'pandas>=2', 'scipy'])
+
+        >>> # expected output:
+        >>> # Sync: add scipy; change pandas>=2 (installed 1.5.3)
+        >>> # ...
+        >>> env.Sync(packages=['numpy', 'pandas>=2', 'scipy'])
+
+        >>> # expected output:
+        >>> # The environment at ./.env/ already matches the 3 specs.
+        """
+        packages = list(packages or self.packages or [])
+        assert packages, "No packages provided. Please pass the specs the env should match."
+
+        if not os.path.isdir(meta_dir(self.path)):
+            print(f"There is no environment at {self.path} yet, creating it.")
+            if not dry_run:
+                self.Create(packages=packages)
+            return SyncPlan([], [], [])
+
+        records = read_records(self.path)
+        plan = sync_plan(records, packages, prune=prune)
+        if not plan:
+            print(f"The environment at {self.path} already matches the {len(packages)} specs.")
+            return plan
+
+        installed = {r["name"].lower(): r["version"] for r in records}
+        changes = []
+        if plan.add:
+            changes.append("add " + ", ".join(spec.text for spec in plan.add))
+        if plan.change:
+            changes.append("change " + ", ".join(f"{spec.text} (installed {installed[spec.name]})"
+                                                 for spec in plan.change))
+        if plan.remove:
+            changes.append("remove " + ", ".join(plan.remove))
+        print("Sync: " + "; ".join(changes))
+        if dry_run:
+            return plan
+
+        # removing first, then installing, so both steps go through the solver
+        # backend and the mirror
+        steps = []
+        if plan.remove:
+            steps.append(self._solver_command("remove", "--prefix", f"{self.path}",
+                                              "-y", *plan.remove))
+        if plan.add or plan.change:
+            steps.append(self._solver_command(
+                "install", "--prefix", f"{self.path}", "-y",
+                *[spec.text for spec in plan.add + plan.change]))
+        for args in steps:
+            result = self._run(args)
+            assert result.returncode == 0, \
+                f"Could not sync the environment at {self.path}, conda exited with code \
+{result.returncode}"
+
+        return plan
+
+    def CreateAsync(self, packages: list = None) -> "Operation":
+        """
+        Starts `Create` in the background and returns right away, so the notebook can
+        be used while conda works. Cancelling the operation removes the partially
+        created environment.
+
+        Parameters
+        ----------
+        packages : list, optional
+            The packages to install, see `Create`
+
+        Returns
+        -------
+        Operation
+            Stream its progress with `op.events()`, wait for it with `op.result()` or
+            `await op`, and stop it with `op.cancel()`
+
+        Example Usage
+        -------------
+        >>> op = CincyConda(path='./.env/').CreateAsync()
+        >>> for event in op.events():
+        ...     print(f"{event.time:6.1f}s {event.kind:8} {event.message}")
+        """
+        # imported here so that importing CincyConda stays cheap
+        from operation import Operation
+
+        cleanup = None if os.path.exists(self.path) else self.path
+        return Operation(f"Create {self.path}",
+                         lambda: self.Create(packages=packages),
+                         cleanup_path=cleanup).start()
+
+    def InstallAsync(self,
+                     env: str = None,
+                     package: Union[str, list] = None) -> "Operation":
+        """
+        Starts `Install` in the background and returns right away. Cancelling the
+        operation stops conda, but cannot undo packages it has already linked.
+
+        Returns
+        -------
+        Operation
+            See `CreateAsync`
+        """
+        # imported here so that importing CincyConda stays cheap
+        from operation import Operation
+
+        return Operation(f"Install {package} into {self.path}",
+                         lambda: self.Install(env=env, package=package)).start()
+
+    def updateAsync(self, package) -> "Operation":
+        """
+        Starts `update` in the background and returns right away. Cancelling the
+        operation stops conda, but cannot undo packages it has already linked.
+
+        Returns
+        -------
+        Operation
+            See `CreateAsync`
+        """
+        # imported here so that importing CincyConda stays cheap
+        from operation import Operation
+
+        return Operation(f"update {package} in {self.path}",
+                         lambda: self.update(package)).start()
+
+    def _activate_base(self) -> None:
+        """
+        Activates the base environment, unless it is already the active one.
+        """
+        if os.environ.get("CONDA_DEFAULT_ENV", "base") != "base":
+            self._activate_env("base")
+
+    def _env_prefix(self, env: Union[str, CondaEnv]) -> Tuple[str, str]:
+        """
+        Returns the (path, name) of `env`: 'base', an env name, a CondaEnv, or the path
+        of an env.
+        """
+        if isinstance(env, CondaEnv):
+            return env.path, env.name or env.path
+        if env == "base":
+            return conda_root(self.conda), "base"
+        if os.path.isdir(meta_dir(env)):
+            return os.path.abspath(env), os.path.abspath(env)
+        found = self.Env(env)
+        assert isinstance(found, CondaEnv), \
+            f"More than one environment matches '{env}': {found}. Please be more specific."
+        return found.path, found.name or found.path
+
+    def _activation(self, env: Union[str, CondaEnv]) -> dict:
+        prefix, name = self._env_prefix(env)
+        return activation_delta(conda_root(self.conda), prefix, name, shell=self.shell)
 
     def _activate_env(self,
                       env:str = "base") -> None:
@@ -309,6 +1747,10 @@ to add the package to the CincyPy channel using the Request method."
         environment indicated by `env`. If no environment is provided, the base
         environment is activated.
 
+        The environment is activated in this process, by applying its cached activation
+        delta (PATH, CONDA_PREFIX, the variables from its activate.d scripts, ...) to
+        os.environ, see activation.py.
+
         It is not intended to be used directly.
 
         Parameters
@@ -320,17 +1762,20 @@ to add the package to the CincyPy channel using the Request method."
         -------
         None. Activates the environment indicated by env, prints a message to the console.
         """
+        activate(self._activation(env))
         if env=="base":
-            os.system("conda activate base")
             print("Activated base environment")
         else:
-            os.system(f"conda activate {env}")
             print(f"Activated environment: {env}")
 
     def Activate(self, env:str = 'base'):
         """
         Activates a CincyConda environment. If no environment is provided, the base
         environment is activated.
+
+        The notebook's environment variables are changed, so shell commands started
+        from the notebook afterwards (eg `!python --version`) run in the environment.
+        The Python kernel itself keeps running in its own environment.
         """
         assert hasattr(self, 'conda'), \
             f"conda_install_path is not set. Please set it to the path of your conda \
@@ -344,10 +1789,10 @@ f"sys.base_prefix: '{sys.base_prefix}' is not set"
         else:
             # check that the env exists, and if it does, activate it
             try:
-                assert self.env(env) is not None, \
+                assert self.Env(env) is not None, \
                     f"""Could not find environment: {env}. Please use one of the \
 following: 
-{self.env()}"""
+{self.Env()}"""
                 self._activate_env(env)
 
             # if the env does not exist, print an error message and
@@ -356,13 +1801,57 @@ following:
                 print(e)
                 self._activate_env('base')
 
+    def Run(self,
+            env: Union[str, CondaEnv] = None,
+            cmd: Union[str, List[str]] = None,
+            stream: bool = None,
+            timeout: float = None) -> CommandResult:
+        """
+        Runs a command inside an environment, like `conda run -p <env> <cmd>`, but
+        without starting conda: the env's cached activation delta is applied to the
+        command's environment variables.
+
+        Parameters
+        ----------
+        env : str or CondaEnv, optional
+            The env to run in: a name, a path, or 'base'; by default self.path
+        cmd : str or list
+            The command, eg 'python -c "import numpy"' or ['python', '--version']
+        stream : bool, optional
+            Whether to print the command's output as it runs, by default self.stream
+        timeout : float, optional
+            Seconds after which the command is killed, by default self.timeout
+
+        Returns
+        -------
+        CommandResult
+            The exit code and output of the command
+
+        Example Usage
+        -------------
+        >>> env = CincyConda()
+        >>> env.Run(cmd='python --version')
+
+        >>> # expected output:
+        >>> # Python 3.11.8
+        """
+        assert cmd, "No command provided. Please pass the command to run as cmd."
+        if isinstance(cmd, str):
+            import shlex
+            cmd = shlex.split(cmd)
+        environ = apply_delta(self._activation(self.path if env is None else env),
+                              os.environ)
+        return self._run(list(cmd), stream=stream, timeout=timeout, env=environ)
+
     def Install(self,
                 env:str = None,
-                package:str = None,
+                package:Union[str, list] = None,
                 help:bool = False):
         """
         Installs a package into the current environment. If no package is provided,
-        nothing happens.
+        nothing happens. If a list of packages is provided, they are all installed in a
+        single conda transaction (one solve), which is much faster than installing them
+        one at a time.
 
         Parameters
         ----------
@@ -370,8 +1859,9 @@ following:
             The name of the environment to install the package into, by
             default None. If no environment is provided, the package is installed
             into the current environment.
-        package : str, optional
-            The name of the package to install, by default None
+        package : str or list, optional
+            The name of the package to install, or a list of package names, by
+            default None
         help : bool, optional
             Whether to print the help message, by default False
 
@@ -385,6 +1875,8 @@ following:
             If the package is not a string
         AssertionError
             If the package is not in the CincyPy channel
+        AssertionError
+            If conda fails to install the packages
 
         Example Usage
         -------------
@@ -398,9 +1890,17 @@ following:
         >>> #
         >>> # # All requested packages already installed.
         """
+        if help:
+            self._run([f"{self.conda}", "install", "--help"])
+            return
+
         assert env != 'base', \
             "CincyConda cannot be used to install packages into the base environment."
 
+        # if an env is not provided, use this object's env
+        if env is None:
+            env = self.name
+
         # if an env is not provided, install the package into the current env, 
         # unless the current env is the base env
         assert env is not None and env != 'base', \
@@ -413,61 +1913,124 @@ environment, or pass in an environment name to the Install method."
             print("No package provided. Nothing to install.")
             return
 
-        # install the package
-        subprocess.run([f"{self.conda}", "install", "--prefix", f"{self.path}",
-                        "-y", f"{package}"])
-
-        # if the base env is not activated, activate it
-        self._activate_base()
-
-    def _all_envs(self) -> list:
+        if isinstance(package, str):
+            package = [package]
+
+        # reuse an earlier identical solve when possible (needs the channel index)
+        records = None
+        if self.channel_alias is not None:
+            records = self._cached_solve(package, self._get_packages_in_channel(),
+                                         command="install")
+
+        if records is None:
+            # install the package(s) in one transaction
+            result = self._run(self._solver_command("install", "--prefix", f"{self.path}",
+                                                    "-y", *package))
+        elif not records:
+            print("All requested packages already installed.")
+            return
+        else:
+            import tempfile
+            with tempfile.TemporaryDirectory() as tmp:
+                spec_file = write_explicit(os.path.join(tmp, "explicit.txt"), records)
+                result = self._run([f"{self.conda}", "install", "--prefix", f"{self.path}",
+                                    "-y", "--file", spec_file])
+        assert result.returncode == 0, \
+            f"conda install failed with exit code {result.returncode}"
+
+    def _all_envs(self, refresh: bool = False) -> list:
         """
         Returns the available conda environments in a python list
 
+        The environments are read straight from conda's own records (the base
+        environment, the envs_dirs folders and ~/.conda/environments.txt) instead of
+        running `conda env list`. The result is cached and only rebuilt when an
+        environment is added or removed, so calling this repeatedly is cheap. A new
+        process asks the CincyConda worker, if it is running, instead of scanning.
+
         Parameters
         ----------
-        name : str
-            The name of the conda environment to return
+        refresh : bool, optional
+            Ignore the cache and look for environments again, by default False
 
         Returns
         -------
         list
-            A list of available conda environments
+            A list of CondaEnv(name, path) records, base first
+        """
+        envs = None
+        if self._worker is not None and (refresh or not is_cached(self.conda)):
+            envs = self._worker.envs(refresh=refresh)
+            if envs is not None:
+                envs = seed_envs(self.conda, envs)
+        if envs is None:
+            envs = discover_envs(self.conda, refresh=refresh)
+        self.conda_envs = list(envs)
+        return self.conda_envs
+
+    def Packages(self, env: Union[str, CondaEnv] = None) -> PackageTable:
+        """
+        Returns the packages installed in an env, like `conda list` but read directly
+        from the env's conda-meta folder (and cached until the env changes).
 
-        Raises
-        ------
-        AssertionError
-            If the name is not a string
-        AssertionError
-            If the name is not in the list of available conda environments, and is
-            not a substring of any of the available conda environment names or paths
+        Parameters
+        ----------
+        env : str or CondaEnv, optional
+            The env, by name or path, by default this object's env at self.path
 
-        """
-        # get the envs
-        # envs = os.system(f"{self.conda} env list")
+        Returns
+        -------
+        PackageTable
+            The columns prefix, name, version, build, channel, size and files
+
+        Example Usage
+        -------------
+        >>> env = CincyConda()
+        >>> env.Packages().where('numpy')
 
-        if self.conda_envs is not None:
-            return self.conda_envs
+        >>> # expected output:
+        >>> # PackageTable(1 packages in 1 envs)
+        >>> #     numpy       1.26.4       py311h64a7726_0      /home/user/project/.env
+        """
+        if env is None:
+            prefix = self.path
+        elif isinstance(env, CondaEnv):
+            prefix = env.path
+        elif os.path.isdir(meta_dir(env)):
+            prefix = env
         else:
-            envs = subprocess.run([f"{self.conda}", "env", "list"],
-                                  stdout=subprocess.PIPE,
-                                  stderr=subprocess.PIPE)
-
-            # convert to a list
-            if envs.returncode != 0:
-                print(f"Error executing command: {envs.stderr.decode('utf-8')}")
-                return []
-            else:
-                self.conda_envs = namedtuple('CondaEnv', ['name', 'path'])   
-                output = []
-                for line in envs.stdout.decode('utf-8').splitlines()[2:]:
-                    env_name = line.split()
-                    env_path = line.split()
-                    output.append(self.conda_envs(env_name, env_path))
-            self.conda_envs = output
-            return output
+            prefix = self.Env(env).path
+        return env_packages(prefix)
+
+    def FindPackage(self, spec: str, refresh: bool = False) -> PackageTable:
+        """
+        Finds the package matching `spec` in every conda env on the server.
+
+        Parameters
+        ----------
+        spec : str
+            A conda match spec, eg 'pandas', 'pandas<2' or 'numpy>=1.24,<1.26'
+        refresh : bool, optional
+            Whether to rediscover the envs first, by default False
+
+        Returns
+        -------
+        PackageTable
+            One row per env with a matching package; `.envs()` lists the env paths
+
+        Example Usage
+        -------------
+        >>> env = CincyConda()
+        >>> env.FindPackage('pandas<2').envs()
 
-    
+        >>> # expected output:
+        >>> # Found pandas<2 in 12 of 340 environments.
+        >>> # ['/home/user/project/.env', ...]
+        """
+        envs = self._all_envs(refresh=refresh)
+        found = scan(env.path for env in envs).where(spec)
+        print(f"Found {spec} in {len(found.envs())} of {len(envs)} environments.")
+        return found
 
     def Env(self,
             name:str = None,
@@ -484,54 +2047,61 @@ environment, or pass in an environment name to the Install method."
 
         Returns
         -------
-        list
-            A list of available conda environments
+        CondaEnv or list
+            If no name is provided, a list of all available conda environments. If the
+            name matches one environment (exactly, or as a substring of its name or
+            path), that CondaEnv. If it matches several, a list of them, best matches
+            first: exact, then prefix, then substring matches.
         
         Raises
         ------
         AssertionError
             If the name is not a string
+        AssertionError
+            If several environments have exactly this name (in different envs dirs)
         AssertionError
             If the name is not in the list of available conda environments, and is
             not a substring of any of the available conda environment names or paths
 
         """
-        # get the envs
-        envs = self._all_envs()
-
         # if no name is provided, return all envs
         if name is None:
-            return envs
+            return self._all_envs()
 
         # if a name is provided, make sure it is a string
         assert isinstance(name, str), \
             f"name must be a string, not {type(name)}"
-        
-        # if the name is in the list of CincyConda objects, return it
-        if name in [env.name for env in envs]:
-            return [env for env in envs if env.name == name][0]
-        
-        # if the name is not in the list of CincyConda objects, check if it is a substring
-        # of any of the names first, then the paths
-        elif name not in [env.name for env in envs]:
-            envs = [env for env in envs if name in env.name]
-            if len(envs) == 1:
-                return envs[0]
-            elif len(envs) > 1:
-                return envs
-            else:
-                envs = [env for env in envs if name in env.path]
-                if len(envs) == 1:
-                    return envs[0]
-                elif len(envs) > 1:
-                    return envs
-                else:
-                    raise AssertionError(f"Could not find environment: {name}")
 
-    def Request(self, package:str = None):
+        # the index is built once per discovery snapshot and reused until an env is
+        # added or removed (a new process takes the snapshot from the worker)
+        if self._worker is not None and not is_cached(self.conda):
+            self._all_envs()
+        index = get_env_index(discover_envs(self.conda))
+
+        # if the name (or path) matches exactly, return that env
+        exact = index.exact(name)
+        if exact:
+            # several envs dirs can each hold an env of that name
+            assert len(exact) == 1, f"There are {len(exact)} environments named \
+'{name}': {[env.path for env in exact]}. Please pass the path of the one you mean."
+            return exact[0]
+
+        # otherwise look for envs whose name contains it, then envs whose path
+        # contains it, best matches first
+        for field in ("name", "path"):
+            matches = index.search(name, field=field)
+            if len(matches) == 1:
+                return matches[0]
+            elif len(matches) > 1:
+                return matches
+
+        raise AssertionError(f"Could not find environment: {name}")
+
+    def Request(self, package: Union[str, list] = None, reason: str = None) -> List[int]:
         """
         Creates a request to add a package to the CincyPy channel. If no package is provided,
-        nothing happens. Otherwise, the user is prompted to provide a reason for the request. 
+        nothing happens. Otherwise, the user is prompted to provide a reason for the request
+        (unless `reason` is passed).
         
         The package string is checked to make sure it is a valid package name, which in this
         case means that it is hosted on PyPI. For example, the pandas library is hosted at:
@@ -539,20 +2109,106 @@ environment, or pass in an environment name to the Install method."
         You should expect the URL to be formatted this way:
             https://pypi.org/project/{package}/
         Then the package string should be the same as the {package} part of the URL.
+        A list of packages can be passed to request several at once; they are all checked
+        against PyPI together (see _is_packages_on_pypi).
 
         Assuming the package is hosted on PyPI, the request is made by adding the user, date,
-        package, reason, and status to the requests.csv file in the CincyPy channel. The status
-        is set to 'unseen' by default.
+        package, reason, and status to the request store of the CincyPy channel (see
+        request_store), all packages in one transaction. The status is set to 'unseen' by
+        default.
+
+        Returns
+        -------
+        list
+            The ids of the new requests
+
+        Raises
+        ------
+        AssertionError
+            If a package is not on PyPI, or no shared request store is configured (see
+            REQUESTS_DB_PATH)
         """
         # if no package is provided, return
-        if package is None:
-            return
+        if not package:
+            return []
+        packages = [package] if isinstance(package, str) else list(package)
 
-        # check that the package is hosted on PyPI
-        # get the list of packages hosted on PyPI
-        is_on_pypi = self._is_packages_on_pypi(package)
+        # check that the packages are hosted on PyPI, all at once
+        is_on_pypi = self._is_packages_on_pypi(packages)
+        missing = [p for p, found in is_on_pypi.items() if not found]
 
         # check that the package is in the list of packages hosted on PyPI
-        assert is_on_pypi, \
-            f"Package: '{package}' is not hosted on PyPI. Please use a package hosted on PyPI, \
-or contact one of {self.tech_contacts} for a custom package."
\ No newline at end of file
+        assert not missing, \
+            f"Package(s): {missing} not hosted on PyPI. Please use packages hosted on PyPI, \
+or contact one of {self.tech_contacts} for a custom package."
+
+        if reason is None:
+            reason = input(f"Why do you need {', '.join(packages)}? ")
+
+        import getpass
+        user = getpass.getuser()
+        ids = self._request_store().add(
+            {"user": user, "package": project_name(p), "reason": reason} for p in packages)
+        print(f"Requested {', '.join(packages)}. The request will be reviewed by one of "
+              f"the CincyPy maintainers.")
+        return ids
+
+    def Requests(self,
+                 status: str = None,
+                 package: str = None,
+                 user: str = None,
+                 after: int = 0,
+                 limit: int = None) -> List["PackageRequest"]:
+        """
+        Returns one page of package requests, oldest first, for triaging them.
+
+        Parameters
+        ----------
+        status : str, optional
+            Only requests with this status, eg 'unseen', by default all
+        package : str, optional
+            Only requests for this package, by default all
+        user : str, optional
+            Only requests by this user, by default all
+        after : int, optional
+            Only requests with a larger id; pass the id of the last request of a page
+            to get the next one, by default 0
+        limit : int, optional
+            The page size, by default request_store.PAGE_SIZE (100)
+
+        Returns
+        -------
+        list of PackageRequest
+            (id, user, date, package, reason, status) tuples
+
+        Example Usage
+        -------------
+        >>> page = env.Requests(status='unseen')
+        >>> while page:
+        ...     for request in page:
+        ...         print(request.package, request.user, request.reason)
+        ...     page = env.Requests(status='unseen', after=page[-1].id)
+        """
+        # imported here so that importing CincyConda stays cheap
+        from request_store import PAGE_SIZE
+
+        if package is not None:
+            package = project_name(package) or package
+        return self._request_store().query(status, package, user, after=after,
+                                           limit=PAGE_SIZE if limit is None else limit)
+
+    def _request_store(self) -> "RequestStore":
+        """
+        Returns the shared request store, at REQUESTS_DB_PATH or in the CincyPy channel
+        folder (see request_store.default_store_path), importing the channel's old
+        requests.csv the first time.
+        """
+        if self._requests is None:
+            # imported here so that importing CincyConda stays cheap
+            from request_store import open_store
+
+            channel = None
+            if self.channel_alias is not None:
+                channel = f"{self.channel_alias.rstrip('/')}/repo/{CINCYPY_CHANNEL}"
+            self._requests = open_store(channel, REQUESTS_DB_PATH)
+        return self._requests
\ No newline at end of file
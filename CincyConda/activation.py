@@ -0,0 +1,245 @@
+"""
+Environment activation without `conda activate`.
+
+`conda activate` is a shell function: run in a subshell it changes nothing for the
+notebook, and `conda run` pays conda's start-up cost on every call. What activation
+actually does is change some environment variables, so this module works out that
+change (the "delta") for an env once and applies it to `os.environ` or to the
+environment of a child process:
+
+- the env's bin folder goes first on PATH (and the previous env's comes off)
+- CONDA_PREFIX, CONDA_DEFAULT_ENV, CONDA_PROMPT_MODIFIER, ... are set
+- variables from `conda env config vars set` (conda-meta/state) are set
+- variables set by the env's `etc/conda/activate.d/*.sh` scripts are set; these are
+  found by sourcing the scripts once in a shell and comparing the environment before
+  and after
+
+The delta is cached on disk, keyed on the mtimes of the env's conda-meta and
+activate.d folders, so only the first activation after an install runs a shell.
+Variables the activate.d scripts compute from the current environment are recorded
+with the values they had then.
+"""
+
+import os
+import json
+import threading
+from typing import Dict, List, Mapping, Optional
+
+from cache import cache_dir, atomic_write
+
+# bump this if the layout of the cached deltas changes
+_DELTA_FORMAT = 1
+
+# the mode of a cached delta: the variables set by activate.d scripts and `conda env
+# config vars` can be secrets, so only the user may read them
+DELTA_FILE_MODE = 0o600
+
+# the delta applied to os.environ by `activate`, and the values it replaced
+_ACTIVE = {"delta": None, "saved": {}}
+_ACTIVE_LOCK = threading.Lock()
+
+
+def _bin_dirs(prefix: str) -> List[str]:
+    if os.name == "nt":
+        return [prefix, os.path.join(prefix, "Library", "bin"), os.path.join(prefix, "Scripts")]
+    return [os.path.join(prefix, "bin")]
+
+
+def _stamp(prefix: str) -> List[Optional[int]]:
+    stamps = []
+    for path in (os.path.join(prefix, "conda-meta"),
+                 os.path.join(prefix, "conda-meta", "state"),
+                 os.path.join(prefix, "etc", "conda", "activate.d")):
+        try:
+            stamps.append(os.stat(path).st_mtime_ns)
+        except OSError:
+            stamps.append(None)
+    return stamps
+
+
+def _activate_scripts(prefix: str) -> List[str]:
+    directory = os.path.join(prefix, "etc", "conda", "activate.d")
+    try:
+        return sorted(os.path.join(directory, name) for name in os.listdir(directory)
+                      if name.endswith(".sh"))
+    except OSError:
+        return []
+
+
+def _script_vars(scripts: List[str], environ: Dict[str, str], shell: str) -> Dict[str, str]:
+    """
+    Sources the activate.d `scripts` in `shell` with `environ` and returns the
+    variables they set or changed.
+    """
+    import tempfile
+    from runner import run
+
+    with tempfile.TemporaryDirectory() as tmp:
+        out = os.path.join(tmp, "env")
+        # anything the scripts print is ignored, the environment goes to a file
+        script = 'for f in "$@"; do . "$f"; done; env -0 > "$CINCYCONDA_ENV_OUT"'
+        result = run([shell, "-c", script, "activate", *scripts], stream=False,
+                     env=dict(environ, CINCYCONDA_ENV_OUT=out))
+        try:
+            with open(out, "rb") as f:
+                data = f.read().decode("utf-8", "replace")
+        except OSError:
+            print(f"Could not run the activation scripts of {os.path.dirname(scripts[0])} "
+                  f"(exit code {result.returncode}), skipping them.")
+            return {}
+
+    after = dict(item.split("=", 1) for item in data.split("\0") if "=" in item)
+    after.pop("CINCYCONDA_ENV_OUT", None)
+    for name in ("_", "SHLVL", "PWD", "OLDPWD"):
+        after.pop(name, None)
+    return {k: v for k, v in after.items() if environ.get(k) != v}
+
+
+def _read_own(path: str) -> Optional[Dict]:
+    """
+    Returns the JSON mapping in the cached delta at `path`, or None if there is none
+    or it is not safe to use: the cache may be shared, and a delta decides what runs
+    (PATH) in the user's processes, so only a file the user owns and nobody else can
+    write is read.
+    """
+    try:
+        fd = os.open(path, os.O_RDONLY | getattr(os, "O_NOFOLLOW", 0))
+    except OSError:
+        return None
+    with os.fdopen(fd) as f:
+        st = os.fstat(fd)
+        if st.st_uid != os.getuid() or st.st_mode & 0o022:
+            return None
+        try:
+            cached = json.load(f)
+        except ValueError:
+            return None
+    return cached if isinstance(cached, dict) else None
+
+
+def activation_delta(conda_root: str,
+                     prefix: str,
+                     name: str = None,
+                     shell: str = "bash") -> Dict:
+    """
+    Returns what activating the env at `prefix` changes, from the cache if the env has
+    not changed since it was last worked out.
+
+    Parameters
+    ----------
+    conda_root : str
+        The root of the conda installation (the base env)
+    prefix : str
+        The path of the env
+    name : str, optional
+        The env name, shown in the prompt; by default the prefix
+    shell : str, optional
+        The shell to source the activate.d scripts in, by default 'bash'
+
+    Returns
+    -------
+    dict
+        'prefix', 'path' (folders to put first on PATH, in order) and 'set'
+        (variables to set)
+    """
+    prefix = os.path.abspath(prefix)
+    name = name or prefix
+    stamp = _stamp(prefix)
+
+    import hashlib
+    key = hashlib.sha256(f"{os.getuid()}|{conda_root}|{prefix}|{name}|{shell}"
+                         .encode("utf-8")).hexdigest()
+    cache_file = os.path.join(cache_dir("activation"), key[:24] + ".json")
+    cached = _read_own(cache_file)
+    if cached is not None and cached.get("format") == _DELTA_FORMAT \
+            and cached.get("stamp") == stamp:
+        return cached["delta"]
+
+    conda_exe = os.path.join(conda_root, "bin", "conda")
+    variables = {"CONDA_PREFIX": prefix,
+                 "CONDA_DEFAULT_ENV": name,
+                 "CONDA_PROMPT_MODIFIER": f"({name}) ",
+                 "CONDA_SHLVL": "1",
+                 "CONDA_EXE": conda_exe,
+                 "CONDA_PYTHON_EXE": os.path.join(conda_root, "bin", "python")}
+    path = _bin_dirs(prefix)
+
+    try:
+        with open(os.path.join(prefix, "conda-meta", "state")) as f:
+            variables.update(json.load(f).get("env_vars", {}))
+    except (OSError, ValueError):
+        pass
+
+    scripts = _activate_scripts(prefix)
+    if scripts:
+        before = apply_delta({"prefix": prefix, "path": path, "set": variables},
+                             os.environ)
+        changed = _script_vars(scripts, before, shell)
+        if "PATH" in changed:
+            # keep the folders the scripts added in front of PATH, in their order
+            old = before.get("PATH", "").split(os.pathsep)
+            added = [p for p in changed.pop("PATH").split(os.pathsep) if p and p not in old]
+            path = added + path
+        variables.update(changed)
+
+    delta = {"prefix": prefix, "path": path, "set": variables}
+    try:
+        atomic_write(cache_file, json.dumps({"format": _DELTA_FORMAT, "stamp": stamp,
+                                             "delta": delta}).encode("utf-8"),
+                     mode=DELTA_FILE_MODE)
+    except OSError:
+        # eg another user's file in a shared cache that we may not replace; the
+        # delta is worked out again next time
+        pass
+    return delta
+
+
+def apply_delta(delta: Dict, environ: Mapping[str, str]) -> Dict[str, str]:
+    """
+    Returns a copy of `environ` with the env of `delta` activated. The bin folders of
+    the env that was active in `environ` (its CONDA_PREFIX) are taken off PATH first.
+    """
+    environ = dict(environ)
+    remove = set(delta["path"])
+    if environ.get("CONDA_PREFIX"):
+        remove.update(_bin_dirs(environ["CONDA_PREFIX"]))
+    path = [p for p in environ.get("PATH", "").split(os.pathsep) if p and p not in remove]
+    environ["PATH"] = os.pathsep.join(delta["path"] + path)
+    environ.update(delta["set"])
+    return environ
+
+
+def activate(delta: Dict) -> None:
+    """
+    Activates the env of `delta` in this process: changes os.environ, so commands the
+    notebook starts afterwards (eg `!python`) run in that env. The variables set by
+    the previous call are restored first, so activations do not pile up.
+    """
+    with _ACTIVE_LOCK:
+        previous = _ACTIVE["delta"]
+        if previous is not None:
+            os.environ["PATH"] = os.pathsep.join(
+                p for p in os.environ.get("PATH", "").split(os.pathsep)
+                if p not in previous["path"])
+        for name, value in _ACTIVE["saved"].items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+        saved = {name: os.environ.get(name) for name in delta["set"]}
+        new = apply_delta(delta, os.environ)
+        os.environ["PATH"] = new["PATH"]
+        for name in delta["set"]:
+            os.environ[name] = new[name]
+
+        _ACTIVE["delta"] = delta
+        _ACTIVE["saved"] = saved
+
+
+def active_prefix() -> Optional[str]:
+    """
+    Returns the prefix last activated with `activate`, or None.
+    """
+    delta = _ACTIVE["delta"]
+    return delta["prefix"] if delta else None
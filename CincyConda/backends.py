@@ -0,0 +1,167 @@
+"""
+Solver backends for the conda commands that need a solve (create, install, update).
+
+The classic conda solver is the slowest part of building an environment. Faster
+solvers can be used through the same command line when they are available:
+
+- 'micromamba': the standalone micromamba executable
+- 'mamba': the mamba executable installed next to conda
+- 'libmamba': conda itself with `--solver=libmamba` (needs conda-libmamba-solver)
+- 'classic': conda with its default solver, always available
+
+Availability is detected from the file system, without starting any of them, and the
+result is cached in memory and on disk, keyed on the conda installation's base
+environment (so installing a new solver into base is noticed).
+"""
+
+import os
+import json
+import glob
+import shutil
+from typing import NamedTuple, Tuple, List, Dict
+
+from cache import cache_dir, atomic_write
+from explicit import conda_root
+
+# backends in the order "auto" prefers them
+BACKEND_PREFERENCE = ["libmamba", "mamba", "micromamba", "classic"]
+
+# conda commands that run the solver and so go to the backend
+SOLVING_COMMANDS = {"create", "install", "update", "remove"}
+
+# conda's --solver option first appeared in 22.11
+_SOLVER_FLAG_VERSION = (22, 11)
+
+
+class Backend(NamedTuple):
+    """
+    How to run solving commands: `executable` plus `solver_args` after the subcommand.
+    """
+    name: str
+    executable: str
+    solver_args: Tuple[str, ...] = ()
+
+    def command(self, subcommand: str, *args: str) -> List[str]:
+        """
+        Returns the command line for `<tool> <subcommand> <args>` with this backend.
+        """
+        return [self.executable, subcommand, *self.solver_args, *args]
+
+
+def _version_tuple(version: str) -> Tuple[int, ...]:
+    parts = []
+    for part in version.split("."):
+        digits = "".join(ch for ch in part if ch.isdigit())
+        if not digits:
+            break
+        parts.append(int(digits))
+    return tuple(parts)
+
+
+def _base_package_version(root: str, name: str):
+    """
+    Returns the version of package `name` in the base env at `root`, or None if it is
+    not installed. Read from the conda-meta file name, eg conda-23.7.4-py310_0.json.
+    """
+    for path in glob.glob(os.path.join(root, "conda-meta", f"{name}-*.json")):
+        version = os.path.basename(path)[len(name) + 1:].rsplit("-", 1)[0]
+        if version and version[0].isdigit():
+            return version
+    return None
+
+
+def detect_backends(conda: str) -> Dict[str, Backend]:
+    """
+    Returns every backend available for the conda installation at `conda`, by name.
+    Nothing is started: availability is worked out from the files in the installation
+    and on the PATH. Results are cached, see the module docstring.
+
+    Parameters
+    ----------
+    conda : str
+        The path of the conda executable (or just 'conda')
+
+    Returns
+    -------
+    dict
+        name -> Backend, always including 'classic'
+    """
+    root = conda_root(conda)
+    try:
+        stamp = os.stat(os.path.join(root, "conda-meta")).st_mtime_ns
+    except OSError:
+        stamp = None
+    key = f"{conda}|{root}|{stamp}|{os.environ.get('PATH', '')}"
+
+    if _DETECTED.get(conda, (None,))[0] == key:
+        return _DETECTED[conda][1]
+
+    import hashlib
+    cache_file = os.path.join(cache_dir("backends"),
+                              hashlib.sha256(key.encode("utf-8")).hexdigest()[:16] + ".json")
+    try:
+        with open(cache_file) as f:
+            backends = {name: Backend(name, exe, tuple(args))
+                        for name, (exe, args) in json.load(f).items()}
+    except (OSError, ValueError):
+        backends = _probe(conda, root)
+        atomic_write(cache_file, json.dumps({b.name: [b.executable, list(b.solver_args)]
+                                             for b in backends.values()}).encode("utf-8"))
+
+    _DETECTED[conda] = (key, backends)
+    return backends
+
+
+# conda -> (key, backends), see detect_backends
+_DETECTED = {}
+
+
+def _probe(conda: str, root: str) -> Dict[str, Backend]:
+    backends = {}
+
+    conda_version = _base_package_version(root, "conda")
+    solver_flag = conda_version is not None and \
+        _version_tuple(conda_version)[:2] >= _SOLVER_FLAG_VERSION
+    if solver_flag and _base_package_version(root, "conda-libmamba-solver"):
+        backends["libmamba"] = Backend("libmamba", conda, ("--solver=libmamba",))
+
+    mamba = os.path.join(root, "bin", "mamba")
+    if os.access(mamba, os.X_OK):
+        backends["mamba"] = Backend("mamba", mamba)
+
+    micromamba = os.environ.get("MAMBA_EXE") or shutil.which("micromamba")
+    if micromamba and os.access(micromamba, os.X_OK):
+        backends["micromamba"] = Backend("micromamba", micromamba)
+
+    backends["classic"] = Backend("classic", conda,
+                                  ("--solver=classic",) if solver_flag else ())
+    return backends
+
+
+def select_backend(conda: str, preference: str = "auto") -> Backend:
+    """
+    Returns the backend to use.
+
+    Parameters
+    ----------
+    conda : str
+        The path of the conda executable
+    preference : str, optional
+        'auto' for the fastest available backend, or the name of a backend, by default
+        'auto'. If the named backend is not available, classic conda is used instead.
+
+    Returns
+    -------
+    Backend
+    """
+    backends = detect_backends(conda)
+    if preference == "auto":
+        return next(backends[name] for name in BACKEND_PREFERENCE if name in backends)
+
+    assert preference in BACKEND_PREFERENCE, \
+        f"backend: '{preference}' is not supported. Please use 'auto' or one of the \
+following: {BACKEND_PREFERENCE}"
+    if preference not in backends:
+        print(f"The '{preference}' backend is not available, falling back to classic conda.")
+        return backends["classic"]
+    return backends[preference]
@@ -0,0 +1,73 @@
+"""
+Small helpers shared by the CincyConda on-disk caches.
+
+All caches live under one directory, `~/.cache/cincyconda` by default. Set the
+CINCYCONDA_CACHE_DIR environment variable to point every user at a shared location
+(eg a group-writable directory on the server).
+
+Cache files are JSON, never pickles: anyone who can write to a shared cache could
+otherwise plant a file that runs code in every notebook that loads it.
+"""
+
+import os
+import tempfile
+
+
+def cache_dir(*parts: str) -> str:
+    """
+    Returns (and creates, if needed) a directory inside the CincyConda cache.
+
+    Parameters
+    ----------
+    *parts : str
+        Path components below the cache root, eg cache_dir('channels')
+
+    Returns
+    -------
+    str
+        The absolute path of the directory
+    """
+    root = os.environ.get("CINCYCONDA_CACHE_DIR",
+                          os.path.join(os.path.expanduser("~"), ".cache", "cincyconda"))
+    path = os.path.join(root, *parts)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+# the mode of a new file written by atomic_write: readable by the other users of a
+# shared cache, but only writable by its owner
+DEFAULT_FILE_MODE = 0o644
+
+
+def atomic_write(path: str, data: bytes, mode: int = None) -> None:
+    """
+    Writes `data` to `path` so that readers only ever see the old file or the complete
+    new file, never a partial write. The data is written to a temporary file in the
+    same directory and then renamed over `path`.
+
+    Parameters
+    ----------
+    path : str
+        The file to write
+    data : bytes
+        Its new contents
+    mode : int, optional
+        The permissions of the file, by default those of the file being replaced, or
+        DEFAULT_FILE_MODE for a new file
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    if mode is None:
+        try:
+            mode = os.stat(path).st_mode & 0o7777
+        except OSError:
+            mode = DEFAULT_FILE_MODE
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.chmod(tmp, mode)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
@@ -0,0 +1,295 @@
+"""
+A persistent index of the packages available in a conda channel.
+
+The index keeps the name, version and build of every package in the channel's
+`repodata.json` files, stored as JSON in the CincyConda cache so it loads in a few
+milliseconds (never as a pickle: the cache may be shared, see cache.py). It is
+revalidated against the channel cheaply:
+
+- within `max_age` seconds of the last check, no network call is made at all
+- after that, a conditional request (ETag / Last-Modified) is sent, and the
+  repodata is only downloaded and parsed again if the channel has changed
+- for local (file://) channels, the mtime of each repodata.json is used instead
+"""
+
+import os
+import sys
+import json
+import time
+from typing import Dict, List, Iterable, Tuple
+
+from cache import cache_dir, atomic_write
+
+# seconds during which a checked index is trusted without contacting the channel
+INDEX_MAX_AGE = 300
+
+# seconds to wait for the channel to respond
+INDEX_TIMEOUT = 30
+
+# bump this if the layout of the stored index changes
+_INDEX_FORMAT = 2
+
+# channel url -> ChannelIndex, so repeated calls in one process share the index
+_INDEXES = {}
+
+
+def platform_subdir() -> str:
+    """
+    Returns the conda subdir for the current machine, eg 'linux-64' or 'osx-arm64'.
+    """
+    import platform
+    machine = platform.machine().lower()
+    if sys.platform.startswith("linux"):
+        os_name = "linux"
+    elif sys.platform == "darwin":
+        os_name = "osx"
+    else:
+        os_name = "win"
+    if machine in ("x86_64", "amd64"):
+        arch = "64"
+    elif machine in ("arm64", "aarch64"):
+        arch = "aarch64" if os_name == "linux" else "arm64"
+    else:
+        arch = machine
+    return f"{os_name}-{arch}"
+
+
+def spec_name(spec: str) -> str:
+    """
+    Returns the package name from a package spec, eg 'numpy' from 'numpy>=1.20' or
+    'conda-forge::numpy=1.24'.
+    """
+    spec = spec.split("::")[-1].strip()
+    for i, ch in enumerate(spec):
+        if ch in " =<>!~[":
+            return spec[:i].lower()
+    return spec.lower()
+
+
+class ChannelIndex:
+    """
+    The set of packages in one conda channel, persisted on disk.
+
+    Parameters
+    ----------
+    channel_url : str
+        The URL of the channel, eg 'https://conda.example.com/repo/restricted_channel'
+        or 'file:///srv/mirror'
+    subdirs : list, optional
+        The subdirs to index, by default ['noarch', <this platform>]
+    max_age : int, optional
+        Seconds to trust the index without revalidating it, by default INDEX_MAX_AGE
+
+    Example Usage
+    -------------
+    >>> index = ChannelIndex('https://conda.example.com/repo/restricted_channel')
+    >>> 'numpy' in index
+    True
+    >>> index.missing(['numpy', 'pandas>=2', 'not-a-package'])
+    ['not-a-package']
+    """
+    def __init__(self,
+                 channel_url: str,
+                 subdirs: List[str] = None,
+                 max_age: int = INDEX_MAX_AGE):
+        self.channel_url = channel_url.rstrip("/")
+        self.subdirs = subdirs or ["noarch", platform_subdir()]
+        self.max_age = max_age
+
+        import hashlib
+        key = hashlib.sha256(self.channel_url.encode("utf-8")).hexdigest()[:16]
+        self.path = os.path.join(cache_dir("channels"), f"{key}.json")
+
+        # name -> {version: [build, ...]}
+        self.packages = {}
+
+        # subdir -> (etag, last-modified) as returned by the channel
+        self.validators = {}
+
+        # subdir -> [(name, version, build), ...], so one subdir can be replaced
+        self._records = {}
+
+        self.checked = 0.0
+        self._session = None
+        self._fingerprint = None
+
+    def __contains__(self, spec: str) -> bool:
+        return spec_name(spec) in self.refresh().packages
+
+    def __len__(self) -> int:
+        return len(self.refresh().packages)
+
+    def __repr__(self):
+        return f"ChannelIndex({self.channel_url!r}, {len(self.packages)} packages)"
+
+    def missing(self, specs: Iterable[str]) -> List[str]:
+        """
+        Returns the specs in `specs` whose package is not in the channel. Revalidates
+        the index at most once for the whole list.
+        """
+        packages = self.refresh().packages
+        return [spec for spec in specs if spec_name(spec) not in packages]
+
+    def versions(self, name: str) -> Dict[str, List[str]]:
+        """
+        Returns {version: [build, ...]} for the package `name`, or an empty dict if the
+        package is not in the channel.
+        """
+        return self.refresh().packages.get(spec_name(name), {})
+
+    def fingerprint(self) -> str:
+        """
+        Returns a short string that changes whenever the channel's repodata changes, for
+        use in cache keys (see solve_cache.SolveCache). It is built from the ETag /
+        Last-Modified validators, or from the package list itself for subdirs whose
+        server sent neither.
+        """
+        self.refresh()
+        if self._fingerprint is None:
+            import hashlib
+            h = hashlib.sha256(self.channel_url.encode("utf-8"))
+            for subdir in sorted(self._records):
+                etag, modified = self.validators.get(subdir, (None, None))
+                h.update(f"|{subdir}|{etag}|{modified}|".encode("utf-8"))
+                if etag is None and modified is None:
+                    h.update(repr(sorted(self._records[subdir])).encode("utf-8"))
+            self._fingerprint = h.hexdigest()[:16]
+        return self._fingerprint
+
+    def refresh(self, force: bool = False) -> "ChannelIndex":
+        """
+        Makes sure the index is up to date, loading it from disk and revalidating it
+        against the channel as needed.
+
+        Parameters
+        ----------
+        force : bool, optional
+            Revalidate against the channel even if the index was checked less than
+            `max_age` seconds ago, by default False
+
+        Returns
+        -------
+        ChannelIndex
+            self, so calls can be chained
+        """
+        if not force and time.time() - self.checked < self.max_age:
+            return self
+
+        if not self.checked:
+            self._load()
+            if not force and time.time() - self.checked < self.max_age:
+                return self
+
+        for subdir in self.subdirs:
+            self._revalidate(subdir)
+
+        self.checked = time.time()
+        self._save()
+        return self
+
+    def _load(self) -> None:
+        try:
+            with open(self.path, "rb") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if not isinstance(data, dict) or data.get("format") != _INDEX_FORMAT or \
+                data.get("subdirs") != self.subdirs:
+            return
+        try:
+            self.packages = data["packages"]
+            self.validators = {subdir: tuple(v) for subdir, v in data["validators"].items()}
+            self._records = {subdir: [tuple(r) for r in records]
+                             for subdir, records in data["records"].items()}
+            self.checked = float(data["checked"])
+        except (KeyError, TypeError, ValueError, AttributeError):
+            self.packages, self.validators, self._records, self.checked = {}, {}, {}, 0.0
+            return
+        self._fingerprint = None
+
+    def _save(self) -> None:
+        data = {"format": _INDEX_FORMAT,
+                "subdirs": self.subdirs,
+                "packages": self.packages,
+                "validators": self.validators,
+                "records": self._records,
+                "checked": self.checked}
+        atomic_write(self.path, json.dumps(data).encode("utf-8"))
+
+    def _revalidate(self, subdir: str) -> bool:
+        """
+        Checks whether the repodata for `subdir` changed since it was indexed, and
+        re-indexes it if so. Returns True if the index changed.
+        """
+        url = f"{self.channel_url}/{subdir}/repodata.json"
+        etag, modified = self.validators.get(subdir, (None, None))
+
+        if url.startswith("file://"):
+            path = url[len("file://"):]
+            try:
+                mtime = str(os.stat(path).st_mtime_ns)
+            except FileNotFoundError:
+                return self._replace(subdir, [], (None, None))
+            if mtime == etag and subdir in self._records:
+                return False
+            with open(path, "rb") as f:
+                repodata = json.load(f)
+            return self._replace(subdir, _parse_repodata(repodata), (mtime, None))
+
+        headers = {}
+        if subdir in self._records:
+            if etag:
+                headers["If-None-Match"] = etag
+            if modified:
+                headers["If-Modified-Since"] = modified
+
+        if self._session is None:
+            # imported here so that importing CincyConda stays cheap
+            import requests
+            self._session = requests.Session()
+        response = self._session.get(url, headers=headers, timeout=INDEX_TIMEOUT)
+        if response.status_code == 304:
+            return False
+        if response.status_code == 404:
+            # not every channel has every subdir
+            return self._replace(subdir, [], (None, None))
+        response.raise_for_status()
+        return self._replace(subdir,
+                             _parse_repodata(response.json()),
+                             (response.headers.get("ETag"),
+                              response.headers.get("Last-Modified")))
+
+    def _replace(self,
+                 subdir: str,
+                 records: List[Tuple[str, str, str]],
+                 validators: Tuple[str, str]) -> bool:
+        self._records[subdir] = records
+        self.validators[subdir] = validators
+        self._fingerprint = None
+
+        packages = {}
+        for subdir_records in self._records.values():
+            for name, version, build in subdir_records:
+                packages.setdefault(name, {}).setdefault(version, []).append(build)
+        self.packages = packages
+        return True
+
+
+def _parse_repodata(repodata: dict) -> List[Tuple[str, str, str]]:
+    """
+    Pulls (name, version, build) out of every record in a repodata.json document.
+    """
+    records = []
+    for key in ("packages", "packages.conda"):
+        for record in repodata.get(key, {}).values():
+            records.append((record["name"], record["version"], record["build"]))
+    return records
+
+
+def get_channel_index(channel_url: str, **kwargs) -> ChannelIndex:
+    """
+    Returns the shared ChannelIndex for `channel_url`, creating it the first time.
+    """
+    if channel_url not in _INDEXES:
+        _INDEXES[channel_url] = ChannelIndex(channel_url, **kwargs)
+    return _INDEXES[channel_url]
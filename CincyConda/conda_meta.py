@@ -0,0 +1,75 @@
+"""
+Readers for the package records conda keeps in `<prefix>/conda-meta/*.json`.
+
+Every package linked into an environment has one JSON record there with its name,
+version, build, channel, url, md5/sha256 and the list of files it installed. Reading
+them directly is much faster than starting conda to run `conda list`.
+"""
+
+import os
+import json
+from typing import List, Dict, Any
+
+
+def meta_dir(prefix: str) -> str:
+    return os.path.join(prefix, "conda-meta")
+
+
+def read_records(prefix: str) -> List[Dict[str, Any]]:
+    """
+    Returns the package records of the environment at `prefix`, in dependency order
+    (every package comes after the packages it depends on), like
+    `conda list --explicit` does.
+
+    Parameters
+    ----------
+    prefix : str
+        The path of the environment
+
+    Returns
+    -------
+    list
+        One dict per installed package, as stored by conda
+
+    Raises
+    ------
+    AssertionError
+        If there is no conda environment at `prefix`
+    """
+    directory = meta_dir(prefix)
+    assert os.path.isdir(directory), \
+        f"There is no conda environment at {prefix} (no conda-meta folder found)."
+
+    records = []
+    for entry in sorted(os.scandir(directory), key=lambda e: e.name):
+        if entry.name.endswith(".json") and entry.is_file():
+            with open(entry.path) as f:
+                records.append(json.load(f))
+    return toposort(records)
+
+
+def toposort(records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Orders package records so that each package comes after its dependencies. Ties
+    (and dependency cycles) are broken alphabetically so the order is stable.
+    """
+    by_name = {r["name"]: r for r in records}
+    depends = {name: sorted({d.split()[0] for d in r.get("depends", ())} & set(by_name)
+                            - {name})
+               for name, r in by_name.items()}
+
+    ordered, done, visiting = [], set(), set()
+
+    def visit(name):
+        if name in done or name in visiting:
+            return
+        visiting.add(name)
+        for dep in depends[name]:
+            visit(dep)
+        visiting.discard(name)
+        done.add(name)
+        ordered.append(by_name[name])
+
+    for name in sorted(by_name):
+        visit(name)
+    return ordered
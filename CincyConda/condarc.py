@@ -0,0 +1,202 @@
+"""
+The conda and anaconda-client configuration files that CincyConda.Setup manages.
+
+`conda config --set ...` starts conda to change one key of a YAML file. Setup instead
+works out the whole target configuration, compares it with what is already there,
+and writes each file at most once, atomically, so running Setup again changes
+nothing and starts no processes.
+"""
+
+import os
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from cache import atomic_write
+
+# the mode of a configuration file update_yaml creates: .condarc and the anaconda-client
+# config can hold tokens, so only their owner may read them
+NEW_CONFIG_MODE = 0o600
+
+# the markers `conda init` puts around its block in the shell's startup file
+CONDA_INIT_MARKER = ">>> conda initialize >>>"
+POWERSHELL_INIT_MARKER = "#region conda initialize"
+
+# shell -> (startup file under ~ that `conda init <shell>` edits, marker of its block);
+# for powershell the file is pwsh's $PROFILE.CurrentUserAllHosts on Linux and macOS
+_SHELL_RC = {"bash": (".bashrc", CONDA_INIT_MARKER),
+             "zsh": (".zshrc", CONDA_INIT_MARKER),
+             "fish": (os.path.join(".config", "fish", "config.fish"), CONDA_INIT_MARKER),
+             "xonsh": (".xonshrc", CONDA_INIT_MARKER),
+             "powershell": (os.path.join(".config", "powershell", "profile.ps1"),
+                            POWERSHELL_INIT_MARKER)}
+
+
+def condarc_path() -> str:
+    """
+    Returns the user's .condarc, the file `conda config` writes to ($CONDARC if set).
+    """
+    return os.environ.get("CONDARC") or os.path.join(os.path.expanduser("~"), ".condarc")
+
+
+def repo_config_path() -> str:
+    """
+    Returns the anaconda-client user config, where `conda repo config` keeps the repo
+    sites ($ANACONDA_CLIENT_CONFIG if set).
+    """
+    return os.environ.get("ANACONDA_CLIENT_CONFIG") or \
+        os.path.join(os.path.expanduser("~"), ".continuum", "anaconda-client", "config.yaml")
+
+
+def shell_initialized(shell: str) -> bool:
+    """
+    Returns True if `conda init <shell>` has already been run for this user.
+
+    Raises
+    ------
+    AssertionError
+        If `shell` is not one `conda init` supports here
+    """
+    assert shell in _SHELL_RC, \
+        f"shell: '{shell}' is not supported. Please use one of the following: \
+{list(_SHELL_RC)}"
+    rc, marker = _SHELL_RC[shell]
+    try:
+        with open(os.path.join(os.path.expanduser("~"), rc)) as f:
+            return marker in f.read()
+    except OSError:
+        return False
+
+
+def _yaml() -> Tuple[Callable[[str], Any], Callable[[Any], str]]:
+    """
+    Returns YAML (load, dump) functions from PyYAML, or from ruamel.yaml (which conda
+    itself uses) when PyYAML is not installed.
+    """
+    # imported here so that importing CincyConda stays cheap
+    try:
+        import yaml
+        return (yaml.safe_load,
+                lambda data: yaml.safe_dump(data, default_flow_style=False, sort_keys=False))
+    except ImportError:
+        pass
+    try:
+        import io
+        from ruamel.yaml import YAML
+    except ImportError:
+        raise AssertionError("Reading the conda configuration needs PyYAML or ruamel.yaml. \
+Please install one of them, eg `conda install pyyaml`.")
+
+    yaml = YAML(typ="safe", pure=True)
+    yaml.default_flow_style = False
+
+    def dump(data):
+        out = io.StringIO()
+        yaml.dump(data, out)
+        return out.getvalue()
+    return yaml.load, dump
+
+
+def _round_trip_yaml() -> Optional[Any]:
+    """
+    Returns ruamel.yaml's round-trip YAML, which keeps comments and formatting, or None
+    if ruamel.yaml is not installed.
+    """
+    # imported here so that importing CincyConda stays cheap
+    try:
+        from ruamel.yaml import YAML
+    except ImportError:
+        return None
+    yaml = YAML()
+    yaml.preserve_quotes = True
+    return yaml
+
+
+def read_yaml(path: str) -> Dict[str, Any]:
+    """
+    Returns the mapping in the YAML file at `path`, or {} if there is none.
+    """
+    load, _ = _yaml()
+    try:
+        with open(path) as f:
+            return load(f.read()) or {}
+    except FileNotFoundError:
+        return {}
+
+
+def update_yaml(path: str, update: Callable[[Dict[str, Any]], Dict[str, Any]]) -> bool:
+    """
+    Applies `update` to the YAML mapping in `path` and writes the result atomically,
+    but only if it changed.
+
+    With ruamel.yaml (which conda itself uses) the file is edited in place, keeping
+    the user's comments and formatting. With only PyYAML it is rewritten from the
+    mapping, which drops its comments.
+
+    Parameters
+    ----------
+    path : str
+        The YAML file; created (with its folder) if it does not exist. An existing
+        file keeps its permissions, a new one is created with NEW_CONFIG_MODE.
+    update : callable
+        Called with the current mapping, returns the new one
+
+    Returns
+    -------
+    bool
+        True if the file was written
+    """
+    current = read_yaml(path)
+    round_trip = _round_trip_yaml()
+    if round_trip is not None:
+        import io
+        try:
+            with open(path) as f:
+                config = round_trip.load(f.read())
+        except FileNotFoundError:
+            config = None
+        target = update(config if config is not None else {})
+        if target == current:
+            return False
+        out = io.StringIO()
+        round_trip.dump(target, out)
+        data = out.getvalue()
+    else:
+        _, dump = _yaml()
+        target = update(dict(current))
+        if target == current:
+            return False
+        data = dump(target)
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    mode = None if os.path.exists(path) else NEW_CONFIG_MODE
+    atomic_write(path, data.encode("utf-8"), mode=mode)
+    return True
+
+
+def cincypy_condarc(channel_alias: str, channel: str) -> Callable[[dict], dict]:
+    """
+    Returns the update for .condarc: use the repo at `channel_alias` for channel names
+    and put `channel` first in the channel list, followed by the default channels.
+    Other settings and channels are kept.
+    """
+    def update(config: dict) -> dict:
+        config["channel_alias"] = f"{channel_alias.rstrip('/')}/repo"
+        channels = [c for c in config.get("channels") or [] if c != channel]
+        if "defaults" not in channels:
+            channels.append("defaults")
+        config["channels"] = [channel] + channels
+        return config
+    return update
+
+
+def cincypy_repo_config(channel_alias: str, site: str = "anaconda") -> Callable[[dict], dict]:
+    """
+    Returns the update for the anaconda-client config: a repo site called `site` at
+    `channel_alias`, used by default.
+    """
+    def update(config: dict) -> dict:
+        sites = dict(config.get("sites") or {})
+        sites[site] = dict(sites.get(site) or {}, url=channel_alias)
+        config["sites"] = sites
+        config["default_site"] = site
+        return config
+    return update
@@ -0,0 +1,144 @@
+"""
+Streaming package downloads with checksum verification.
+
+Packages are streamed to a temporary file next to their destination while their md5
+and sha256 are computed, and only renamed into place once the checksums match, so a
+corrupted or partial download never ends up in a package cache. file:// URLs are read
+the same way, which makes local channels work exactly like remote ones.
+"""
+
+import os
+import hashlib
+from typing import Dict, Any, Optional
+
+# bytes read per chunk while streaming
+CHUNK_SIZE = 1024 * 1024
+
+# seconds to wait for the server to respond
+DOWNLOAD_TIMEOUT = 60
+
+
+class ChecksumError(Exception):
+    """
+    Raised when a downloaded file does not match the checksum it was expected to have.
+    """
+
+
+def _open_stream(url: str, session=None):
+    """
+    Returns an iterator over the bytes at `url`, in chunks of CHUNK_SIZE.
+    """
+    if url.startswith("file://"):
+        def _chunks():
+            with open(url[len("file://"):], "rb") as f:
+                for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+                    yield chunk
+        return _chunks()
+
+    if session is None:
+        import requests
+        session = requests
+    response = session.get(url, stream=True, timeout=DOWNLOAD_TIMEOUT)
+    response.raise_for_status()
+    return response.iter_content(CHUNK_SIZE)
+
+
+def file_matches(path: str, md5: str = None, sha256: str = None) -> bool:
+    """
+    Returns True if the file at `path` exists and matches the given checksums. Prefers
+    sha256 when both are given.
+    """
+    if not os.path.isfile(path):
+        return False
+    algorithm, expected = ("sha256", sha256) if sha256 else ("md5", md5)
+    if expected is None:
+        return True
+    digest = hashlib.new(algorithm)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest() == expected
+
+
+def fetch(url: str,
+          dest: str,
+          md5: str = None,
+          sha256: str = None,
+          session=None) -> str:
+    """
+    Downloads `url` to `dest`, verifying the checksums while streaming.
+
+    Parameters
+    ----------
+    url : str
+        The URL to download (http(s):// or file://)
+    dest : str
+        The path to write to
+    md5 : str, optional
+        The expected md5 of the file, by default None
+    sha256 : str, optional
+        The expected sha256 of the file, by default None
+    session : requests.Session, optional
+        The session to download with, so connections can be reused, by default None
+
+    Returns
+    -------
+    str
+        `dest`
+
+    Raises
+    ------
+    ChecksumError
+        If the downloaded file does not match `md5` or `sha256`
+    """
+    hashes = {"md5": hashlib.md5(), "sha256": hashlib.sha256()}
+    tmp = f"{dest}.partial-{os.getpid()}"
+    try:
+        with open(tmp, "wb") as f:
+            for chunk in _open_stream(url, session):
+                f.write(chunk)
+                for h in hashes.values():
+                    h.update(chunk)
+        for algorithm, expected in (("md5", md5), ("sha256", sha256)):
+            actual = hashes[algorithm].hexdigest()
+            if expected and actual != expected:
+                raise ChecksumError(f"{url}: expected {algorithm} {expected}, got {actual}")
+        os.replace(tmp, dest)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return dest
+
+
+def fetch_to_cache(record: Dict[str, Any],
+                   cache: str,
+                   session=None) -> Optional[str]:
+    """
+    Makes sure the package in `record` is in the package cache directory `cache`,
+    downloading it if it is missing or does not match its checksums. The URL is added
+    to the cache's urls.txt, like conda does, so conda can match it to its channel.
+
+    Parameters
+    ----------
+    record : dict
+        A package record with 'url' and optionally 'md5' / 'sha256'
+    cache : str
+        The package cache directory
+    session : requests.Session, optional
+        The session to download with, by default None
+
+    Returns
+    -------
+    str or None
+        The path of the downloaded file, or None if it was already in the cache
+    """
+    fn = record["url"].rsplit("/", 1)[-1]
+    dest = os.path.join(cache, fn)
+    if file_matches(dest, record.get("md5"), record.get("sha256")):
+        return None
+
+    os.makedirs(cache, exist_ok=True)
+    fetch(record["url"], dest, record.get("md5"), record.get("sha256"), session)
+    with open(os.path.join(cache, "urls.txt"), "a") as f:
+        f.write(record["url"] + "\n")
+    return dest
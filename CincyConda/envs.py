@@ -0,0 +1,331 @@
+"""
+Conda environment discovery without starting conda.
+
+`conda env list` builds its list from three places, which this module reads directly:
+
+- the base environment, ie the root of the conda installation
+- every directory in the `envs_dirs` locations that contains a `conda-meta` folder
+- the prefixes registered in `~/.conda/environments.txt`, which is where prefix
+  environments like the `./.env/` ones made by CincyConda.Create end up
+
+The result is cached per conda installation and keyed on the mtimes of those sources,
+so it is only rebuilt when an environment is actually added or removed. Checking the
+key costs a few stat calls however many environments there are. Prefix environments
+deleted by hand (`rm -rf ./.env`, which conda never hears about) are only noticed by
+checking each of them, which is done at most once every DISCOVERY_TTL seconds.
+"""
+
+import os
+import time
+import bisect
+from typing import List, Mapping, NamedTuple, Tuple
+
+from explicit import conda_root
+
+
+class CondaEnv(NamedTuple):
+    """
+    A conda environment. `name` is 'base' for the root environment, the folder name for
+    environments in one of the envs_dirs, and '' for environments created with
+    `--prefix` somewhere else (which is how `conda env list` shows them too).
+    """
+    name: str
+    path: str
+
+
+# seconds a cached list of environments is trusted without checking that every
+# prefix environment outside the envs_dirs still exists
+DISCOVERY_TTL = 30
+
+# conda root -> (snapshot key, envs, prefixes checked individually, their key,
+#                time they were checked)
+_CACHE = {}
+
+
+def environments_txt() -> str:
+    """
+    Returns the path of the file where conda registers every environment it creates.
+    """
+    return os.path.join(os.path.expanduser("~"), ".conda", "environments.txt")
+
+
+def register_env(prefix: str) -> None:
+    """
+    Adds `prefix` to environments.txt, as conda does for the envs it creates, so
+    `conda env list` (and `discover_envs`) find it.
+    """
+    prefix = os.path.abspath(prefix)
+    path = environments_txt()
+    try:
+        with open(path) as f:
+            if prefix in (line.strip() for line in f):
+                return
+    except OSError:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "a") as f:
+        f.write(prefix + "\n")
+
+
+def envs_dirs(root: str, environ: Mapping[str, str] = None, cwd: str = None) -> List[str]:
+    """
+    Returns the directories that conda creates named environments in.
+
+    Respects the CONDA_ENVS_DIRS (or older CONDA_ENVS_PATH) environment variable,
+    otherwise uses conda's defaults: `<root>/envs` and `~/.conda/envs`. The variables
+    (and HOME) are read from `environ` and relative folders taken from `cwd` when
+    they are given, instead of from this process.
+    """
+    if environ is None:
+        environ = os.environ
+    home = environ.get("HOME") or os.path.expanduser("~")
+
+    def _path(d):
+        if d == "~" or d.startswith("~" + os.sep):
+            d = home + d[1:]
+        return os.path.normpath(os.path.join(cwd or os.getcwd(), os.path.expanduser(d)))
+
+    dirs = []
+    for var in ("CONDA_ENVS_DIRS", "CONDA_ENVS_PATH"):
+        for d in environ.get(var, "").replace(",", os.pathsep).split(os.pathsep):
+            if d.strip():
+                dirs.append(_path(d.strip()))
+    dirs.append(os.path.join(root, "envs"))
+    dirs.append(os.path.join(home, ".conda", "envs"))
+
+    # keep the first occurrence of each directory
+    return list(dict.fromkeys(dirs))
+
+
+def _is_env(path: str) -> bool:
+    return os.path.isdir(os.path.join(path, "conda-meta"))
+
+
+def _mtime(path: str):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def _snapshot_key(root: str) -> Tuple:
+    """
+    The mtimes of every source that discover_envs reads. Creating or removing an
+    environment with conda changes the mtime of environments.txt or of an envs_dir.
+    """
+    sources = [root, environments_txt()] + envs_dirs(root)
+    return tuple((source, _mtime(source)) for source in sources)
+
+
+def _prefixes_key(prefixes: Tuple[str, ...]) -> Tuple:
+    """
+    The mtimes of the `conda-meta` folders of the prefix environments found last time;
+    deleting one (even with `rm -rf`) removes its `conda-meta` folder.
+    """
+    return tuple(_mtime(os.path.join(prefix, "conda-meta")) for prefix in prefixes)
+
+
+def _scan(root: str) -> Tuple[CondaEnv, ...]:
+    envs = {}
+    dirs = envs_dirs(root)
+
+    if _is_env(root):
+        envs[root] = CondaEnv("base", root)
+
+    for d in dirs:
+        try:
+            entries = sorted(os.scandir(d), key=lambda e: e.name)
+        except OSError:
+            continue
+        for entry in entries:
+            if entry.is_dir() and _is_env(entry.path):
+                envs.setdefault(os.path.abspath(entry.path),
+                                CondaEnv(entry.name, os.path.abspath(entry.path)))
+
+    try:
+        with open(environments_txt()) as f:
+            registered = [line.strip() for line in f if line.strip()]
+    except OSError:
+        registered = []
+    for prefix in registered:
+        prefix = os.path.abspath(prefix)
+        if prefix in envs or not _is_env(prefix):
+            continue
+        name = os.path.basename(prefix) if os.path.dirname(prefix) in dirs else ""
+        envs[prefix] = CondaEnv(name, prefix)
+
+    return tuple(envs.values())
+
+
+def discover_envs(conda: str, refresh: bool = False) -> Tuple[CondaEnv, ...]:
+    """
+    Returns every conda environment known to the conda installation at `conda`,
+    in the same order as `conda env list`: base first, then the named environments,
+    then prefix environments.
+
+    Parameters
+    ----------
+    conda : str
+        The path of the conda executable (or just 'conda' to use the one on the PATH)
+    refresh : bool, optional
+        Ignore the cache and scan again, by default False
+
+    Returns
+    -------
+    tuple
+        A tuple of CondaEnv(name, path) records
+    """
+    root = conda_root(conda)
+    cached = _CACHE.get(root)
+    if not refresh and cached is not None:
+        key, envs, prefixes, prefixes_key, checked = cached
+        if key == _snapshot_key(root):
+            now = time.monotonic()
+            if now - checked < DISCOVERY_TTL:
+                return envs
+            if prefixes_key == _prefixes_key(prefixes):
+                _CACHE[root] = (key, envs, prefixes, prefixes_key, now)
+                return envs
+
+    envs = _scan(root)
+    _remember(root, envs)
+    return envs
+
+
+def _remember(root: str, envs: Tuple[CondaEnv, ...]) -> None:
+    # envs inside an envs_dir are covered by that directory's mtime, so only the
+    # other prefixes need their conda-meta folder checked
+    dirs = set(envs_dirs(root))
+    prefixes = tuple(env.path for env in envs if os.path.dirname(env.path) not in dirs)
+    _CACHE[root] = (_snapshot_key(root), envs, prefixes, _prefixes_key(prefixes),
+                    time.monotonic())
+
+
+def is_cached(conda: str) -> bool:
+    """
+    Returns whether discover_envs has a cached result for the conda installation at
+    `conda` (which may still turn out to be stale).
+    """
+    return conda_root(conda) in _CACHE
+
+
+def seed_envs(conda: str, envs) -> Tuple[CondaEnv, ...]:
+    """
+    Caches `envs`, discovered elsewhere (eg by the CincyConda worker), as the result
+    of discover_envs for the conda installation at `conda`. Later calls only check
+    that it is still current, as if this process had scanned itself.
+    """
+    envs = tuple(CondaEnv(*env) for env in envs)
+    _remember(conda_root(conda), envs)
+    return envs
+
+
+class EnvIndex:
+    """
+    A lookup index over one snapshot of discovered environments.
+
+    Exact lookups by name or path are dict lookups. Prefix lookups use a sorted list of
+    keys and bisection, and substring lookups use a trigram index, so a search over
+    thousands of environments only ever looks at the candidates that can match.
+    Fuzzy matching is case-insensitive.
+
+    Parameters
+    ----------
+    envs : iterable
+        The CondaEnv records to index, eg the result of discover_envs
+    """
+    def __init__(self, envs):
+        self.envs = tuple(envs)
+
+        # name -> [env, ...] and normalized path -> env
+        self.by_name = {}
+        self.by_path = {}
+        for env in self.envs:
+            self.by_name.setdefault(env.name, []).append(env)
+            self.by_path.setdefault(_normpath(env.path), env)
+
+        # field -> (lowercase keys, sorted [(key, position), ...],
+        #           trigram -> {position, ...}), built the first time a field is searched
+        self._fields = {}
+
+    def __len__(self) -> int:
+        return len(self.envs)
+
+    @staticmethod
+    def _build(keys: List[str]):
+        keys = [key.lower() for key in keys]
+        ordered = sorted((key, i) for i, key in enumerate(keys))
+        grams = {}
+        for i, key in enumerate(keys):
+            for gram in _trigrams(key):
+                grams.setdefault(gram, set()).add(i)
+        return keys, ordered, grams
+
+    def exact(self, query: str) -> List[CondaEnv]:
+        """
+        Returns the environments whose name is `query`, or failing that the environment
+        whose path is `query`. Returns an empty list if there is no exact match.
+        """
+        if query in self.by_name:
+            return list(self.by_name[query])
+        env = self.by_path.get(_normpath(query))
+        return [env] if env is not None else []
+
+    def search(self, query: str, field: str = "name") -> List[CondaEnv]:
+        """
+        Returns the environments whose `field` ('name' or 'path') matches `query`,
+        ranked: exact matches first, then prefix matches, then substring matches.
+        Within a rank, shorter keys come first, then keys in alphabetical order, so the
+        result is the same every time for the same snapshot.
+        """
+        if field not in self._fields:
+            self._fields[field] = self._build([getattr(env, field) for env in self.envs])
+        keys, ordered, grams = self._fields[field]
+        q = query.lower()
+        ranked = {}
+
+        # prefix matches, including exact ones: a contiguous run of the sorted keys
+        start = bisect.bisect_left(ordered, (q, -1))
+        for key, i in ordered[start:]:
+            if not key.startswith(q):
+                break
+            ranked[i] = 0 if key == q else 1
+
+        # substring matches
+        if len(q) >= 3:
+            # intersect the rarest trigrams first
+            candidates = None
+            for found in sorted((grams.get(g, set()) for g in _trigrams(q)), key=len):
+                candidates = found if candidates is None else candidates & found
+                if not candidates:
+                    break
+        else:
+            candidates = range(len(keys))
+        for i in candidates or ():
+            if i not in ranked and q in keys[i]:
+                ranked[i] = 2
+
+        order = sorted(ranked, key=lambda i: (ranked[i], len(keys[i]), keys[i], i))
+        return [self.envs[i] for i in order]
+
+
+def _normpath(path: str) -> str:
+    return os.path.normpath(os.path.abspath(os.path.expanduser(path)))
+
+
+def _trigrams(key: str):
+    return {key[i:i + 3] for i in range(len(key) - 2)}
+
+
+# (envs snapshot, index) for the most recently indexed snapshot
+_INDEX = (None, None)
+
+
+def get_env_index(envs: Tuple[CondaEnv, ...]) -> EnvIndex:
+    """
+    Returns an EnvIndex for `envs`, reusing the last one built if `envs` is the same
+    snapshot (discover_envs returns the same tuple until an env is added or removed).
+    """
+    global _INDEX
+    if _INDEX[0] is not envs:
+        _INDEX = (envs, EnvIndex(envs))
+    return _INDEX[1]
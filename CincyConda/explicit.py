@@ -0,0 +1,225 @@
+"""
+Helpers for working with conda "explicit" package lists.
+
+An explicit list is a text file that starts with the line `@EXPLICIT` and then has
+one fully pinned package URL per line, optionally followed by `#<md5>`. Conda installs
+an explicit list without running the solver, so CincyConda solves once (with
+`--dry-run --json`), turns the plan into an explicit list, and then hands that list to
+conda for the download and link steps.
+"""
+
+import os
+import json
+from functools import lru_cache
+from typing import List, Optional, Dict, Any, Tuple
+
+
+@lru_cache(maxsize=None)
+def conda_root(conda: str) -> str:
+    """
+    Returns the root directory of the conda installation that owns the `conda`
+    executable, eg '/rsystem/Rapps/anaconda310' for '/rsystem/Rapps/anaconda310/bin/conda'.
+    """
+    import shutil
+
+    # conda_install_path may just be 'conda', in which case it is found on the PATH
+    conda = shutil.which(conda) or conda
+    return os.path.dirname(os.path.dirname(os.path.abspath(conda)))
+
+
+def pkgs_dirs(conda: str) -> List[str]:
+    """
+    Returns the package cache directories that conda will use, without starting conda.
+
+    Respects the CONDA_PKGS_DIRS environment variable, otherwise uses the same defaults
+    as conda: `<root>/pkgs` and `~/.conda/pkgs`.
+    """
+    if os.environ.get("CONDA_PKGS_DIRS"):
+        return [os.path.expanduser(d.strip())
+                for d in os.environ["CONDA_PKGS_DIRS"].split(",") if d.strip()]
+    return [os.path.join(conda_root(conda), "pkgs"),
+            os.path.join(os.path.expanduser("~"), ".conda", "pkgs")]
+
+
+def writable_pkgs_dir(conda: str) -> str:
+    """
+    Returns the first package cache directory the current user can write to, which is
+    where conda puts new downloads. On the shared server that is usually
+    `~/.conda/pkgs`, because the root install is read-only.
+    """
+    dirs = pkgs_dirs(conda)
+    for d in dirs:
+        if os.path.isdir(d) and os.access(d, os.W_OK):
+            return d
+    for d in dirs:
+        parent = os.path.dirname(d)
+        if not os.path.exists(d) and os.access(parent if os.path.isdir(parent)
+                                               else os.path.expanduser("~"), os.W_OK):
+            return d
+    return dirs[-1]
+
+
+def is_extracted(dist_name: str, dirs: List[str]) -> bool:
+    """
+    Returns True if the package `dist_name` (eg 'numpy-1.24.3-py310h5f9d8c6_1') is
+    extracted in one of the package caches in `dirs`.
+    """
+    return any(os.path.isfile(os.path.join(d, dist_name, "info", "repodata_record.json"))
+               for d in dirs)
+
+
+def dist_name(url: str) -> str:
+    """
+    Returns the dist name of a package URL, ie its file name without the extension.
+    """
+    return _strip_ext(url.rsplit("/", 1)[-1])
+
+
+def _cached_record(dist_name: str, dirs: List[str]) -> Optional[Dict[str, Any]]:
+    """
+    Looks up the repodata record for an extracted package in the package caches.
+    Returns None if the package has not been extracted into any of the caches.
+    """
+    for d in dirs:
+        record_file = os.path.join(d, dist_name, "info", "repodata_record.json")
+        if os.path.isfile(record_file):
+            with open(record_file) as f:
+                return json.load(f)
+    return None
+
+
+def plan_records(plan: dict, dirs: List[str]) -> Optional[List[Dict[str, Any]]]:
+    """
+    Converts the output of `conda create --dry-run --json` into a list of package
+    records, one per package that would be linked into the environment.
+
+    Packages that conda would download come with their URL and md5 in the FETCH
+    actions. Packages that are already in the package cache only appear in the LINK
+    actions, so their URL is read from the cache instead. mamba and micromamba put the
+    full record (URL included) in the LINK actions, which is used as is.
+
+    Parameters
+    ----------
+    plan : dict
+        The parsed JSON output of a conda dry run
+    dirs : list
+        The package cache directories to look in, see `pkgs_dirs`
+
+    Returns
+    -------
+    list or None
+        A list of dicts with (at least) the keys 'name', 'version', 'build', 'url'
+        and 'md5', in link order. Returns None if the plan has any package whose URL
+        could not be determined, in which case the caller should fall back to a
+        regular `conda create`.
+    """
+    actions = plan.get("actions", {})
+    fetched = {}
+    for record in actions.get("FETCH", []):
+        fn = record.get("fn") or record["url"].rsplit("/", 1)[-1]
+        fetched[_strip_ext(fn)] = record
+
+    records = []
+    for link in actions.get("LINK", []):
+        dist_name = link.get("dist_name") or \
+            _strip_ext(link.get("fn") or link.get("url", "").rsplit("/", 1)[-1])
+        record = fetched.get(dist_name) or (link if link.get("url") else None) or \
+            _cached_record(dist_name, dirs)
+        if record is None or not record.get("url"):
+            return None
+        records.append({"name": record.get("name", link.get("name")),
+                        "version": record.get("version", link.get("version")),
+                        "build": record.get("build") or record.get("build_string",
+                                                                   link.get("build_string")),
+                        "url": record["url"],
+                        "md5": record.get("md5"),
+                        "sha256": record.get("sha256")})
+    return records
+
+
+def _strip_ext(fn: str) -> str:
+    for ext in (".tar.bz2", ".conda"):
+        if fn.endswith(ext):
+            return fn[:-len(ext)]
+    return fn
+
+
+def write_explicit(path: str,
+                   records: List[Dict[str, Any]],
+                   header: List[str] = None) -> str:
+    """
+    Writes an explicit package list to `path`.
+
+    Conda itself only understands an md5 after each URL, so a record's sha256 (if it
+    has one) is written as a `# sha256:<hex>` comment on the line before its URL.
+    Conda ignores the comment, and read_explicit picks it up again.
+
+    Parameters
+    ----------
+    path : str
+        The file to write
+    records : list
+        Package records with at least a 'url' key, and optionally 'md5' and 'sha256'
+    header : list, optional
+        Extra comment lines to write at the top of the file, by default None
+
+    Returns
+    -------
+    str
+        The path that was written
+    """
+    lines = [f"# {h}" for h in (header or [])]
+    lines.append("@EXPLICIT")
+    for record in records:
+        md5 = record.get("md5")
+        if record.get("sha256"):
+            lines.append(f"# sha256:{record['sha256']}")
+        lines.append(f"{record['url']}#{md5}" if md5 else record["url"])
+    with open(path, "w") as f:
+        f.write("\n".join(lines) + "\n")
+    return path
+
+
+def read_explicit(path: str) -> Tuple[List[Dict[str, Any]], List[str]]:
+    """
+    Reads an explicit package list written by write_explicit (or by
+    `conda list --explicit --md5`).
+
+    Parameters
+    ----------
+    path : str
+        The file to read
+
+    Returns
+    -------
+    (list, list)
+        The package records, as dicts with the keys 'url', 'md5' and 'sha256' (either
+        hash may be None), and the header comment lines with the leading '# ' removed
+
+    Raises
+    ------
+    AssertionError
+        If the file is not an explicit package list
+    """
+    records, header = [], []
+    explicit, sha256 = False, None
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if line == "@EXPLICIT":
+                explicit = True
+            elif line.startswith("#"):
+                comment = line.lstrip("#").strip()
+                if explicit and comment.startswith("sha256:"):
+                    sha256 = comment[len("sha256:"):]
+                elif not explicit:
+                    header.append(comment)
+            elif explicit:
+                url, _, md5 = line.partition("#")
+                records.append({"url": url, "md5": md5 or None, "sha256": sha256})
+                sha256 = None
+
+    assert explicit, f"{path} is not an explicit package list (no @EXPLICIT line found)."
+    return records, header
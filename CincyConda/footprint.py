@@ -0,0 +1,277 @@
+"""
+How much disk the environments really use, and hardlinking their duplicate files.
+
+conda normally hardlinks package files from the package cache into each env, so a
+hundred envs with pandas hold one copy of it. Copies creep in anyway (envs created
+with --copy, caches on another disk at the time, packages re-extracted after a
+`conda clean`), and then every env pays for its own.
+
+`analyze` walks each env's tree with os.scandir, a few envs at a time, and tells
+files apart by inode: a file with one link is the env's own (unique), one with more
+is shared, and one that is the same inode as the file in the package cache it came
+from is shared through the cache. A file with one link that has a counterpart of the
+same size in the cache, on the same disk, is a candidate for relinking. `compact`
+relinks the candidates whose contents really are identical to the cache copy.
+
+Trees are streamed, never listed: the only thing kept per env is the map from its
+package files to their cache folders (read from conda-meta), and only `workers` envs
+are walked at once.
+"""
+
+import os
+import json
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from conda_meta import meta_dir
+
+# how many envs are walked at once
+FOOTPRINT_WORKERS = 8
+
+# bytes read at a time when comparing a file with its cache copy
+_COMPARE_CHUNK = 1024 * 1024
+
+
+class EnvFootprint(NamedTuple):
+    """
+    The disk use of one env, in allocated bytes. `unique_bytes` are in files only the
+    env links to, `shared_bytes` in files with other links, `cache_bytes` the part
+    of those shared with the package cache, and `reclaimable_bytes` what relinking
+    the candidates would free. `relinked_files` and `relinked_bytes` are what
+    `compact` did.
+    """
+    prefix: str
+    files: int
+    bytes: int
+    unique_bytes: int
+    shared_bytes: int
+    cache_bytes: int
+    reclaimable_bytes: int
+    relinked_files: int = 0
+    relinked_bytes: int = 0
+
+
+def _allocated(st: os.stat_result) -> int:
+    blocks = getattr(st, "st_blocks", None)
+    return blocks * 512 if blocks is not None else st.st_size
+
+
+def _site_packages(prefix: str) -> Optional[str]:
+    lib = os.path.join(prefix, "lib")
+    try:
+        names = [n for n in os.listdir(lib) if n.startswith("python3")]
+    except OSError:
+        return None
+    for name in sorted(names):
+        if os.path.isdir(os.path.join(lib, name, "site-packages")):
+            return f"lib/{name}/site-packages"
+    return None
+
+
+def cache_sources(prefix: str) -> Tuple[List[str], Dict[str, int]]:
+    """
+    Returns (the package cache folders the env was linked from, {relative path: index
+    in that list}) for the env's package files that should be identical to their
+    cache copy: hardlinked files without a prefix placeholder.
+    """
+    sources, files = [], {}
+    directory = meta_dir(prefix)
+    site_packages = None
+    for entry in sorted(os.scandir(directory), key=lambda e: e.name):
+        if not entry.name.endswith(".json"):
+            continue
+        try:
+            with open(entry.path) as f:
+                record = json.load(f)
+        except (OSError, ValueError):
+            continue
+        source = (record.get("link") or {}).get("source")
+        if not source:
+            continue
+        noarch_python = record.get("noarch") == "python" or \
+            record.get("package_type") == "noarch_python"
+        if noarch_python and site_packages is None:
+            site_packages = _site_packages(prefix) or ""
+        index = len(sources)
+        sources.append(source)
+        # paths_data may only list the special files (the installer writes it that
+        # way), so every file in `files` is a hardlink unless paths_data says otherwise
+        special = set()
+        for path in record.get("paths_data", {}).get("paths", ()):
+            if path.get("path_type", "hardlink") != "hardlink" or \
+                    path.get("prefix_placeholder"):
+                special.add(path["_path"])
+            else:
+                files[path["_path"]] = index
+        for rel in record.get("files", ()):
+            if rel not in special:
+                files[rel] = index
+        if noarch_python and site_packages:
+            # the cache keeps noarch python files under site-packages/ and
+            # python-scripts/, see _cache_path
+            sources[index] = (source, site_packages)
+    return sources, files
+
+
+def _cache_path(source, rel: str) -> str:
+    if isinstance(source, tuple):
+        source, site_packages = source
+        if rel.startswith(site_packages + "/"):
+            rel = "site-packages" + rel[len(site_packages):]
+        elif rel.startswith("bin/"):
+            rel = "python-scripts" + rel[len("bin"):]
+    return os.path.join(source, rel)
+
+
+def walk_files(top: str, skip: frozenset = frozenset()) -> Iterator[Tuple[str, os.DirEntry]]:
+    """
+    Yields (path relative to `top`, DirEntry) for every regular file below `top`,
+    without following symlinks and without entering the folders in `skip` (absolute
+    paths). Only the folders still to visit are kept in memory.
+    """
+    stack = [(top, "")]
+    while stack:
+        directory, rel = stack.pop()
+        try:
+            entries = os.scandir(directory)
+        except OSError:
+            continue
+        with entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if entry.path not in skip:
+                            stack.append((entry.path, f"{rel}{entry.name}/"))
+                    elif entry.is_file(follow_symlinks=False):
+                        yield rel + entry.name, entry
+                except OSError:
+                    continue
+
+
+def _same_contents(a: str, b: str) -> bool:
+    with open(a, "rb") as fa, open(b, "rb") as fb:
+        while True:
+            chunk = fa.read(_COMPARE_CHUNK)
+            if chunk != fb.read(_COMPARE_CHUNK):
+                return False
+            if not chunk:
+                return True
+
+
+def _relink(path: str, cache_file: str, st: os.stat_result) -> bool:
+    """
+    Replaces the file at `path` with a hardlink to `cache_file`, atomically, if their
+    contents are identical and `path` has not changed since `st` was taken.
+    """
+    if not _same_contents(path, cache_file):
+        return False
+    tmp = path + ".cincyconda-link"
+    try:
+        os.link(cache_file, tmp)
+    except OSError:
+        return False
+    try:
+        now = os.stat(path, follow_symlinks=False)
+        if (now.st_ino, now.st_size, now.st_mtime_ns) != \
+                (st.st_ino, st.st_size, st.st_mtime_ns):
+            os.remove(tmp)
+            return False
+        os.replace(tmp, path)
+    except OSError:
+        if os.path.lexists(tmp):
+            os.remove(tmp)
+        return False
+    return True
+
+
+def env_footprint(prefix: str,
+                  compact: bool = False,
+                  skip: frozenset = frozenset()) -> EnvFootprint:
+    """
+    Returns the footprint of the env at `prefix`, see EnvFootprint. With `compact`,
+    the candidates are relinked to the package cache first (if identical).
+
+    Parameters
+    ----------
+    prefix : str
+        The env
+    compact : bool, optional
+        Relink duplicate package files to the package cache, by default False
+    skip : frozenset, optional
+        Absolute paths of folders not to walk, eg other envs nested in this one (the
+        base env holds envs/ and pkgs/)
+    """
+    prefix = os.path.abspath(prefix)
+    sources, package_files = cache_sources(prefix)
+    files = total = unique = shared = cache = reclaimable = 0
+    relinked_files = relinked_bytes = 0
+
+    for rel, entry in walk_files(prefix, skip):
+        try:
+            st = entry.stat(follow_symlinks=False)
+        except OSError:
+            continue
+        size = _allocated(st)
+        files += 1
+        total += size
+        source = package_files.get(rel)
+        cache_st = None
+        if source is not None:
+            cache_file = _cache_path(sources[source], rel)
+            try:
+                cache_st = os.stat(cache_file, follow_symlinks=False)
+            except OSError:
+                cache_st = None
+
+        if st.st_nlink > 1:
+            shared += size
+            if cache_st is not None and (cache_st.st_dev, cache_st.st_ino) == \
+                    (st.st_dev, st.st_ino):
+                cache += size
+            continue
+
+        if cache_st is not None and cache_st.st_dev == st.st_dev and \
+                cache_st.st_size == st.st_size and cache_st.st_ino != st.st_ino:
+            if not compact:
+                reclaimable += size
+            elif _relink(entry.path, cache_file, st):
+                relinked_files += 1
+                relinked_bytes += size
+                shared += size
+                cache += size
+                continue
+        unique += size
+
+    return EnvFootprint(prefix, files, total, unique, shared, cache, reclaimable,
+                        relinked_files, relinked_bytes)
+
+
+def analyze(prefixes: Iterable[str],
+            compact: bool = False,
+            skip: Iterable[str] = (),
+            workers: int = FOOTPRINT_WORKERS) -> Iterator[EnvFootprint]:
+    """
+    Yields the footprint of every env in `prefixes`, walking `workers` envs at once.
+    Envs are never walked twice: an env (or a folder in `skip`, eg a package cache)
+    inside another env is left out of the outer one.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    prefixes = [os.path.abspath(p) for p in dict.fromkeys(prefixes)
+                if os.path.isdir(meta_dir(p))]
+    excluded = frozenset(prefixes) | frozenset(os.path.abspath(p) for p in skip)
+
+    def _footprint(prefix):
+        return env_footprint(prefix, compact=compact, skip=excluded - {prefix})
+
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(prefixes) or 1))) as pool:
+        yield from pool.map(_footprint, prefixes)
+
+
+def compact(prefixes: Iterable[str],
+            skip: Iterable[str] = (),
+            workers: int = FOOTPRINT_WORKERS) -> Iterator[EnvFootprint]:
+    """
+    Like `analyze`, but relinks every env file that is an identical copy of its
+    package cache file to the cache file.
+    """
+    return analyze(prefixes, compact=True, skip=skip, workers=workers)
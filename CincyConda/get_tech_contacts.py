@@ -1,21 +1,127 @@
 TECH_CONTACTS_API_ENDPOINT = "http://localhost:5000/api/get-tech-contacts"
 
-import requests
+# seconds to wait for the node server before giving up
+TECH_CONTACTS_TIMEOUT = 3
+
+# seconds a cached copy of the tech contacts is used without asking the node server
+TECH_CONTACTS_MAX_AGE = 24 * 60 * 60
+
+import os
 import json
+import time
+import threading
+
+from cache import cache_dir, atomic_write
+
+# one pooled session per process, created the first time it is needed
+_session = None
+_session_lock = threading.Lock()
+
+
+def _get_session() -> "requests.Session":
+    global _session
+    with _session_lock:
+        if _session is None:
+            # imported here so that importing CincyConda stays cheap
+            import requests
+            _session = requests.Session()
+        return _session
+
 
-def get_tech_contacts():
+def _cache_file(endpoint: str) -> str:
+    # one file per endpoint, so another node server never answers from this one's copy
+    import hashlib
+    key = hashlib.sha256(endpoint.encode("utf-8")).hexdigest()[:16]
+    return os.path.join(cache_dir(), f"tech_contacts-{key}.json")
+
+
+def _read_cache(endpoint: str):
+    """
+    Returns (fetched_at, contacts) from the on-disk cache of `endpoint`, or
+    (None, None) if there is no usable cached copy.
+    """
+    try:
+        with open(_cache_file(endpoint)) as f:
+            cached = json.load(f)
+        return cached["fetched_at"], cached["contacts"]
+    except (OSError, ValueError, KeyError):
+        return None, None
+
+
+def get_tech_contacts(endpoint: str = None,
+                      timeout: float = TECH_CONTACTS_TIMEOUT,
+                      max_age: float = TECH_CONTACTS_MAX_AGE):
     """
     Get the technical contacts for the CincyConda project.
 
+    The contacts are cached on disk (see cache.cache_dir), one copy per endpoint, and
+    shared by every process that uses the same cache directory, so the node server is
+    only asked for them once every `max_age` seconds. If the node server is slow or down, a stale cached copy is
+    returned instead of an error.
+
     Parameters
     ----------
-    None
+    endpoint : str, optional
+        The URL to get the contacts from, by default TECH_CONTACTS_API_ENDPOINT
+    timeout : float, optional
+        Seconds to wait for the node server, by default TECH_CONTACTS_TIMEOUT
+    max_age : float, optional
+        Seconds a cached copy is used without asking the node server, by default
+        TECH_CONTACTS_MAX_AGE
 
     Returns
     -------
     dict
         A dictionary of technical contacts for the CincyConda project.
+
+    Raises
+    ------
+    requests.RequestException
+        If the node server could not be reached and there is no cached copy
+    """
+    endpoint = endpoint or TECH_CONTACTS_API_ENDPOINT
+    fetched_at, contacts = _read_cache(endpoint)
+    if contacts is not None and time.time() - fetched_at < max_age:
+        return contacts
+
+    import requests
+
+    try:
+        response = _get_session().get(endpoint, timeout=timeout)
+        response.raise_for_status()
+        fresh = json.loads(response.text)
+    except (requests.RequestException, ValueError):
+        if contacts is not None:
+            return contacts
+        raise
+
+    atomic_write(_cache_file(endpoint),
+                 json.dumps({"fetched_at": time.time(), "contacts": fresh}).encode("utf-8"))
+    return fresh
+
+
+def get_tech_contacts_async(**kwargs) -> "concurrent.futures.Future":
     """
-    response = requests.get(TECH_CONTACTS_API_ENDPOINT)
-    return json.loads(response.text)
-        
\ No newline at end of file
+    Starts fetching the technical contacts in a background thread and returns right
+    away. Takes the same arguments as get_tech_contacts.
+
+    Returns
+    -------
+    concurrent.futures.Future
+        Resolves to the contacts dict, or to the exception raised while fetching them
+    """
+    from concurrent.futures import Future
+
+    future = Future()
+
+    def _fetch():
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(get_tech_contacts(**kwargs))
+        except Exception as e:
+            future.set_exception(e)
+
+    # a daemon thread, so a hung request can never keep the kernel from exiting
+    threading.Thread(target=_fetch, name="cincyconda-tech-contacts", daemon=True).start()
+    return future
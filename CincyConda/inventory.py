@@ -0,0 +1,228 @@
+"""
+What is installed where: package tables read straight from `<prefix>/conda-meta`.
+
+`conda list` starts conda and takes seconds per environment. The records it reads are
+plain JSON files, so this module reads them itself into a column-oriented
+PackageTable (one tuple per column rather than one dict per package). Each environment's table is cached in memory and on disk, keyed on the
+mtime of its conda-meta folder, which changes whenever conda links or unlinks a
+package, so rescanning hundreds of unchanged environments only costs one stat each.
+"""
+
+import os
+import json
+import threading
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Union
+
+from cache import cache_dir, atomic_write
+from conda_meta import meta_dir
+from specs import parse_spec, version_matches
+
+COLUMNS = ("prefix", "name", "version", "build", "channel", "size", "files")
+
+# bump this if the layout of the cached tables changes
+_TABLE_FORMAT = 2
+
+# prefix -> (conda-meta mtime, PackageTable)
+_TABLES = {}
+_TABLES_LOCK = threading.Lock()
+
+
+class PackageTable:
+    """
+    Installed packages, one column per field in COLUMNS: `prefix` is the env path,
+    `size` the package's download size in bytes and `files` the number of files it
+    installed. The columns are tuples, since env_packages hands the same cached table
+    to every caller.
+
+    Example Usage
+    -------------
+    >>> table = env.Packages()
+    >>> table.column("name")[:3]
+    ('_libgcc_mutex', 'ca-certificates', 'ld_impl_linux-64')
+    >>> old = env.FindPackage('pandas<2')
+    >>> old.envs()
+    ['/home/user/project/.env', ...]
+    """
+    __slots__ = ("columns",)
+
+    def __init__(self, columns: Dict[str, Iterable] = None):
+        columns = columns or {}
+        self.columns = {c: tuple(columns.get(c, ())) for c in COLUMNS}
+
+    def __len__(self):
+        return len(self.columns["name"])
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        return self.rows()
+
+    def __repr__(self):
+        lines = [f"PackageTable({len(self)} packages in {len(self.envs())} envs)"]
+        for row in list(self.rows())[:10]:
+            lines.append(f"    {row['name']:<30} {row['version']:<15} {row['build']:<20} "
+                         f"{row['prefix']}")
+        if len(self) > 10:
+            lines.append("    ...")
+        return "\n".join(lines)
+
+    def column(self, name: str) -> tuple:
+        return self.columns[name]
+
+    def rows(self) -> Iterator[Dict[str, Any]]:
+        """
+        Yields one dict per package.
+        """
+        columns = [self.columns[c] for c in COLUMNS]
+        for values in zip(*columns):
+            yield dict(zip(COLUMNS, values))
+
+    def envs(self) -> List[str]:
+        """
+        Returns the env prefixes in the table, in order.
+        """
+        return list(dict.fromkeys(self.columns["prefix"]))
+
+    def take(self, indices: Iterable[int]) -> "PackageTable":
+        """
+        Returns a new table with the rows at `indices`.
+        """
+        indices = list(indices)
+        return PackageTable({c: [values[i] for i in indices]
+                             for c, values in self.columns.items()})
+
+    def where(self, condition: Union[str, Callable[[Dict[str, Any]], bool]]) -> "PackageTable":
+        """
+        Returns the packages matching a conda match spec, eg 'pandas<2' or
+        'numpy=1.26', or for which `condition(row)` is True.
+        """
+        if callable(condition):
+            return self.take(i for i, row in enumerate(self.rows()) if condition(row))
+
+        spec = parse_spec(condition)
+        names, versions = self.columns["name"], self.columns["version"]
+        builds, channels = self.columns["build"], self.columns["channel"]
+        matched = [i for i, name in enumerate(names) if name == spec.name]
+        if spec.version:
+            matched = [i for i in matched if version_matches(spec.version, versions[i])]
+        if spec.build or spec.channel:
+            matched = [i for i in matched
+                       if spec.matches({"name": names[i], "version": versions[i],
+                                        "build": builds[i], "channel": channels[i]})]
+        return self.take(matched)
+
+    @classmethod
+    def concat(cls, tables: Iterable["PackageTable"]) -> "PackageTable":
+        """
+        Returns a new table with the rows of `tables`, in order.
+        """
+        columns = {c: [] for c in COLUMNS}
+        for table in tables:
+            for c in COLUMNS:
+                columns[c].extend(table.columns[c])
+        return cls(columns)
+
+    def to_pandas(self):
+        """
+        Returns the table as a pandas DataFrame (needs pandas).
+        """
+        import pandas as pd
+        return pd.DataFrame(self.columns, columns=list(COLUMNS))
+
+
+def _read_table(prefix: str) -> PackageTable:
+    columns = {c: [] for c in COLUMNS}
+    directory = meta_dir(prefix)
+    for entry in sorted(os.scandir(directory), key=lambda e: e.name):
+        if not entry.name.endswith(".json"):
+            continue
+        try:
+            with open(entry.path, "rb") as f:
+                record = json.load(f)
+        except (OSError, ValueError):
+            continue
+        columns["prefix"].append(prefix)
+        columns["name"].append(record.get("name", ""))
+        columns["version"].append(record.get("version", ""))
+        columns["build"].append(record.get("build", record.get("build_string", "")))
+        columns["channel"].append(record.get("channel", ""))
+        columns["size"].append(record.get("size", 0))
+        columns["files"].append(len(record.get("files", ())))
+    return PackageTable(columns)
+
+
+def _cache_path(prefix: str) -> str:
+    import hashlib
+    digest = hashlib.sha256(prefix.encode("utf-8")).hexdigest()[:24]
+    return os.path.join(cache_dir("packages"), digest + ".json")
+
+
+def _valid_table(columns: Any) -> Optional[PackageTable]:
+    """
+    Returns the PackageTable of cached `columns`, or None if they are not a list per
+    column in COLUMNS, all of the same length.
+    """
+    if not isinstance(columns, dict) or set(columns) != set(COLUMNS):
+        return None
+    if not all(isinstance(columns[c], list) for c in COLUMNS) or \
+            len({len(columns[c]) for c in COLUMNS}) != 1:
+        return None
+    return PackageTable(columns)
+
+
+def env_packages(prefix: str) -> PackageTable:
+    """
+    Returns the packages installed in the env at `prefix`, from the cache if its
+    conda-meta folder has not changed since it was last read.
+
+    Raises
+    ------
+    AssertionError
+        If there is no conda environment at `prefix`
+    """
+    prefix = os.path.abspath(prefix)
+    try:
+        mtime = os.stat(meta_dir(prefix)).st_mtime_ns
+    except OSError:
+        raise AssertionError(
+            f"There is no conda environment at {prefix} (no conda-meta folder found).")
+
+    with _TABLES_LOCK:
+        cached = _TABLES.get(prefix)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+
+    path = _cache_path(prefix)
+    table = None
+    try:
+        with open(path, "rb") as f:
+            data = json.load(f)
+        if data.get("format") == _TABLE_FORMAT and data.get("prefix") == prefix \
+                and data.get("mtime") == mtime:
+            table = _valid_table(data["columns"])
+    except (OSError, ValueError, KeyError, AttributeError):
+        pass
+
+    if table is None:
+        table = _read_table(prefix)
+        atomic_write(path, json.dumps({"format": _TABLE_FORMAT, "prefix": prefix,
+                                       "mtime": mtime, "columns": table.columns}
+                                      ).encode("utf-8"))
+
+    with _TABLES_LOCK:
+        _TABLES[prefix] = (mtime, table)
+    return table
+
+
+def scan(prefixes: Iterable[str]) -> PackageTable:
+    """
+    Returns one table with the packages of every env in `prefixes`. Prefixes without
+    a conda-meta folder are skipped.
+    """
+    # one env after another: reading the records is json.load, which holds the GIL,
+    # and unchanged envs only cost a stat, so a thread pool does not make this faster
+    tables = []
+    for prefix in dict.fromkeys(prefixes):
+        try:
+            tables.append(env_packages(prefix))
+        except AssertionError:
+            continue
+    return PackageTable.concat(tables)
@@ -0,0 +1,306 @@
+"""
+Jupyter kernelspecs for conda environments, written directly.
+
+A kernelspec is a folder with a small kernel.json in the user's Jupyter data directory.
+`python -m ipykernel install --user` does nothing more than write that file (and copy
+two logos), but it starts a Python interpreter and imports ipykernel to do it. This
+module writes and removes the files itself, and reconciles the kernelspecs of every
+conda environment in one pass (see `sync_kernels`), so dead kernels for removed
+environments do not pile up in the JupyterHub launcher.
+
+Kernelspecs written here carry the env prefix in their metadata, under 'cincyconda',
+so they can be told apart from the ones Jupyter users made themselves. Those are never
+rewritten: a kernel for R, SAS or a hand-edited Python kernel keeps its argv and env.
+"""
+
+import os
+import re
+import sys
+import json
+import glob
+import shutil
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from cache import atomic_write
+from envs import CondaEnv
+
+# the metadata key that marks a kernelspec as written by CincyConda
+KERNEL_METADATA_KEY = "cincyconda"
+
+# the mode of kernel.json: Jupyter only needs to read it
+KERNEL_FILE_MODE = 0o644
+
+# the conda environments' default kernel, where ipykernel keeps its logos
+_IPYKERNEL_RESOURCES = os.path.join("share", "jupyter", "kernels", "python3")
+
+
+def kernels_dir() -> str:
+    """
+    Returns the folder of the user's kernelspecs, the same one `ipykernel install
+    --user` uses: $JUPYTER_DATA_DIR/kernels if set, otherwise the platform's Jupyter
+    data directory.
+    """
+    if os.environ.get("JUPYTER_DATA_DIR"):
+        data = os.environ["JUPYTER_DATA_DIR"]
+    elif sys.platform == "darwin":
+        data = os.path.join(os.path.expanduser("~"), "Library", "Jupyter")
+    elif os.name == "nt":
+        data = os.path.join(os.environ.get("APPDATA", os.path.expanduser("~")), "jupyter")
+    else:
+        data = os.path.join(os.environ.get("XDG_DATA_HOME") or
+                            os.path.join(os.path.expanduser("~"), ".local", "share"),
+                            "jupyter")
+    return os.path.join(os.path.expanduser(data), "kernels")
+
+
+def kernel_name(name: str) -> str:
+    """
+    Returns `name` as a valid kernelspec name: Jupyter only allows letters, digits,
+    '.', '_' and '-', and compares names case-insensitively.
+    """
+    return re.sub(r"[^a-z0-9._\-]+", "-", name.lower()).strip("-") or "env"
+
+
+def env_python(prefix: str) -> str:
+    """
+    Returns the path of the Python interpreter of the env at `prefix`.
+    """
+    if os.name == "nt":
+        return os.path.join(prefix, "python.exe")
+    return os.path.join(prefix, "bin", "python")
+
+
+def has_ipykernel(prefix: str) -> bool:
+    """
+    Returns True if ipykernel is installed in the env at `prefix`, from its conda-meta.
+    """
+    return bool(glob.glob(os.path.join(prefix, "conda-meta", "ipykernel-*.json")))
+
+
+def kernel_spec(prefix: str, display_name: str) -> dict:
+    """
+    Returns the kernel.json contents for the env at `prefix`, as ipykernel writes it.
+    """
+    prefix = os.path.abspath(prefix)
+    return {"argv": [env_python(prefix), "-m", "ipykernel_launcher",
+                     "-f", "{connection_file}"],
+            "display_name": display_name,
+            "language": "python",
+            "metadata": {"debugger": True,
+                         KERNEL_METADATA_KEY: {"prefix": prefix}}}
+
+
+def is_own_spec(spec: dict) -> bool:
+    """
+    Returns True if the kernelspec was written by CincyConda (see `kernel_spec`).
+    """
+    return bool(spec.get("metadata", {}).get(KERNEL_METADATA_KEY, {}).get("prefix"))
+
+
+def spec_prefix(spec: dict) -> Optional[str]:
+    """
+    Returns the env prefix a kernelspec launches, or None if it is not an ipykernel in
+    a conda env (eg a kernel for R or SAS, which also live in an env's bin/, or the
+    default `python3` kernel).
+    """
+    if is_own_spec(spec):
+        return spec["metadata"][KERNEL_METADATA_KEY]["prefix"]
+    argv = spec.get("argv") or []
+    if len(argv) < 3 or argv[1:3] != ["-m", "ipykernel_launcher"]:
+        return None
+    python = argv[0]
+    if os.path.isabs(python) and os.path.basename(os.path.dirname(python)) == "bin":
+        return os.path.dirname(os.path.dirname(python))
+    return None
+
+
+def _merge_spec(spec: dict, existing: dict) -> dict:
+    """
+    Returns `spec` with what the user changed in `existing` kept: extra argv, env,
+    interrupt_mode and any other keys. Only the display name and our metadata are
+    taken from `spec`.
+    """
+    merged = {**spec, **existing, "display_name": spec["display_name"]}
+    merged["metadata"] = {**spec["metadata"], **existing.get("metadata", {}),
+                          KERNEL_METADATA_KEY: spec["metadata"][KERNEL_METADATA_KEY]}
+    return merged
+
+
+def installed_kernels(directory: str = None) -> Dict[str, dict]:
+    """
+    Returns every kernelspec in `directory` (by default `kernels_dir()`), as
+    name -> parsed kernel.json. Unreadable specs are left out.
+    """
+    directory = directory or kernels_dir()
+    specs = {}
+    try:
+        entries = list(os.scandir(directory))
+    except OSError:
+        return specs
+    for entry in entries:
+        try:
+            with open(os.path.join(entry.path, "kernel.json")) as f:
+                specs[entry.name] = json.load(f)
+        except (OSError, ValueError):
+            continue
+    return specs
+
+
+def write_kernel(prefix: str,
+                 name: str,
+                 display_name: str = None,
+                 directory: str = None) -> Tuple[str, bool]:
+    """
+    Registers the env at `prefix` as a Jupyter kernel, like `ipykernel install --user
+    --name <name> --display-name <display_name>`. If a kernelspec called `name`
+    already launches this env, its argv, env and other settings are kept.
+
+    Parameters
+    ----------
+    prefix : str
+        The path of the env
+    name : str
+        The kernel name, made valid with `kernel_name`
+    display_name : str, optional
+        The name shown in Jupyter, by default `name`
+    directory : str, optional
+        The kernelspec folder, by default `kernels_dir()`
+
+    Returns
+    -------
+    tuple
+        The path of the kernelspec folder, and whether anything was written (False if
+        an identical kernelspec was already there)
+    """
+    spec_dir = os.path.join(directory or kernels_dir(), kernel_name(name))
+    kernel_json = os.path.join(spec_dir, "kernel.json")
+    spec = kernel_spec(prefix, display_name or name)
+
+    try:
+        with open(kernel_json, "rb") as f:
+            old = f.read()
+        existing = json.loads(old)
+    except (OSError, ValueError):
+        old, existing = None, None
+    if isinstance(existing, dict) and spec_prefix(existing) is not None and \
+            os.path.abspath(spec_prefix(existing)) == os.path.abspath(prefix):
+        spec = _merge_spec(spec, existing)
+
+    content = json.dumps(spec, indent=1).encode("utf-8")
+    if content == old:
+        return spec_dir, False
+
+    os.makedirs(spec_dir, exist_ok=True)
+    for logo in glob.glob(os.path.join(prefix, _IPYKERNEL_RESOURCES, "logo-*")):
+        shutil.copyfile(logo, os.path.join(spec_dir, os.path.basename(logo)))
+    atomic_write(kernel_json, content, mode=KERNEL_FILE_MODE)
+    return spec_dir, True
+
+
+def remove_kernel(name: str, directory: str = None) -> bool:
+    """
+    Removes the kernelspec `name`. Returns False if there was none.
+    """
+    spec_dir = os.path.join(directory or kernels_dir(), kernel_name(name))
+    if not os.path.isdir(spec_dir):
+        return False
+    shutil.rmtree(spec_dir, ignore_errors=True)
+    return True
+
+
+def remove_kernels_for(prefix: str, directory: str = None) -> List[str]:
+    """
+    Removes every kernelspec that launches the env at `prefix`. Returns their names.
+    """
+    prefix = os.path.abspath(prefix)
+    removed = []
+    for name, spec in installed_kernels(directory).items():
+        if spec_prefix(spec) == prefix and remove_kernel(name, directory):
+            removed.append(name)
+    return removed
+
+
+def _default_kernel_name(env: CondaEnv) -> str:
+    """
+    The kernel name for an env that has none yet: its conda name, or for prefix envs
+    the folder name (the project folder for the usual ./.env/ layout).
+    """
+    if env.name:
+        return env.name
+    folder = os.path.basename(env.path.rstrip(os.sep))
+    if folder.startswith("."):
+        folder = os.path.basename(os.path.dirname(env.path.rstrip(os.sep))) or folder
+    return folder
+
+
+def sync_kernels(envs: Iterable[CondaEnv],
+                 directory: str = None,
+                 remove_stale: bool = True) -> Dict[str, List[str]]:
+    """
+    Makes the kernelspecs match the conda environments in one pass: every env with
+    ipykernel installed gets a kernelspec, and kernelspecs for conda envs that no
+    longer exist are removed.
+
+    Envs that already have a kernelspec keep its name. New ones are named after the
+    env (see `_default_kernel_name`), with a number added if that name is taken.
+    Only kernelspecs written by CincyConda are rewritten; ipykernel's own are left as
+    they are, and kernelspecs that do not run ipykernel in a conda env (R, SAS, ...)
+    are never touched.
+
+    Parameters
+    ----------
+    envs : iterable of CondaEnv
+        The environments that should have a kernel, eg from `discover_envs`
+    directory : str, optional
+        The kernelspec folder, by default `kernels_dir()`
+    remove_stale : bool, optional
+        Whether to remove kernelspecs for envs that no longer exist, by default True
+
+    Returns
+    -------
+    dict
+        The kernel names that were 'added', 'updated', 'removed' and left 'unchanged'
+    """
+    directory = directory or kernels_dir()
+    existing = installed_kernels(directory)
+
+    by_prefix = {}
+    for name, spec in sorted(existing.items()):
+        prefix = spec_prefix(spec)
+        if prefix is not None:
+            by_prefix.setdefault(os.path.abspath(prefix), name)
+
+    result = {"added": [], "updated": [], "removed": [], "unchanged": []}
+    wanted = set()
+    for env in envs:
+        if env.name == "base" or not has_ipykernel(env.path):
+            continue
+        prefix = os.path.abspath(env.path)
+        wanted.add(prefix)
+
+        name = by_prefix.get(prefix)
+        is_new = name is None
+        if is_new:
+            base = name = kernel_name(_default_kernel_name(env))
+            n = 1
+            while name in existing:
+                n += 1
+                name = f"{base}-{n}"
+            existing[name] = {}
+            by_prefix[prefix] = name
+
+        if not is_new and not is_own_spec(existing[name]):
+            result["unchanged"].append(name)
+            continue
+        display_name = existing[name].get("display_name") or name
+        _, written = write_kernel(prefix, name, display_name, directory)
+        result["added" if is_new else "updated" if written else "unchanged"].append(name)
+
+    if remove_stale:
+        for name, spec in installed_kernels(directory).items():
+            prefix = spec_prefix(spec)
+            if prefix is None or os.path.abspath(prefix) in wanted:
+                continue
+            if not os.path.exists(env_python(prefix)) and remove_kernel(name, directory):
+                result["removed"].append(name)
+    return result
@@ -0,0 +1,211 @@
+"""
+A local mirror of the packages CincyConda environments are built from.
+
+`CincyConda.Prefetch` solves a package list once and downloads every package in the
+result into the mirror folder, several at a time, verifying each against its md5 /
+sha256. Next to the packages it writes a repodata.json per channel and subdir, so the
+mirror is a regular file:// conda channel (one per upstream channel). A CincyConda
+object created with `mirror=True` builds envs from those channels only
+(--override-channels): everything comes from local disk, and nothing needs the
+network once the mirror has what the env needs.
+
+The mirror lives in `~/.cache/cincyconda/mirror` (inside CINCYCONDA_CACHE_DIR), or in
+CINCYCONDA_MIRROR_DIR if that is set, so a whole team can share one.
+"""
+
+import os
+import json
+from typing import Any, Dict, Iterable, List, Tuple
+
+from cache import cache_dir, atomic_write
+from channel_index import platform_subdir
+
+# how many packages are downloaded at once
+MIRROR_WORKERS = 8
+
+# keys of solver output records that are not part of a repodata.json record
+_NOT_REPODATA = {"url", "channel", "schannel", "fn", "base_url", "dist_name", "priority",
+                 "package_type"}
+
+# the mirror's index of channels: upstream channel URL -> folder in the mirror
+_CHANNELS_FILE = "channels.json"
+
+
+def mirror_dir() -> str:
+    """
+    Returns the mirror folder: $CINCYCONDA_MIRROR_DIR, or 'mirror' in the cache.
+    """
+    directory = os.environ.get("CINCYCONDA_MIRROR_DIR")
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+        return directory
+    return cache_dir("mirror")
+
+
+def channel_folder(channel_url: str) -> str:
+    """
+    Returns the folder, relative to the mirror, for an upstream channel, eg
+    'repo.example.com/repo/restricted_channel' for https://repo.example.com/repo/...
+    """
+    scheme, _, rest = channel_url.rstrip("/").partition("://")
+    if scheme == "file":
+        return os.path.join("local", rest.lstrip("/"))
+    return rest.replace(":", "_")
+
+
+def split_url(url: str) -> Tuple[str, str, str]:
+    """
+    Splits a package URL into (channel URL, subdir, file name).
+    """
+    channel, subdir, fn = url.rsplit("/", 2)
+    return channel, subdir, fn
+
+
+class Mirror:
+    """
+    The local package mirror, see the module docstring.
+
+    Parameters
+    ----------
+    directory : str, optional
+        The mirror folder, by default `mirror_dir()`
+    """
+    def __init__(self, directory: str = None):
+        self.directory = os.path.abspath(directory or mirror_dir())
+
+    def __repr__(self):
+        return f"Mirror({self.directory!r})"
+
+    def path(self, channel_url: str) -> str:
+        return os.path.join(self.directory, channel_folder(channel_url))
+
+    def url(self, channel_url: str) -> str:
+        """
+        Returns the file:// URL of the mirror of an upstream channel.
+        """
+        return "file://" + self.path(channel_url)
+
+    def channels(self) -> Dict[str, str]:
+        """
+        Returns the mirrored channels, as upstream URL -> mirror file:// URL.
+        """
+        try:
+            with open(os.path.join(self.directory, _CHANNELS_FILE)) as f:
+                return {upstream: self.url(upstream) for upstream in json.load(f)}
+        except (OSError, ValueError):
+            return {}
+
+    def fingerprint(self) -> str:
+        """
+        Returns a short hash that changes whenever a package is added to the mirror.
+        """
+        import hashlib
+        digest = hashlib.sha256()
+        for upstream in sorted(self.channels()):
+            for subdir in ("noarch", platform_subdir()):
+                try:
+                    mtime = os.stat(os.path.join(self.path(upstream), subdir,
+                                                 "repodata.json")).st_mtime_ns
+                except OSError:
+                    continue
+                digest.update(f"{upstream}/{subdir}:{mtime}\n".encode("utf-8"))
+        return digest.hexdigest()[:16]
+
+    def local_path(self, url: str) -> str:
+        channel, subdir, fn = split_url(url)
+        return os.path.join(self.path(channel), subdir, fn)
+
+    def add(self,
+            records: Iterable[Dict[str, Any]],
+            workers: int = MIRROR_WORKERS,
+            session=None) -> Dict[str, List[str]]:
+        """
+        Downloads the packages in `records` (full records, as conda's solver reports
+        them) into the mirror and adds them to the mirror's repodata.json files.
+
+        Parameters
+        ----------
+        records : iterable of dict
+            Package records with at least 'url' and 'md5' or 'sha256'
+        workers : int, optional
+            How many packages to download at once, by default MIRROR_WORKERS
+        session : requests.Session, optional
+            The session to download with, by default a new one
+
+        Returns
+        -------
+        dict
+            The file names that were 'downloaded' and the ones 'present' already
+
+        Raises
+        ------
+        download.ChecksumError
+            If a download does not match its checksum
+        """
+        from concurrent.futures import ThreadPoolExecutor
+        from download import fetch, file_matches
+
+        records = [r for r in records if r.get("url")]
+        if session is None and any(not r["url"].startswith("file://") for r in records):
+            import requests
+            session = requests.Session()
+
+        def _download(record):
+            dest = self.local_path(record["url"])
+            if file_matches(dest, record.get("md5"), record.get("sha256")):
+                return False
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            fetch(record["url"], dest, record.get("md5"), record.get("sha256"), session)
+            return True
+
+        result = {"downloaded": [], "present": []}
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            for record, downloaded in zip(records, pool.map(_download, records)):
+                fn = split_url(record["url"])[2]
+                result["downloaded" if downloaded else "present"].append(fn)
+
+        self._index(records)
+        return result
+
+    def _index(self, records: List[Dict[str, Any]]) -> None:
+        """
+        Adds `records` to the repodata.json of their channel and subdir.
+        """
+        by_subdir = {}
+        for record in records:
+            channel, subdir, fn = split_url(record["url"])
+            by_subdir.setdefault((channel, subdir), {})[fn] = \
+                {k: v for k, v in record.items() if k not in _NOT_REPODATA}
+
+        # several people may add to a shared mirror at once
+        import fcntl
+        with open(os.path.join(self.directory, ".index.lock"), "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            channels = set(self.channels())
+            for (channel, subdir), packages in by_subdir.items():
+                self._update_repodata(channel, subdir, packages)
+                channels.add(channel)
+
+            # conda expects every channel to have both noarch and the platform's subdir
+            for channel in channels:
+                for subdir in ("noarch", platform_subdir()):
+                    if not os.path.exists(os.path.join(self.path(channel), subdir,
+                                                       "repodata.json")):
+                        self._update_repodata(channel, subdir, {})
+
+            atomic_write(os.path.join(self.directory, _CHANNELS_FILE),
+                         json.dumps(sorted(channels), indent=1).encode("utf-8"))
+
+    def _update_repodata(self, channel: str, subdir: str, packages: Dict[str, Dict]) -> None:
+        path = os.path.join(self.path(channel), subdir, "repodata.json")
+        try:
+            with open(path) as f:
+                repodata = json.load(f)
+        except (OSError, ValueError):
+            repodata = {"info": {"subdir": subdir}, "packages": {}, "packages.conda": {},
+                        "repodata_version": 1}
+        for fn, record in packages.items():
+            key = "packages.conda" if fn.endswith(".conda") else "packages"
+            repodata.setdefault(key, {})[fn] = record
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        atomic_write(path, json.dumps(repodata, sort_keys=True).encode("utf-8"))
@@ -0,0 +1,211 @@
+"""
+Background operations for the asynchronous CincyConda methods (CreateAsync,
+InstallAsync, updateAsync).
+
+An Operation runs a CincyConda method on its own thread so the Jupyter kernel stays
+usable. While it runs it publishes progress events (phases, lines of conda output),
+and it can be cancelled: the conda process it is waiting on is terminated and, for a
+new environment, the partially created prefix is removed. Operations can be awaited in
+a notebook cell (`await op`) or waited on with `op.result()`, and several operations
+on different environments can run at the same time.
+"""
+
+import os
+import time
+import queue
+import signal
+import shutil
+import threading
+from concurrent.futures import Future, CancelledError
+from typing import Callable, NamedTuple, Optional, Iterator
+
+from runner import kill_group
+
+_local = threading.local()
+
+
+class Event(NamedTuple):
+    """
+    A progress event. `kind` is one of 'start', 'phase', 'stdout', 'stderr', 'done',
+    'error' or 'cancelled'; `time` is seconds since the operation started.
+    """
+    kind: str
+    message: str
+    time: float
+
+
+class OperationCancelled(CancelledError):
+    """
+    Raised inside an operation (and by Operation.result) once it has been cancelled.
+    """
+
+
+def current_operation() -> Optional["Operation"]:
+    """
+    Returns the Operation running on the current thread, or None outside of one.
+    """
+    return getattr(_local, "operation", None)
+
+
+class Operation:
+    """
+    A CincyConda method running in the background. Use the CincyConda *Async methods
+    rather than creating one directly.
+
+    Parameters
+    ----------
+    description : str
+        What the operation does, eg 'Create ./.env'
+    target : callable
+        The function to run on the background thread
+    cleanup_path : str, optional
+        A prefix to delete if the operation fails or is cancelled, by default None. Only
+        pass this for a prefix that the operation itself creates.
+
+    Example Usage
+    -------------
+    >>> op = env.CreateAsync(packages=['numpy', 'pandas'])
+    >>> for event in op.events():
+    ...     print(event.kind, event.message)
+    >>> op.result()      # or, in a notebook cell: await op
+    """
+    def __init__(self,
+                 description: str,
+                 target: Callable[[], object],
+                 cleanup_path: str = None):
+        self.description = description
+        self.future = Future()
+        self._target = target
+        self._cleanup_path = cleanup_path
+        self._events = queue.Queue()
+        self._cancelled = threading.Event()
+        self._process = None
+        self._lock = threading.Lock()
+        self._started = None
+        self._thread = threading.Thread(target=self._run, name=f"cincyconda: {description}",
+                                        daemon=True)
+
+    def __repr__(self):
+        if self.future.done():
+            state = "cancelled" if self.cancelled() else \
+                "failed" if self.future.exception() else "done"
+        else:
+            state = "running"
+        return f"Operation({self.description!r}, {state})"
+
+    def __await__(self):
+        import asyncio
+        return asyncio.wrap_future(self.future).__await__()
+
+    def start(self) -> "Operation":
+        self._started = time.perf_counter()
+        self._thread.start()
+        return self
+
+    def emit(self, kind: str, message: str = "") -> None:
+        self._events.put(Event(kind, message, time.perf_counter() - self._started))
+
+    def _run(self) -> None:
+        _local.operation = self
+        self.emit("start", self.description)
+        try:
+            result = self._target()
+            if self._cancelled.is_set():
+                raise OperationCancelled(self.description)
+        except BaseException as e:
+            self._clean_up()
+            if self._cancelled.is_set():
+                self.emit("cancelled", self.description)
+                self.future.set_exception(OperationCancelled(self.description))
+            else:
+                self.emit("error", str(e))
+                self.future.set_exception(e)
+        else:
+            self.emit("done", self.description)
+            self.future.set_result(result)
+        finally:
+            _local.operation = None
+
+    def _clean_up(self) -> None:
+        if self._cleanup_path and os.path.exists(self._cleanup_path):
+            shutil.rmtree(self._cleanup_path, ignore_errors=True)
+
+    # hooks used by CincyConda._run for the commands started inside the operation
+
+    def _on_start(self, process) -> None:
+        with self._lock:
+            self._process = process
+            if self._cancelled.is_set():
+                kill_group(process, signal.SIGTERM)
+
+    def _on_line(self, stream: str, line: str) -> None:
+        self.emit(stream, line)
+
+    def check_cancelled(self) -> None:
+        """
+        Raises OperationCancelled if the operation has been cancelled. Called before
+        every command, so a cancelled operation does not start new ones.
+        """
+        if self._cancelled.is_set():
+            raise OperationCancelled(self.description)
+
+    def cancel(self) -> bool:
+        """
+        Cancels the operation: terminates the conda process it is waiting on and, for a
+        new environment, removes the partially created prefix. Returns False if the
+        operation had already finished.
+        """
+        if self.future.done():
+            return False
+        with self._lock:
+            self._cancelled.set()
+            # kill_group leaves a command that has already exited alone; poll() here
+            # could reap it behind runner.run's back
+            if self._process is not None:
+                kill_group(self._process, signal.SIGTERM)
+        return True
+
+    def cancelled(self) -> bool:
+        return isinstance(self.future.exception(), OperationCancelled) \
+            if self.future.done() else False
+
+    def done(self) -> bool:
+        return self.future.done()
+
+    def result(self, timeout: float = None):
+        """
+        Waits for the operation to finish and returns what the method returned.
+        Raises the method's exception if it failed, or OperationCancelled.
+        """
+        return self.future.result(timeout)
+
+    def events(self, timeout: float = None) -> Iterator[Event]:
+        """
+        Yields progress events as they happen, until the operation finishes.
+
+        Parameters
+        ----------
+        timeout : float, optional
+            Stop waiting if no event arrives for this many seconds, by default None
+        """
+        while True:
+            try:
+                event = self._events.get(timeout=timeout)
+            except queue.Empty:
+                return
+            yield event
+            if event.kind in ("done", "error", "cancelled"):
+                return
+
+    async def aevents(self):
+        """
+        The asynchronous version of `events`, for `async for event in op.aevents()`
+        in a notebook cell.
+        """
+        import asyncio
+        loop = asyncio.get_running_loop()
+        while True:
+            event = await loop.run_in_executor(None, self._events.get)
+            yield event
+            if event.kind in ("done", "error", "cancelled"):
+                return
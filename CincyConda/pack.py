@@ -0,0 +1,286 @@
+"""
+Packing an environment into a relocatable archive, and unpacking it somewhere else.
+
+Recreating an env on another node means solving and downloading it again. Packing
+it instead streams the env's files into a tar archive, compressed with every core
+(zstd -T0 or pigz when they are installed, the zstandard module, or single-threaded
+gzip as the last resort), and never holds more than one file in memory.
+
+Files that contain the env's own path (scripts, pkg-config files, compiled-in
+library paths) are listed in a manifest, the first member of the archive. Unpacking
+streams the archive back out and rewrites the old path to the new one in exactly
+those files: text files are rewritten freely, binary files only when the new path is
+not longer than the old one (the path is padded with NUL bytes, as conda does).
+"""
+
+import os
+import io
+import re
+import json
+import shutil
+import tarfile
+import subprocess
+from typing import Dict, List, Optional, Tuple
+
+from conda_meta import meta_dir
+
+# the first member of every archive, see the module docstring
+MANIFEST = ".cincyconda-pack.json"
+
+# bump this if the layout of the manifest changes
+_PACK_FORMAT = 1
+
+# archive extension -> compression
+_EXTENSIONS = {".tar.zst": "zstd", ".tzst": "zstd", ".tar.gz": "gzip", ".tgz": "gzip",
+               ".tar": None}
+
+# how much of a bin/ file is read to look for a #! line with the prefix in it
+_SHEBANG_BYTES = 1024
+
+
+def compression_for(archive: str) -> Optional[str]:
+    """
+    Returns the compression the archive's file name asks for: 'zstd', 'gzip' or None.
+
+    Raises
+    ------
+    AssertionError
+        If the extension is not one of .tar.zst, .tzst, .tar.gz, .tgz or .tar
+    """
+    for ext, compression in _EXTENSIONS.items():
+        if archive.endswith(ext):
+            return compression
+    raise AssertionError(f"Unknown archive type: {archive}. Please use one of the \
+following extensions: {list(_EXTENSIONS)}")
+
+
+def default_extension() -> str:
+    """
+    Returns '.tar.zst' if zstd compression is available, otherwise '.tar.gz'.
+    """
+    if shutil.which("zstd"):
+        return ".tar.zst"
+    try:
+        import zstandard  # noqa: F401
+        return ".tar.zst"
+    except ImportError:
+        return ".tar.gz"
+
+
+def prefix_files(prefix: str) -> List[Tuple[str, str]]:
+    """
+    Returns (relative path, 'text' or 'binary') for every file in the env at `prefix`
+    that contains the env's path, from the conda-meta records (`paths_data`), plus the
+    scripts in bin/ whose #! line points into the env (eg pip's entry points).
+    """
+    prefix = os.path.abspath(prefix)
+    files = {}
+    directory = meta_dir(prefix)
+    for name in sorted(os.listdir(directory)):
+        if not name.endswith(".json"):
+            continue
+        with open(os.path.join(directory, name)) as f:
+            record = json.load(f)
+        for path in record.get("paths_data", {}).get("paths", ()):
+            if path.get("prefix_placeholder"):
+                files[path["_path"]] = path.get("file_mode", "text")
+
+    shebang = b"#!" + prefix.encode("utf-8")
+    bin_dir = os.path.join(prefix, "bin")
+    try:
+        entries = list(os.scandir(bin_dir))
+    except OSError:
+        entries = []
+    for entry in entries:
+        rel = f"bin/{entry.name}"
+        if rel in files or not entry.is_file(follow_symlinks=False):
+            continue
+        try:
+            with open(entry.path, "rb") as f:
+                head = f.read(_SHEBANG_BYTES)
+        except OSError:
+            continue
+        if head.startswith(shebang):
+            files[rel] = "text"
+    return sorted(files.items())
+
+
+def _compressor(archive: str, compression: Optional[str]):
+    """
+    Returns (writable stream, process or None, close function) that compresses into
+    `archive`.
+    """
+    out = open(archive, "wb")
+    if compression is None:
+        return out, None, out.close
+
+    tool = ["zstd", "-T0", "-3", "-q", "-c"] if compression == "zstd" else ["pigz", "-c"]
+    if shutil.which(tool[0]):
+        process = subprocess.Popen(tool, stdin=subprocess.PIPE, stdout=out)
+
+        def close():
+            process.stdin.close()
+            process.wait()
+            out.close()
+            assert process.returncode == 0, \
+                f"{tool[0]} failed with exit code {process.returncode}"
+        return process.stdin, process, close
+
+    if compression == "zstd":
+        import zstandard
+        writer = zstandard.ZstdCompressor(level=3, threads=-1).stream_writer(out)
+
+        def close():
+            writer.close()
+            out.close()
+        return writer, None, close
+
+    import gzip
+    writer = gzip.GzipFile(fileobj=out, mode="wb", compresslevel=6)
+
+    def close():
+        writer.close()
+        out.close()
+    return writer, None, close
+
+
+def _decompressor(archive: str, compression: Optional[str]):
+    """
+    Returns (readable stream, close function) with the decompressed bytes of `archive`.
+    """
+    if compression is None:
+        f = open(archive, "rb")
+        return f, f.close
+
+    tool = ["zstd", "-d", "-q", "-c"] if compression == "zstd" else ["pigz", "-d", "-c"]
+    if shutil.which(tool[0]):
+        process = subprocess.Popen(tool + [archive], stdout=subprocess.PIPE)
+
+        def close():
+            process.stdout.close()
+            process.wait()
+        return process.stdout, close
+
+    f = open(archive, "rb")
+    if compression == "zstd":
+        import zstandard
+        reader = zstandard.ZstdDecompressor().stream_reader(f)
+    else:
+        import gzip
+        reader = gzip.GzipFile(fileobj=f, mode="rb")
+
+    def close():
+        reader.close()
+        f.close()
+    return reader, close
+
+
+def pack(prefix: str, archive: str) -> Dict:
+    """
+    Packs the env at `prefix` into `archive` (.tar.zst, .tar.gz or .tar).
+
+    Returns
+    -------
+    dict
+        The manifest: the env's 'prefix' and the 'files' that contain it
+    """
+    prefix = os.path.abspath(prefix)
+    manifest = {"format": _PACK_FORMAT,
+                "prefix": prefix,
+                "files": [{"path": path, "mode": mode} for path, mode in prefix_files(prefix)]}
+
+    stream, _, close = _compressor(archive, compression_for(archive))
+    try:
+        with tarfile.open(fileobj=stream, mode="w|", format=tarfile.PAX_FORMAT) as tar:
+            data = json.dumps(manifest, indent=1).encode("utf-8")
+            info = tarfile.TarInfo(MANIFEST)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+            for entry in sorted(os.listdir(prefix)):
+                tar.add(os.path.join(prefix, entry), arcname=entry, recursive=True)
+    finally:
+        close()
+    return manifest
+
+
+def _replace_binary(data: bytes, old: bytes, new: bytes) -> bytes:
+    # replace the path inside each NUL-terminated string and pad the string back to its
+    # old length, so offsets in the binary do not move
+    padding = len(old) - len(new)
+    pattern = re.compile(re.escape(old) + b"([^\0]*?)\0")
+    return pattern.sub(lambda m: new + m.group(1) + b"\0" * (padding + 1), data)
+
+
+def rewrite_prefix(path: str, mode: str, old: str, new: str) -> bool:
+    """
+    Replaces `old` with `new` in the file at `path`. Returns False if the file is
+    binary and `new` is longer than `old`, in which case it is left unchanged.
+    """
+    old_b, new_b = old.encode("utf-8"), new.encode("utf-8")
+    if mode == "binary" and len(new_b) > len(old_b):
+        return False
+    with open(path, "rb") as f:
+        data = f.read()
+    if old_b not in data:
+        return True
+    data = data.replace(old_b, new_b) if mode == "text" else _replace_binary(data, old_b, new_b)
+    st = os.stat(path)
+    tmp = path + ".cincyconda-tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.chmod(tmp, st.st_mode)
+    os.replace(tmp, path)
+    return True
+
+
+def unpack(archive: str, prefix: str) -> Dict:
+    """
+    Unpacks an archive made by `pack` into `prefix`, streaming, and rewrites the path
+    the env was packed from to `prefix`.
+
+    Returns
+    -------
+    dict
+        The manifest, plus 'skipped': the binary files that could not be rewritten
+
+    Raises
+    ------
+    AssertionError
+        If `prefix` already exists and is not empty, or the archive was not made by
+        `pack`
+    """
+    prefix = os.path.abspath(prefix)
+    assert not os.path.exists(prefix) or not os.listdir(prefix), \
+        f"Cannot unpack into {prefix}: the folder already exists and is not empty."
+    os.makedirs(prefix, exist_ok=True)
+
+    stream, close = _decompressor(archive, compression_for(archive))
+    manifest = None
+    try:
+        with tarfile.open(fileobj=stream, mode="r|") as tar:
+            for member in tar:
+                if manifest is None:
+                    assert member.name == MANIFEST, \
+                        f"{archive} was not made by CincyConda.Pack (no {MANIFEST} found)."
+                    manifest = json.load(tar.extractfile(member))
+                    continue
+                # absolute links into the old env point into the new one
+                if member.issym() and member.linkname.startswith(manifest["prefix"] + "/"):
+                    member.linkname = prefix + member.linkname[len(manifest["prefix"]):]
+                if hasattr(tarfile, "data_filter"):
+                    tar.extract(member, prefix, filter="tar")
+                else:
+                    tar.extract(member, prefix)
+    finally:
+        close()
+    assert manifest is not None, f"{archive} is empty."
+
+    skipped = []
+    if manifest["prefix"] != prefix:
+        for f in manifest["files"]:
+            path = os.path.join(prefix, f["path"])
+            if os.path.isfile(path) and not os.path.islink(path) and \
+                    not rewrite_prefix(path, f["mode"], manifest["prefix"], prefix):
+                skipped.append(f["path"])
+    manifest["skipped"] = skipped
+    return manifest
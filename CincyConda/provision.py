@@ -0,0 +1,105 @@
+"""
+Helpers for provisioning many environments at once (see CincyConda.CreateMany).
+
+Creating an environment is dominated by the solver, which is CPU and memory hungry, so
+the number of environments built at the same time is sized from the cores and memory
+each solve needs. Packages shared between the environments are downloaded once, and
+packages that are not yet extracted in the package cache are only ever extracted by
+one conda process at a time.
+"""
+
+import os
+import threading
+from typing import List, NamedTuple, Dict, Optional, Iterable
+
+# the default resources one conda solve needs
+MEMORY_PER_SOLVE = 2 * 1024 ** 3
+CORES_PER_SOLVE = 1
+
+
+class CreateResult(NamedTuple):
+    """
+    The outcome of creating one environment with CreateMany. `error` is None if the
+    environment was created, and `timings` maps each phase to seconds.
+    """
+    path: str
+    name: str
+    ok: bool
+    error: Optional[str]
+    timings: Dict[str, float]
+
+
+def available_memory() -> int:
+    """
+    Returns the memory available for new processes in bytes, from /proc/meminfo where
+    possible, otherwise the total physical memory.
+    """
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    except (ValueError, OSError, AttributeError):
+        return MEMORY_PER_SOLVE
+
+
+def default_workers(count: int,
+                    memory_per_solve: int = MEMORY_PER_SOLVE,
+                    cores_per_solve: int = CORES_PER_SOLVE) -> int:
+    """
+    Returns how many environments to build at once: as many as the cores and the
+    available memory allow, but no more than `count` and at least 1.
+    """
+    by_cores = (os.cpu_count() or 1) // max(1, cores_per_solve)
+    by_memory = available_memory() // max(1, memory_per_solve)
+    return max(1, min(count, by_cores, by_memory))
+
+
+class ExtractionLocks:
+    """
+    One lock per package that is not extracted in the package cache yet. A conda
+    process that will extract some of those packages holds their locks while it runs,
+    so two processes never extract the same package at the same time. Packages that
+    are already extracted need no lock, so environments built from a warm cache are
+    linked fully in parallel.
+
+    Parameters
+    ----------
+    is_extracted : callable
+        Called with a dist name, returns True once that package is extracted
+    """
+    def __init__(self, is_extracted):
+        self.is_extracted = is_extracted
+        self._locks = {}
+        self._guard = threading.Lock()
+
+    def _lock(self, dist: str) -> threading.Lock:
+        with self._guard:
+            return self._locks.setdefault(dist, threading.Lock())
+
+    def acquire(self, dists: Iterable[str]) -> List[threading.Lock]:
+        """
+        Acquires the locks for the packages in `dists` that still need extracting, in
+        sorted order so that two callers can never deadlock. Returns the locks held.
+        """
+        held = []
+        for dist in sorted(set(dists)):
+            if self.is_extracted(dist):
+                continue
+            lock = self._lock(dist)
+            lock.acquire()
+            if self.is_extracted(dist):
+                # another process extracted it while we waited
+                lock.release()
+            else:
+                held.append(lock)
+        return held
+
+    @staticmethod
+    def release(held: List[threading.Lock]) -> None:
+        for lock in held:
+            lock.release()
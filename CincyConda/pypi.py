@@ -0,0 +1,309 @@
+"""
+Which packages exist on PyPI, checked many at a time.
+
+`CincyConda.Request` only accepts packages that are on PyPI. Asking PyPI one name at
+a time costs a full HTTP round trip per package, so this module checks a whole list
+at once:
+
+- names are normalized as PEP 503 does ('Scikit_Learn' and 'scikit-learn' are the
+  same project), so each project is looked up once
+- answers are cached on disk, positive ones for PYPI_TTL seconds and negative ones
+  for the shorter PYPI_NEGATIVE_TTL (a missing project may be published tomorrow)
+- the remaining names are looked up concurrently, with HEAD requests to the simple
+  index (`<index>/<name>/`) over one pooled session
+
+Without network access, point CINCYCONDA_PYPI_SNAPSHOT (or `snapshot`) at a copy of
+the simple index, as written by `save_snapshot`: the PEP 691 JSON, the HTML page, or
+one project name per line. The snapshot is then the only source of answers.
+"""
+
+import os
+import re
+import json
+import time
+import threading
+from typing import Dict, FrozenSet, Iterable, List, Optional
+
+from cache import cache_dir, atomic_write
+
+PYPI_INDEX_URL = "https://pypi.org/simple"
+
+# seconds a cached "is on PyPI" / "is not on PyPI" answer is trusted
+PYPI_TTL = 24 * 60 * 60
+PYPI_NEGATIVE_TTL = 60 * 60
+
+# how many names are looked up at once, over as many pooled connections
+PYPI_WORKERS = 16
+
+# seconds to wait for the index to respond
+PYPI_TIMEOUT = 10
+
+# the PEP 691 JSON flavour of the simple index
+_JSON_ACCEPT = "application/vnd.pypi.simple.v1+json"
+
+# bump this if the layout of the cached snapshots changes
+_SNAPSHOT_FORMAT = 2
+
+# a valid project name, see PEP 508
+_NAME = re.compile(r"^([A-Za-z0-9][A-Za-z0-9._-]*[A-Za-z0-9]|[A-Za-z0-9])")
+
+# index url (and snapshot) -> PyPIIndex, so repeated calls in one process share it
+_INDEXES = {}
+
+# snapshot path -> ((mtime, size), names)
+_SNAPSHOTS = {}
+
+
+def normalize_name(name: str) -> str:
+    """
+    Returns the PEP 503 normalized form of a project name, eg 'scikit-learn' for
+    'Scikit_Learn'.
+    """
+    return re.sub(r"[-_.]+", "-", name).lower()
+
+
+def project_name(requirement: str) -> Optional[str]:
+    """
+    Returns the normalized project name of a requirement such as 'pandas>=2' or
+    'requests[socks]', or None if it does not start with a valid name.
+    """
+    match = _NAME.match(requirement.strip())
+    return normalize_name(match.group(1)) if match else None
+
+
+def _parse_snapshot(data: bytes) -> FrozenSet[str]:
+    text = data.decode("utf-8", "replace")
+    stripped = text.lstrip()
+    if stripped.startswith("{"):
+        names = (p["name"] for p in json.loads(text).get("projects", ()))
+    elif "<a" in text:
+        names = re.findall(r"<a[^>]*>([^<]+)</a>", text)
+    else:
+        names = (line.strip() for line in text.splitlines())
+    return frozenset(normalize_name(name) for name in names if name)
+
+
+def load_snapshot(path: str) -> FrozenSet[str]:
+    """
+    Returns the normalized project names in a snapshot of the simple index. Parsed
+    snapshots are kept in memory and in the cache (as JSON), keyed on the file's mtime
+    and size, since the full index has hundreds of thousands of names.
+
+    Raises
+    ------
+    AssertionError
+        If there is no file at `path`
+    """
+    path = os.path.abspath(path)
+    try:
+        st = os.stat(path)
+    except OSError:
+        raise AssertionError(f"There is no PyPI snapshot at {path}. Please write one \
+with pypi.save_snapshot('{path}').")
+    stamp = (st.st_mtime_ns, st.st_size)
+    cached = _SNAPSHOTS.get(path)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+
+    import hashlib
+    key = hashlib.sha256(path.encode("utf-8")).hexdigest()[:24]
+    parsed = os.path.join(cache_dir("pypi"), f"snapshot-{key}.json")
+    names = None
+    try:
+        with open(parsed, "rb") as f:
+            data = json.load(f)
+        if data.get("format") == _SNAPSHOT_FORMAT and data.get("stamp") == list(stamp) \
+                and all(isinstance(name, str) for name in data["names"]):
+            names = frozenset(data["names"])
+    except (OSError, ValueError, KeyError, TypeError, AttributeError):
+        pass
+
+    if names is None:
+        with open(path, "rb") as f:
+            names = _parse_snapshot(f.read())
+        atomic_write(parsed, json.dumps({"format": _SNAPSHOT_FORMAT, "stamp": list(stamp),
+                                         "names": sorted(names)}).encode("utf-8"))
+    _SNAPSHOTS[path] = (stamp, names)
+    return names
+
+
+def save_snapshot(path: str, index_url: str = None) -> int:
+    """
+    Downloads the list of every project on the index (the PEP 691 JSON page) to
+    `path`, for use as an offline snapshot. Returns the number of projects.
+    """
+    # imported here so that importing CincyConda stays cheap
+    import requests
+    index_url = (index_url or os.environ.get("CINCYCONDA_PYPI_INDEX") or PYPI_INDEX_URL)
+    response = requests.get(index_url.rstrip("/") + "/", headers={"Accept": _JSON_ACCEPT},
+                            timeout=PYPI_TIMEOUT * 30)
+    response.raise_for_status()
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    atomic_write(path, response.content)
+    return len(load_snapshot(path))
+
+
+class PyPIIndex:
+    """
+    Answers "is this project on PyPI?" for many names at once, see the module
+    docstring.
+
+    Parameters
+    ----------
+    index_url : str, optional
+        The simple index, by default $CINCYCONDA_PYPI_INDEX or PYPI_INDEX_URL
+    snapshot : str, optional
+        A snapshot of the index to use instead of the network, by default
+        $CINCYCONDA_PYPI_SNAPSHOT
+    workers : int, optional
+        How many names to look up at once, by default PYPI_WORKERS
+
+    Example Usage
+    -------------
+    >>> index = PyPIIndex()
+    >>> index.check(['pandas', 'Scikit_Learn', 'not-a-real-package-name'])
+    {'pandas': True, 'Scikit_Learn': True, 'not-a-real-package-name': False}
+    """
+    def __init__(self,
+                 index_url: str = None,
+                 snapshot: str = None,
+                 workers: int = PYPI_WORKERS):
+        self.index_url = (index_url or os.environ.get("CINCYCONDA_PYPI_INDEX")
+                          or PYPI_INDEX_URL).rstrip("/")
+        self.snapshot = snapshot or os.environ.get("CINCYCONDA_PYPI_SNAPSHOT") or None
+        self.workers = workers
+
+        import hashlib
+        key = hashlib.sha256(self.index_url.encode("utf-8")).hexdigest()[:16]
+        self.path = os.path.join(cache_dir("pypi"), f"{key}.json")
+
+        # normalized name -> [on PyPI, time checked]
+        self.answers = None
+        self._lock = threading.Lock()
+        self._session = None
+
+    def __repr__(self):
+        source = self.snapshot or self.index_url
+        return f"PyPIIndex({source!r})"
+
+    def __contains__(self, name: str) -> bool:
+        return self.check([name])[name]
+
+    def missing(self, names: Iterable[str]) -> List[str]:
+        """
+        Returns the names in `names` that are not on PyPI.
+        """
+        answers = self.check(names)
+        return [name for name, found in answers.items() if not found]
+
+    def check(self, names: Iterable[str]) -> Dict[str, bool]:
+        """
+        Returns {name: True if the project is on PyPI} for every name in `names`.
+        Names are normalized first, so each project is looked up at most once.
+
+        Raises
+        ------
+        AssertionError
+            If some names could not be looked up (eg PyPI is unreachable); the
+            answers that did come back are cached anyway
+        """
+        names = list(dict.fromkeys(names))
+        projects = {name: project_name(name) for name in names}
+
+        if self.snapshot:
+            known = load_snapshot(self.snapshot)
+            return {name: project is not None and project in known
+                    for name, project in projects.items()}
+
+        with self._lock:
+            if self.answers is None:
+                self.answers = self._load()
+            now = time.time()
+            found = {}
+            for project in set(filter(None, projects.values())):
+                answer = self.answers.get(project)
+                if answer is not None and \
+                        now - answer[1] < (PYPI_TTL if answer[0] else PYPI_NEGATIVE_TTL):
+                    found[project] = answer[0]
+
+        lookup = sorted(set(filter(None, projects.values())) - set(found))
+        if lookup:
+            looked_up, errors = self._lookup(lookup)
+            found.update(looked_up)
+            with self._lock:
+                now = time.time()
+                for project, answer in looked_up.items():
+                    self.answers[project] = [answer, now]
+                self._save(looked_up, now)
+            assert not errors, f"Could not check {sorted(errors)} on {self.index_url}: \
+{next(iter(errors.values()))}. Without network access, set CINCYCONDA_PYPI_SNAPSHOT to a \
+snapshot of the index (see pypi.save_snapshot)."
+
+        return {name: bool(project and found.get(project)) for name, project in projects.items()}
+
+    def _load(self) -> Dict[str, list]:
+        try:
+            with open(self.path) as f:
+                answers = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        return answers if isinstance(answers, dict) else {}
+
+    def _save(self, looked_up: Dict[str, bool], now: float) -> None:
+        # merge with what other processes wrote since this one loaded the file
+        answers = self._load()
+        answers.update({project: [answer, now] for project, answer in looked_up.items()})
+        atomic_write(self.path, json.dumps(answers).encode("utf-8"))
+
+    def _lookup(self, projects: List[str]):
+        """
+        Looks `projects` up on the index, several at once. Returns ({project: found},
+        {project: error}).
+        """
+        from concurrent.futures import ThreadPoolExecutor
+
+        if self._session is None:
+            # imported here so that importing CincyConda stays cheap
+            import requests
+            from requests.adapters import HTTPAdapter
+            self._session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(1, self.workers))
+            self._session.mount("http://", adapter)
+            self._session.mount("https://", adapter)
+        session = self._session
+
+        def _exists(project):
+            url = f"{self.index_url}/{project}/"
+            try:
+                response = session.head(url, allow_redirects=True, timeout=PYPI_TIMEOUT)
+                if response.status_code == 405:
+                    response = session.get(url, headers={"Accept": _JSON_ACCEPT},
+                                           timeout=PYPI_TIMEOUT, stream=True)
+                    response.close()
+                if response.status_code == 404:
+                    return False
+                response.raise_for_status()
+                return True
+            except Exception as e:
+                return e
+
+        found, errors = {}, {}
+        with ThreadPoolExecutor(max_workers=max(1, min(self.workers, len(projects)))) as pool:
+            for project, answer in zip(projects, pool.map(_exists, projects)):
+                if isinstance(answer, bool):
+                    found[project] = answer
+                else:
+                    errors[project] = answer
+        return found, errors
+
+
+def get_pypi_index(index_url: str = None, snapshot: str = None) -> PyPIIndex:
+    """
+    Returns the shared PyPIIndex for `index_url` and `snapshot`, creating it the first
+    time.
+    """
+    index = PyPIIndex(index_url, snapshot)
+    key = (index.index_url, index.snapshot)
+    if key not in _INDEXES:
+        _INDEXES[key] = index
+    return _INDEXES[key]
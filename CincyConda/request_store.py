@@ -0,0 +1,323 @@
+"""
+The shared store of package requests made with `CincyConda.Request`.
+
+Requests used to be appended to a requests.csv in the CincyPy channel. Appends from
+many analysts at once can interleave, and every question ("what is unseen?", "who
+asked for X?") meant reading the whole file. The store is a SQLite database instead:
+
+- every write is one transaction, taken with BEGIN IMMEDIATE so concurrent writers
+  queue up (for up to REQUEST_STORE_TIMEOUT seconds) instead of corrupting anything
+- a batch of requests is inserted in a single transaction
+- package, user and status are indexed, and queries are paged by id (keyset
+  pagination), so a page costs the same however many requests there are
+- an existing requests.csv is imported once; the import is recorded in the database,
+  so it never happens twice
+
+The database is shared by every analyst, so it is never per-user: it lives at
+$CINCYCONDA_REQUESTS_DB if that is set, at the configured path (REQUESTS_DB_PATH in
+CincyConda.py), or next to where requests.csv was, in the CincyPy channel folder when
+the channel is a local (file://) one. Keep it on a local disk of the server: SQLite's
+locking is not reliable over NFS.
+"""
+
+import os
+import csv
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Union
+
+# the file name of the store, and of the CSV it replaces
+REQUEST_STORE_FILE = "requests.sqlite"
+REQUESTS_CSV = "requests.csv"
+
+# seconds a write waits for other writers before giving up
+REQUEST_STORE_TIMEOUT = 30
+
+# requests per page, see RequestStore.query
+PAGE_SIZE = 100
+
+# the status of a new request
+DEFAULT_STATUS = "unseen"
+
+# bump this (and migrate in _connect) if the schema changes
+_SCHEMA_VERSION = 1
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS requests (
+    id INTEGER PRIMARY KEY,
+    user TEXT NOT NULL,
+    date TEXT NOT NULL,
+    package TEXT NOT NULL,
+    reason TEXT NOT NULL DEFAULT '',
+    status TEXT NOT NULL DEFAULT 'unseen'
+);
+CREATE INDEX IF NOT EXISTS requests_package ON requests (package, id);
+CREATE INDEX IF NOT EXISTS requests_user ON requests (user, id);
+CREATE INDEX IF NOT EXISTS requests_status ON requests (status, id);
+CREATE TABLE IF NOT EXISTS imports (
+    path TEXT PRIMARY KEY,
+    date TEXT NOT NULL,
+    count INTEGER NOT NULL
+);
+"""
+
+_COLUMNS = ("user", "date", "package", "reason", "status")
+
+
+class PackageRequest(NamedTuple):
+    id: int
+    user: str
+    date: str
+    package: str
+    reason: str
+    status: str
+
+
+def default_store_path(channel_url: str = None, path: str = None) -> str:
+    """
+    Returns where the shared request store lives: $CINCYCONDA_REQUESTS_DB, the
+    configured `path`, or the CincyPy channel folder for a file:// channel.
+
+    Raises
+    ------
+    AssertionError
+        If none of them is set, rather than keeping requests in a per-user database
+        that nobody reviews
+    """
+    path = os.environ.get("CINCYCONDA_REQUESTS_DB") or path
+    if path:
+        return path
+    if channel_url and channel_url.startswith("file://"):
+        return os.path.join(channel_url[len("file://"):], REQUEST_STORE_FILE)
+    raise AssertionError("There is no shared package request store configured. Please \
+set REQUESTS_DB_PATH in CincyConda.py (or $CINCYCONDA_REQUESTS_DB) to a database on a \
+local disk of the server.")
+
+
+def _now() -> str:
+    import datetime
+    return datetime.datetime.now().isoformat(timespec="seconds")
+
+
+class RequestStore:
+    """
+    The package requests, see the module docstring.
+
+    Parameters
+    ----------
+    path : str, optional
+        The database file, by default `default_store_path()`; created if needed
+    timeout : float, optional
+        Seconds a write waits for other writers, by default REQUEST_STORE_TIMEOUT
+
+    Example Usage
+    -------------
+    >>> store = RequestStore()
+    >>> store.add([{'user': 'jdoe', 'package': 'polars', 'reason': 'faster joins'}])
+    [1]
+    >>> store.query(status='unseen')
+    [PackageRequest(id=1, user='jdoe', date='2024-05-01T09:30:00', package='polars', ...)]
+    >>> store.set_status([1], 'approved')
+    1
+    """
+    def __init__(self, path: str = None, timeout: float = REQUEST_STORE_TIMEOUT):
+        self.path = os.path.abspath(path or default_store_path())
+        self.timeout = timeout
+        self._connection = None
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f"RequestStore({self.path!r})"
+
+    def __len__(self):
+        return self.count()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+    def _connect(self) -> "sqlite3.Connection":
+        if self._connection is None:
+            # imported here so that importing CincyConda stays cheap
+            import sqlite3
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            # autocommit mode: transactions are started explicitly, see _transaction
+            connection = sqlite3.connect(self.path, timeout=self.timeout,
+                                         isolation_level=None, check_same_thread=False)
+            if connection.execute("PRAGMA user_version").fetchone()[0] != _SCHEMA_VERSION:
+                with _transaction(connection):
+                    for statement in _SCHEMA.split(";"):
+                        if statement.strip():
+                            connection.execute(statement)
+                    connection.execute(f"PRAGMA user_version = {_SCHEMA_VERSION}")
+            self._connection = connection
+        return self._connection
+
+    def add(self, requests: Iterable[Union[Dict[str, str], PackageRequest]]) -> List[int]:
+        """
+        Adds a batch of requests in one transaction and returns their ids.
+
+        Parameters
+        ----------
+        requests : iterable of dict
+            With 'user' and 'package', and optionally 'reason', 'status' (by default
+            DEFAULT_STATUS) and 'date' (by default now)
+
+        Raises
+        ------
+        AssertionError
+            If a request has no user or package
+        """
+        now = _now()
+        rows = []
+        for request in requests:
+            if isinstance(request, tuple):
+                request = request._asdict()
+            assert request.get("user") and request.get("package"), \
+                f"A request needs a user and a package, got: {request}"
+            rows.append((request["user"], request.get("date") or now, request["package"],
+                         request.get("reason") or "", request.get("status") or DEFAULT_STATUS))
+        if not rows:
+            return []
+
+        with self._lock:
+            connection = self._connect()
+            with _transaction(connection):
+                first = connection.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM requests"
+                                           ).fetchone()[0]
+                connection.executemany(
+                    "INSERT INTO requests (id, user, date, package, reason, status) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    [(first + i,) + row for i, row in enumerate(rows)])
+        return list(range(first, first + len(rows)))
+
+    @staticmethod
+    def _where(status: str = None, package: str = None, user: str = None):
+        clauses, params = [], []
+        for column, value in (("status", status), ("package", package), ("user", user)):
+            if value is not None:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        return clauses, params
+
+    def query(self,
+              status: str = None,
+              package: str = None,
+              user: str = None,
+              after: int = 0,
+              limit: int = PAGE_SIZE) -> List[PackageRequest]:
+        """
+        Returns up to `limit` requests with an id greater than `after`, oldest first,
+        optionally only those with the given status, package and/or user. Pass the id
+        of the last request of a page as `after` to get the next page.
+        """
+        clauses, params = self._where(status, package, user)
+        clauses.append("id > ?")
+        params += [after, limit]
+        sql = f"SELECT id, user, date, package, reason, status FROM requests " \
+              f"WHERE {' AND '.join(clauses)} ORDER BY id LIMIT ?"
+        with self._lock:
+            rows = self._connect().execute(sql, params).fetchall()
+        return [PackageRequest(*row) for row in rows]
+
+    def pages(self,
+              status: str = None,
+              package: str = None,
+              user: str = None,
+              limit: int = PAGE_SIZE) -> Iterator[List[PackageRequest]]:
+        """
+        Yields every matching request, one page of up to `limit` at a time.
+        """
+        after = 0
+        while True:
+            page = self.query(status, package, user, after=after, limit=limit)
+            if not page:
+                return
+            yield page
+            after = page[-1].id
+
+    def count(self, status: str = None, package: str = None, user: str = None) -> int:
+        """
+        Returns how many requests have the given status, package and/or user.
+        """
+        clauses, params = self._where(status, package, user)
+        sql = "SELECT COUNT(*) FROM requests"
+        if clauses:
+            sql += f" WHERE {' AND '.join(clauses)}"
+        with self._lock:
+            return self._connect().execute(sql, params).fetchone()[0]
+
+    def set_status(self, ids: Iterable[int], status: str) -> int:
+        """
+        Sets the status of the requests with the given ids, in one transaction.
+        Returns how many requests were changed.
+        """
+        ids = [(status, i) for i in ids]
+        with self._lock:
+            connection = self._connect()
+            with _transaction(connection):
+                before = connection.total_changes
+                connection.executemany("UPDATE requests SET status = ? WHERE id = ?", ids)
+                return connection.total_changes - before
+
+    def import_csv(self, csv_path: str) -> int:
+        """
+        Imports the requests in a requests.csv (columns user, date, package, reason,
+        status), once: importing the same file again does nothing. Returns how many
+        requests were imported.
+        """
+        csv_path = os.path.abspath(csv_path)
+        with open(csv_path, newline="") as f:
+            rows = list(csv.reader(f))
+        if rows and [c.strip().lower() for c in rows[0]][:len(_COLUMNS)] == list(_COLUMNS):
+            rows = rows[1:]
+
+        with self._lock:
+            connection = self._connect()
+            with _transaction(connection):
+                if connection.execute("SELECT 1 FROM imports WHERE path = ?",
+                                      (csv_path,)).fetchone():
+                    return 0
+                records = []
+                for row in rows:
+                    row = (row + [""] * len(_COLUMNS))[:len(_COLUMNS)]
+                    if not row[0] or not row[2]:
+                        continue
+                    records.append((row[0], row[1] or _now(), row[2], row[3],
+                                    row[4] or DEFAULT_STATUS))
+                connection.executemany(
+                    "INSERT INTO requests (user, date, package, reason, status) "
+                    "VALUES (?, ?, ?, ?, ?)", records)
+                connection.execute("INSERT INTO imports (path, date, count) VALUES (?, ?, ?)",
+                                   (csv_path, _now(), len(records)))
+        return len(records)
+
+
+@contextmanager
+def _transaction(connection: "sqlite3.Connection"):
+    """
+    A write transaction on `connection`: BEGIN IMMEDIATE takes the write lock up front
+    (waiting for other writers), then COMMIT, or ROLLBACK if the block raises.
+    """
+    connection.execute("BEGIN IMMEDIATE")
+    try:
+        yield connection
+    except BaseException:
+        connection.execute("ROLLBACK")
+        raise
+    connection.execute("COMMIT")
+
+
+def open_store(channel_url: str = None, path: str = None) -> RequestStore:
+    """
+    Returns the request store for the CincyPy channel at `channel_url` (or at the
+    configured `path`, see default_store_path), importing the channel's requests.csv
+    the first time, if there is one.
+    """
+    store = RequestStore(default_store_path(channel_url, path))
+    legacy = os.path.join(os.path.dirname(store.path), REQUESTS_CSV)
+    if os.path.isfile(legacy):
+        store.import_csv(legacy)
+    return store
@@ -0,0 +1,206 @@
+"""
+The one place CincyConda runs external commands.
+
+`run` starts a command, streams its stdout/stderr to the notebook line by line while
+also capturing it, enforces a timeout, and returns a CommandResult with the exit code,
+the output and what the command cost: wall time, CPU time and peak memory (RSS).
+Keeping every conda call going through here means slow operations can be attributed
+to a specific command instead of guessed at.
+"""
+
+import os
+import sys
+import time
+import signal
+import threading
+import subprocess
+from typing import List, NamedTuple, Callable, Optional, Dict
+
+# the default number of seconds a command may run before it is killed (None = no limit)
+DEFAULT_TIMEOUT = None
+
+# seconds to keep reading output after the command exited, from processes it started
+# that still hold its stdout/stderr open
+OUTPUT_GRACE = 5
+
+
+class CommandResult(NamedTuple):
+    """
+    The outcome of a command started by `run`.
+
+    `cpu_time` is user + system time in seconds and `peak_rss` is the peak resident
+    memory of the command in bytes, both as reported by the OS when the command exits.
+    """
+    args: List[str]
+    returncode: int
+    stdout: str
+    stderr: str
+    wall_time: float
+    cpu_time: float
+    peak_rss: int
+    timed_out: bool
+
+    @property
+    def ok(self) -> bool:
+        return self.returncode == 0 and not self.timed_out
+
+    def summary(self) -> str:
+        """
+        A one-line description of the command and what it cost.
+        """
+        status = "timed out" if self.timed_out else f"exit {self.returncode}"
+        return (f"{' '.join(self.args)}: {status}, {self.wall_time:.2f}s wall, "
+                f"{self.cpu_time:.2f}s cpu, {self.peak_rss / 2**20:.0f} MiB peak")
+
+
+def _pump(pipe, lines: list, echo, on_line: Optional[Callable[[str, str], None]],
+          stream_name: str) -> None:
+    """
+    Reads `pipe` line by line until it closes, collecting the lines, echoing them and
+    passing them to `on_line`.
+    """
+    for line in iter(pipe.readline, ""):
+        lines.append(line)
+        if echo is not None:
+            echo.write(line)
+            echo.flush()
+        if on_line is not None:
+            on_line(stream_name, line.rstrip("\n"))
+    pipe.close()
+
+
+def kill_group(proc: subprocess.Popen, sig: int = signal.SIGKILL) -> bool:
+    """
+    Sends `sig` to a command started by `run` and to every process it started (they
+    share its process group), eg conda and the post-link scripts it runs.
+
+    Does nothing once `run` has reaped the command (`proc.exited` is set), so a pid
+    the system has since given to another process is never signalled. Use this
+    instead of proc.poll(), which would reap the command behind run's back. Returns
+    whether the signal was sent.
+    """
+    with proc.exit_lock:
+        if proc.exited.is_set():
+            return False
+        try:
+            os.killpg(proc.pid, sig)
+        except (ProcessLookupError, PermissionError):
+            return False
+        return True
+
+
+def run(args: List[str],
+        timeout: float = DEFAULT_TIMEOUT,
+        stream: bool = True,
+        env: Dict[str, str] = None,
+        cwd: str = None,
+        on_line: Callable[[str, str], None] = None,
+        on_start: Callable[[subprocess.Popen], None] = None) -> CommandResult:
+    """
+    Runs a command and returns its CommandResult.
+
+    Parameters
+    ----------
+    args : list
+        The command and its arguments, eg ['conda', 'env', 'list']. Not run through a
+        shell.
+    timeout : float, optional
+        Seconds after which the command is killed, by default DEFAULT_TIMEOUT
+    stream : bool, optional
+        Whether to print the command's output as it runs, by default True. The output
+        is captured either way.
+    env : dict, optional
+        The environment variables for the command, by default the current ones
+    cwd : str, optional
+        The working directory for the command, by default the current one
+    on_line : callable, optional
+        Called as on_line(stream, line) for every line of output, where stream is
+        'stdout' or 'stderr', by default None
+    on_start : callable, optional
+        Called with the subprocess.Popen object once the command has started, eg to be
+        able to cancel it from another thread with kill_group, by default None. Its
+        `exited` event is set once the command has exited and been reaped.
+
+    Returns
+    -------
+    CommandResult
+        The exit code, captured output and resource usage of the command. A command
+        that could not be started at all has returncode 127 and the error in stderr.
+        On a timeout, the command and every process it started are killed.
+    """
+    args = [str(a) for a in args]
+    start = time.perf_counter()
+    try:
+        proc = subprocess.Popen(args,
+                                stdout=subprocess.PIPE,
+                                stderr=subprocess.PIPE,
+                                universal_newlines=True,
+                                bufsize=1,
+                                env=env,
+                                cwd=cwd,
+                                # its own process group, so a timeout can kill the
+                                # processes it starts too, see kill_group
+                                start_new_session=True)
+    except OSError as e:
+        return CommandResult(args, 127, "", str(e), time.perf_counter() - start,
+                             0.0, 0, False)
+
+    # set (under exit_lock) once the command is reaped, see kill_group
+    proc.exited = threading.Event()
+    proc.exit_lock = threading.Lock()
+    if on_start is not None:
+        on_start(proc)
+
+    stdout, stderr = [], []
+    readers = [threading.Thread(target=_pump, daemon=True,
+                                args=(proc.stdout, stdout, sys.stdout if stream else None,
+                                      on_line, "stdout")),
+               threading.Thread(target=_pump, daemon=True,
+                                args=(proc.stderr, stderr, sys.stderr if stream else None,
+                                      on_line, "stderr"))]
+    for reader in readers:
+        reader.start()
+
+    timed_out = threading.Event()
+
+    def _kill():
+        timed_out.set()
+        kill_group(proc)
+
+    timer = None
+    if timeout is not None:
+        timer = threading.Timer(timeout, _kill)
+        timer.daemon = True
+        timer.start()
+
+    # wait for the command to exit without reaping it, so its pid (and process
+    # group) stays reserved until kill_group can no longer use it
+    try:
+        os.waitid(os.P_PID, proc.pid, os.WEXITED | os.WNOWAIT)
+    except KeyboardInterrupt:
+        # the command is in its own session, so an interrupt does not reach it
+        kill_group(proc)
+        raise
+    with proc.exit_lock:
+        if timed_out.is_set():
+            # processes started by the command may have outlived it until the kill
+            try:
+                os.killpg(proc.pid, signal.SIGKILL)
+            except (ProcessLookupError, PermissionError):
+                pass
+        # wait4 reaps the child and reports the resource usage of exactly this child
+        _, status, usage = os.wait4(proc.pid, 0)
+        proc.exited.set()
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    wall_time = time.perf_counter() - start
+    if timer is not None:
+        timer.cancel()
+    for reader in readers:
+        # a process the command left running may hold the pipes open for good
+        reader.join(OUTPUT_GRACE)
+
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak_rss = usage.ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+    return CommandResult(args, proc.returncode, "".join(stdout), "".join(stderr),
+                         wall_time, usage.ru_utime + usage.ru_stime, peak_rss,
+                         timed_out.is_set())
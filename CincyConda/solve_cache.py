@@ -0,0 +1,389 @@
+"""
+A shared cache of solver results.
+
+Most environments on the server are created from the same handful of package lists
+(usually DEFAULT_PACKAGES), so the same solve is repeated over and over. This cache
+stores the result of a solve, as a fully pinned list of package records, keyed by:
+
+- the normalized package specs that were requested, and the command (create or
+  install)
+- the fingerprint of the CincyPy channel's metadata (see ChannelIndex.fingerprint), so
+  a new package in the channel invalidates every entry made before it
+- the validators (ETag / Last-Modified, or mtime for file:// channels) of every other
+  channel the solve reads, eg `defaults` added by Setup
+- the conda configuration: the contents of every .condarc conda reads and the CONDA_*
+  environment variables, which is also what decides the channels above
+- the solver backend (conda, mamba, micromamba and their solvers differ)
+- the platform
+- for installs into an existing env, the packages already in that env
+
+Entries are single JSON files written atomically, so many users can read and write
+the cache at once. When the cache grows past `max_entries`, the least recently used
+entries are evicted. Hit/miss counters are kept per process (`hits`, `misses`) and
+for everyone in a shared `stats.json`.
+"""
+
+import os
+import json
+import time
+import glob
+import threading
+from typing import List, Dict, Any, Optional, Iterable
+
+from cache import cache_dir, atomic_write
+from channel_index import spec_name, platform_subdir, INDEX_MAX_AGE
+from explicit import conda_root
+
+# the default maximum number of cached solves
+SOLVE_CACHE_MAX_ENTRIES = 500
+
+# seconds to wait for a channel to answer a HEAD request for its repodata
+CHANNEL_CHECK_TIMEOUT = 5
+
+# conda's defaults when no configuration sets them
+DEFAULT_CHANNEL_ALIAS = "https://conda.anaconda.org"
+DEFAULT_CHANNELS = ["https://repo.anaconda.com/pkgs/main", "https://repo.anaconda.com/pkgs/r"]
+
+# CONDA_* variables that describe the shell's activation state, not the configuration
+_ACTIVATION_VARS = {"CONDA_SHLVL", "CONDA_PROMPT_MODIFIER", "CONDA_DEFAULT_ENV", "CONDA_EXE",
+                    "CONDA_PYTHON_EXE", "CONDA_ROOT"}
+
+# repodata url -> (time checked, validator or None if the channel could not be reached)
+_VALIDATORS = {}
+_VALIDATORS_LOCK = threading.Lock()
+
+
+def normalize_specs(specs: Iterable[str]) -> List[str]:
+    """
+    Returns the specs lowercased, without whitespace, deduplicated and sorted, so that
+    ['Pandas', 'numpy >=1.20', 'pandas'] and ['numpy>=1.20', 'pandas'] are the same.
+    """
+    normalized = set()
+    for spec in specs:
+        spec = "".join(spec.split())
+        name = spec_name(spec)
+        normalized.add(name + spec[len(name):])
+    return sorted(normalized)
+
+
+class SolveCache:
+    """
+    A cache of solver results in a (possibly shared) directory.
+
+    Parameters
+    ----------
+    directory : str, optional
+        Where to keep the cache, by default the 'solves' folder of the CincyConda cache
+        (see cache.cache_dir)
+    max_entries : int, optional
+        The number of solves to keep before evicting the least recently used, by
+        default SOLVE_CACHE_MAX_ENTRIES
+
+    Example Usage
+    -------------
+    >>> cache = SolveCache()
+    >>> key = cache.key(['numpy', 'pandas'], index.fingerprint(), 'linux-64')
+    >>> records = cache.get(key)
+    >>> if records is None:
+    ...     records = solve(...)
+    ...     cache.put(key, records)
+    """
+    def __init__(self,
+                 directory: str = None,
+                 max_entries: int = SOLVE_CACHE_MAX_ENTRIES):
+        self._directory = directory
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+    def __repr__(self):
+        return f"SolveCache(hits={self.hits}, misses={self.misses})"
+
+    @property
+    def directory(self) -> str:
+        # resolved on first use, so creating a SolveCache does no file system I/O
+        if self._directory is None:
+            self._directory = cache_dir("solves")
+        else:
+            os.makedirs(self._directory, exist_ok=True)
+        return self._directory
+
+    @staticmethod
+    def key(specs: Iterable[str],
+            channel_fingerprint: str,
+            platform: str,
+            installed: Iterable[str] = (),
+            command: str = "create",
+            backend: Iterable[str] = (),
+            config: str = "") -> str:
+        """
+        Returns the cache key for a solve.
+
+        Parameters
+        ----------
+        specs : iterable
+            The requested package specs
+        channel_fingerprint : str
+            The fingerprint of the channel metadata the solve used
+        platform : str
+            The conda subdir, eg 'linux-64'
+        installed : iterable, optional
+            The dist names already installed in the target env, for installs into an
+            existing env, by default ()
+        command : str, optional
+            'create' or 'install', by default 'create'
+        backend : iterable, optional
+            The backend's command line up to the specs, eg ['conda', 'create',
+            '--solver=libmamba'], by default ()
+        config : str, optional
+            The fingerprint of the conda configuration and of the other channels in the
+            solve, see config_fingerprint and channels_fingerprint, by default ''
+
+        Returns
+        -------
+        str
+            A hex digest
+        """
+        import hashlib
+        document = json.dumps({"specs": normalize_specs(specs),
+                               "channel": channel_fingerprint,
+                               "platform": platform,
+                               "installed": sorted(installed),
+                               "command": command,
+                               "backend": list(backend),
+                               "config": config}, sort_keys=True)
+        return hashlib.sha256(document.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key: str) -> Optional[List[Dict[str, Any]]]:
+        """
+        Returns the cached package records for `key`, or None on a miss.
+        """
+        path = self._path(key)
+        try:
+            with open(path) as f:
+                records = json.load(f)["records"]
+        except (OSError, ValueError, KeyError):
+            self.misses += 1
+            self._count("misses")
+            return None
+
+        # mark the entry as recently used
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        self.hits += 1
+        self._count("hits")
+        return records
+
+    def put(self, key: str, records: List[Dict[str, Any]], specs: Iterable[str] = ()) -> None:
+        """
+        Stores the package records for `key`, then evicts old entries if the cache is
+        over `max_entries`.
+        """
+        document = {"specs": normalize_specs(specs), "created": time.time(), "records": records}
+        atomic_write(self._path(key), json.dumps(document).encode("utf-8"))
+        self.evict()
+
+    def evict(self) -> int:
+        """
+        Removes the least recently used entries until the cache has at most
+        `max_entries`. Returns the number of entries removed.
+        """
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".json") and entry.name != "stats.json":
+                try:
+                    entries.append((entry.stat().st_mtime, entry.path))
+                except OSError:
+                    # removed by another process in the meantime
+                    continue
+        if len(entries) <= self.max_entries:
+            return 0
+
+        entries.sort()
+        removed = 0
+        for _, path in entries[:len(entries) - self.max_entries]:
+            try:
+                os.remove(path)
+                removed += 1
+            except OSError:
+                pass
+        return removed
+
+    def _count(self, counter: str) -> None:
+        """
+        Increments a counter in the shared stats.json, holding a lock so concurrent
+        updates from other users are not lost.
+        """
+        import fcntl
+        path = os.path.join(self.directory, "stats.json")
+        with open(os.path.join(self.directory, ".stats.lock"), "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                with open(path) as f:
+                    stats = json.load(f)
+            except (OSError, ValueError):
+                stats = {}
+            stats[counter] = stats.get(counter, 0) + 1
+            atomic_write(path, json.dumps(stats).encode("utf-8"))
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Returns the shared hit/miss counters for everyone using this cache directory,
+        along with the number of cached solves.
+        """
+        try:
+            with open(os.path.join(self.directory, "stats.json")) as f:
+                stats = json.load(f)
+        except (OSError, ValueError):
+            stats = {}
+        entries = sum(1 for e in os.scandir(self.directory)
+                      if e.name.endswith(".json") and e.name != "stats.json")
+        return {"hits": stats.get("hits", 0),
+                "misses": stats.get("misses", 0),
+                "entries": entries}
+
+
+def config_files(conda: str) -> List[str]:
+    """
+    Returns the conda configuration files that exist, in the order conda reads them
+    (later ones take precedence): the system, installation, user and $CONDA_PREFIX
+    .condarc files, the condarc.d folders, and $CONDARC.
+    """
+    home = os.path.expanduser("~")
+    xdg = os.environ.get("XDG_CONFIG_HOME") or os.path.join(home, ".config")
+    folders = ["/etc/conda", "/var/lib/conda", conda_root(conda), os.path.join(xdg, "conda"),
+               os.path.join(home, ".config", "conda"), os.path.join(home, ".conda")]
+    candidates = []
+    for folder in folders:
+        candidates += [os.path.join(folder, ".condarc"), os.path.join(folder, "condarc")]
+        candidates += sorted(glob.glob(os.path.join(folder, "condarc.d", "*.yml")) +
+                             glob.glob(os.path.join(folder, "condarc.d", "*.yaml")))
+    candidates.append(os.path.join(home, ".condarc"))
+    if os.environ.get("CONDA_PREFIX"):
+        prefix = os.environ["CONDA_PREFIX"]
+        candidates += [os.path.join(prefix, ".condarc"), os.path.join(prefix, "condarc")]
+    if os.environ.get("CONDARC"):
+        candidates.append(os.environ["CONDARC"])
+    return [path for path in dict.fromkeys(os.path.abspath(c) for c in candidates)
+            if os.path.isfile(path)]
+
+
+def config_fingerprint(conda: str) -> str:
+    """
+    Returns a hash of everything in the conda configuration that can change a solve:
+    the contents of every configuration file (see config_files) and the CONDA_*
+    environment variables.
+    """
+    import hashlib
+    digest = hashlib.sha256()
+    for path in config_files(conda):
+        try:
+            with open(path, "rb") as f:
+                digest.update(f"{path}\n".encode("utf-8") + f.read() + b"\n")
+        except OSError:
+            continue
+    for name in sorted(os.environ):
+        if name.startswith("CONDA_") and name not in _ACTIVATION_VARS and \
+                not name.startswith("CONDA_PREFIX"):
+            digest.update(f"{name}={os.environ[name]}\n".encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+def channel_urls(conda: str) -> List[str]:
+    """
+    Returns the URLs of the channels a solve without -c options reads, from the
+    `channels`, `channel_alias` and `default_channels` of the conda configuration
+    (conda's defaults where nothing sets them).
+    """
+    # imported here so that importing CincyConda stays cheap
+    from condarc import read_yaml
+
+    channels, alias, defaults = [], None, None
+    for path in config_files(conda):
+        try:
+            config = read_yaml(path)
+        except Exception:
+            continue
+        if not isinstance(config, dict):
+            continue
+        channels += [str(c) for c in config.get("channels") or ()]
+        alias = config.get("channel_alias") or alias
+        defaults = config.get("default_channels") or defaults
+    channels += [c for c in os.environ.get("CONDA_CHANNELS", "").split(",") if c.strip()]
+    if not channels:
+        channels = ["defaults"]
+
+    alias = str(alias or DEFAULT_CHANNEL_ALIAS).rstrip("/")
+    urls = []
+    for channel in channels:
+        channel = channel.strip().rstrip("/")
+        if channel == "defaults":
+            urls += [str(c).rstrip("/") for c in defaults or DEFAULT_CHANNELS]
+        elif "://" in channel:
+            urls.append(channel)
+        else:
+            urls.append(f"{alias}/{channel}")
+    return list(dict.fromkeys(urls))
+
+
+def _validator(url: str) -> Optional[str]:
+    """
+    Returns a string that changes when the repodata at `url` changes: its mtime for a
+    file:// url, the ETag / Last-Modified a HEAD request returns otherwise ('' if there
+    is none). None if the channel could not be reached.
+    """
+    if url.startswith("file://"):
+        try:
+            return str(os.stat(url[len("file://"):]).st_mtime_ns)
+        except OSError:
+            return ""
+    # imported here so that importing CincyConda stays cheap
+    import requests
+    try:
+        response = requests.head(url, allow_redirects=True, timeout=CHANNEL_CHECK_TIMEOUT)
+    except requests.RequestException:
+        return None
+    if response.status_code == 404:
+        return ""
+    if not response.ok:
+        return None
+    return f"{response.headers.get('ETag')}|{response.headers.get('Last-Modified')}"
+
+
+def channels_fingerprint(urls: Iterable[str], subdirs: Iterable[str] = None) -> Optional[str]:
+    """
+    Returns a hash of the repodata validators of every channel in `urls`, or None if
+    some channel could not be reached (then a cached solve cannot be trusted). Each
+    validator is checked at most once every INDEX_MAX_AGE seconds per process, and the
+    channels are checked concurrently.
+    """
+    import hashlib
+    from concurrent.futures import ThreadPoolExecutor
+
+    subdirs = list(subdirs or ("noarch", platform_subdir()))
+    repodata = [f"{url.rstrip('/')}/{subdir}/repodata.json"
+                for url in urls for subdir in subdirs]
+    now = time.time()
+    with _VALIDATORS_LOCK:
+        stale = [url for url in repodata
+                 if url not in _VALIDATORS or now - _VALIDATORS[url][0] >= INDEX_MAX_AGE]
+    if stale:
+        with ThreadPoolExecutor(max_workers=min(8, len(stale))) as pool:
+            checked = list(pool.map(_validator, stale))
+        with _VALIDATORS_LOCK:
+            for url, validator in zip(stale, checked):
+                _VALIDATORS[url] = (now, validator)
+
+    digest = hashlib.sha256()
+    with _VALIDATORS_LOCK:
+        for url in repodata:
+            validator = _VALIDATORS[url][1]
+            if validator is None:
+                return None
+            digest.update(f"{url}={validator}\n".encode("utf-8"))
+    return digest.hexdigest()[:16]
@@ -0,0 +1,337 @@
+"""
+Package specs and versions the way conda reads them, without importing conda.
+
+Covers the match spec forms CincyConda users write: `numpy`, `numpy=1.26` (any 1.26.x),
+`numpy==1.26.4`, `numpy>=1.24,<2`, `numpy 1.26.*`, `numpy 1.26.4 py311h64a7726_0`,
+`numpy=1.26.4=py311*`, `conda-forge::numpy`, `numpy[version=">=1.24",build=py311*]`,
+with `|` for alternatives. Versions are ordered like conda orders them, so
+`1.10 > 1.9`, `1.0a1 < 1.0 < 1.0.post1` and `2.0.dev0 < 2.0`.
+"""
+
+import re
+import fnmatch
+from functools import total_ordering
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+_TOKEN = re.compile(r"\d+|[a-z]+|\*")
+_OPERATOR_SPACES = re.compile(r"\s*(==|!=|<=|>=|~=|<|>|=|,|\|)\s*")
+_NAME = re.compile(r"^([A-Za-z0-9_.\-]+)(.*)$")
+_BRACKET = re.compile(r"\[(.*)\]\s*$")
+_BRACKET_ITEM = re.compile(
+    r"""\s*([a-z_]+)\s*=\s*(?:"([^"]*)"|'([^']*)'|([^,]*))\s*(?:,|$)""")
+
+# the conda subdirs, which conda-meta records keep at the end of their channel URL, eg
+# https://conda.anaconda.org/conda-forge/linux-64
+KNOWN_SUBDIRS = frozenset((
+    "noarch", "linux-32", "linux-64", "linux-aarch64", "linux-armv6l", "linux-armv7l",
+    "linux-ppc64", "linux-ppc64le", "linux-riscv64", "linux-s390x", "osx-64",
+    "osx-arm64", "win-32", "win-64", "win-arm64", "freebsd-64", "zos-z",
+    "emscripten-wasm32", "wasi-wasm32",
+))
+
+
+def split_subdir(channel: str) -> Tuple[str, Optional[str]]:
+    """
+    Splits a trailing subdir off a channel, eg 'conda-forge/linux-64' ->
+    ('conda-forge', 'linux-64'). The subdir is None if the channel does not end in one.
+    """
+    channel = channel.rstrip("/")
+    base, _, last = channel.rpartition("/")
+    if base and last in KNOWN_SUBDIRS:
+        return base, last
+    return channel, None
+
+
+def _segments(version: str) -> List[List[Any]]:
+    """
+    Splits a version into conda's segments: one list of numbers and strings per
+    '.'-separated part, with a 0 put in front of parts that start with a letter.
+    """
+    version = version.strip().lower()
+    epoch = 0
+    if "!" in version:
+        epoch_str, version = version.split("!", 1)
+        epoch = int(epoch_str or 0)
+    version = version.split("+", 1)[0]
+    segments = [[epoch]]
+    for part in re.split(r"[._\-]", version):
+        tokens = [int(t) if t.isdigit() else t for t in _TOKEN.findall(part)]
+        if not tokens:
+            continue
+        if isinstance(tokens[0], str) and tokens[0] != "*":
+            tokens.insert(0, 0)
+        segments.append(tokens)
+    return segments
+
+
+def _token_key(token: Any) -> Tuple[int, Any]:
+    # dev < letters < numbers < post, as in conda
+    if isinstance(token, int):
+        return (2, token)
+    if token == "dev":
+        return (0, "")
+    if token == "post":
+        return (3, "")
+    return (1, token)
+
+
+@total_ordering
+class Version:
+    """
+    A version that compares like conda's VersionOrder, eg Version('1.10') >
+    Version('1.9') and Version('1.0') == Version('1.0.0').
+    """
+    __slots__ = ("text", "segments")
+
+    def __init__(self, text: str):
+        self.text = str(text)
+        self.segments = _segments(self.text)
+
+    def __repr__(self):
+        return f"Version({self.text!r})"
+
+    def __str__(self):
+        return self.text
+
+    def _cmp(self, other: "Version") -> int:
+        a, b = self.segments, other.segments
+        for i in range(max(len(a), len(b))):
+            sa = a[i] if i < len(a) else [0]
+            sb = b[i] if i < len(b) else [0]
+            for j in range(max(len(sa), len(sb))):
+                ka = _token_key(sa[j] if j < len(sa) else 0)
+                kb = _token_key(sb[j] if j < len(sb) else 0)
+                if ka != kb:
+                    return -1 if ka < kb else 1
+        return 0
+
+    def __eq__(self, other):
+        if not isinstance(other, Version):
+            other = Version(other)
+        return self._cmp(other) == 0
+
+    def __lt__(self, other):
+        if not isinstance(other, Version):
+            other = Version(other)
+        return self._cmp(other) < 0
+
+    def __hash__(self):
+        # trailing zero segments do not change a version, so leave them out
+        segments = [tuple(s) for s in self.segments]
+        while len(segments) > 1 and segments[-1] == (0,):
+            segments.pop()
+        return hash(tuple(segments))
+
+    def startswith(self, prefix: "Version") -> bool:
+        """
+        Returns True if this version is within `prefix`, as in `1.26.*`.
+        """
+        segments = prefix.segments
+        if segments and segments[-1] == ["*"]:
+            segments = segments[:-1]
+        for i, want in enumerate(segments):
+            have = self.segments[i] if i < len(self.segments) else [0]
+            if want and want[-1] == "*":
+                if have[:len(want) - 1] != want[:-1]:
+                    return False
+            elif have != want:
+                return False
+        return True
+
+
+def _clause_matches(clause: str, version: Version) -> bool:
+    for op in ("==", "!=", "<=", ">=", "~=", "<", ">", "="):
+        if clause.startswith(op):
+            target = clause[len(op):]
+            break
+    else:
+        op, target = "", clause
+
+    if target in ("", "*"):
+        return True
+    if op in ("", "==") and not target.endswith("*"):
+        return version == Version(target)
+    if op in ("", "==", "="):
+        return version.startswith(Version(target.rstrip("*").rstrip(".") + ".*"))
+    if op == "!=":
+        return not version.startswith(Version(target)) if target.endswith("*") \
+            else version != Version(target)
+    if op == "~=":
+        # ~=1.4.5 means >=1.4.5 and 1.4.*
+        target_version = Version(target)
+        prefix = Version(".".join(target.split(".")[:-1]) + ".*")
+        return version >= target_version and version.startswith(prefix)
+    target_version = Version(target.rstrip("*").rstrip("."))
+    return {"<": version < target_version, ">": version > target_version,
+            "<=": version <= target_version, ">=": version >= target_version}[op]
+
+
+def version_matches(expression: Optional[str], version: str) -> bool:
+    """
+    Returns True if `version` satisfies a conda version expression, eg '>=1.24,<2'
+    or '1.26.*|2.0.*'. An empty expression matches every version.
+    """
+    if not expression:
+        return True
+    v = Version(version)
+    return any(all(_clause_matches(clause, v) for clause in alternative.split(",") if clause)
+               for alternative in expression.split("|"))
+
+
+class Spec(NamedTuple):
+    """
+    A parsed match spec. `version` and `build` are None when the spec does not
+    constrain them; `text` is the spec as it was written.
+    """
+    name: str
+    version: Optional[str]
+    build: Optional[str]
+    channel: Optional[str]
+    text: str
+
+    def matches(self, record: Dict[str, Any]) -> bool:
+        """
+        Returns True if a package record (eg from conda-meta) satisfies this spec.
+        """
+        if record.get("name", "").lower() != self.name:
+            return False
+        if not version_matches(self.version, record.get("version", "")):
+            return False
+        if self.build and not fnmatch.fnmatchcase(record.get("build", ""), self.build):
+            return False
+        if self.channel:
+            # conda-meta keeps the subdir in the channel, eg .../conda-forge/linux-64
+            channel, subdir = split_subdir(record.get("channel") or "")
+            want, want_subdir = split_subdir(self.channel)
+            if channel != want and not channel.endswith("/" + want):
+                return False
+            if want_subdir and want_subdir != (record.get("subdir") or subdir):
+                return False
+        return True
+
+
+def _bracket_fields(text: str, spec: str) -> Dict[str, str]:
+    """
+    Parses the key=value pairs of a spec's brackets, eg 'version=">=1.2",build=py*'.
+    """
+    fields, pos = {}, 0
+    while pos < len(text):
+        item = _BRACKET_ITEM.match(text, pos)
+        assert item and item.end() > pos, f"Could not read the package spec: '{spec}'"
+        key = item.group(1)
+        value = next(v for v in item.groups()[1:] if v is not None)
+        fields[key] = value.strip()
+        pos = item.end()
+    return fields
+
+
+def parse_spec(text: str) -> Spec:
+    """
+    Parses a conda match spec, eg 'numpy>=1.24,<2', 'conda-forge::pandas=2.1' or
+    'numpy[version=">=1.24",build=py311*]'. Keys in brackets other than version, build,
+    channel and subdir are ignored.
+
+    Raises
+    ------
+    AssertionError
+        If `text` does not start with a package name, or its brackets cannot be read
+    """
+    rest = text.strip()
+    channel = None
+    if "::" in rest:
+        channel, rest = rest.split("::", 1)
+        channel = channel.rstrip("/")
+
+    match = _NAME.match(rest)
+    assert match, f"Could not read the package spec: '{text}'"
+    name, rest = match.group(1).lower(), match.group(2)
+
+    fields = {}
+    bracket = _BRACKET.search(rest)
+    if bracket:
+        fields = _bracket_fields(bracket.group(1), text)
+        rest = rest[:bracket.start()]
+    rest = _OPERATOR_SPACES.sub(r"\1", rest).strip()
+
+    version = build = None
+    if rest.startswith("=") and not rest.startswith("=="):
+        # name=1.2 (any 1.2.x) or name=1.2.3=build
+        parts = rest[1:].split("=", 1)
+        version = parts[0].rstrip("*").rstrip(".") + ".*" if parts[0] else None
+        if len(parts) > 1:
+            version = "==" + parts[0]
+            build = parts[1] or None
+    elif rest:
+        parts = rest.split()
+        version = parts[0]
+        build = parts[1] if len(parts) > 1 else None
+
+    if fields.get("version"):
+        version = re.sub(r"\s+", "", _OPERATOR_SPACES.sub(r"\1", fields["version"]))
+    if fields.get("build"):
+        build = fields["build"]
+    if fields.get("channel"):
+        channel = fields["channel"].rstrip("/")
+    if fields.get("subdir") and channel and split_subdir(channel)[1] is None:
+        channel = f"{channel}/{fields['subdir']}"
+    return Spec(name, version, build, channel, text.strip())
+
+
+class SyncPlan(NamedTuple):
+    """
+    The changes that make an environment match a list of specs: specs to `add` (not
+    installed), specs to `change` (installed, but not matching) and package names to
+    `remove`.
+    """
+    add: List[Spec]
+    change: List[Spec]
+    remove: List[str]
+
+    def __bool__(self):
+        return bool(self.add or self.change or self.remove)
+
+
+def sync_plan(records: List[Dict[str, Any]], specs: List[str], prune: bool = False) -> SyncPlan:
+    """
+    Compares the installed package records of an env (see conda_meta.read_records)
+    with the specs it should satisfy.
+
+    Parameters
+    ----------
+    records : list
+        The installed package records
+    specs : list
+        The match specs the env should satisfy
+    prune : bool, optional
+        Whether packages that no spec needs, directly or as a dependency, should be
+        removed, by default False
+
+    Returns
+    -------
+    SyncPlan
+        Empty (falsy) if the env already matches
+    """
+    installed = {r["name"].lower(): r for r in records}
+    add, change = [], []
+    wanted = {}
+    for text in specs:
+        spec = parse_spec(text)
+        wanted[spec.name] = spec
+    for name, spec in wanted.items():
+        if name not in installed:
+            add.append(spec)
+        elif not spec.matches(installed[name]):
+            change.append(spec)
+
+    remove = []
+    if prune:
+        keep, stack = set(), [name for name in wanted if name in installed]
+        while stack:
+            name = stack.pop()
+            if name in keep:
+                continue
+            keep.add(name)
+            stack.extend(d.split()[0].lower() for d in installed[name].get("depends", ())
+                         if d.split()[0].lower() in installed)
+        remove = sorted(name for name in installed if name not in keep)
+    return SyncPlan(add, change, remove)
@@ -0,0 +1,236 @@
+"""
+Checking that the files of an environment are still what conda installed.
+
+Every package record in `<prefix>/conda-meta` lists the files the package installed,
+with their size and sha256 in `paths_data`. `verify` checks them, package by package,
+on a thread pool (hashing and stat calls release the GIL):
+
+- quick mode stats every file: missing files, files whose size differs from the
+  record (eg truncated when a quota ran out), and files modified after conda linked
+  the package
+- full mode also hashes every file with large sequential reads and compares the
+  sha256 (`sha256_in_prefix` for files conda rewrote the prefix in)
+
+Problems are grouped by package, and the report says which packages to reinstall.
+"""
+
+import os
+import json
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from conda_meta import meta_dir
+
+# how many packages are checked at once
+VERIFY_WORKERS = 16
+
+# bytes read at a time while hashing
+_HASH_CHUNK = 4 * 1024 * 1024
+
+# a file modified within this many seconds after its record was written still counts
+# as installed by conda
+_MTIME_SLACK = 5
+
+# the kinds of problem, from worst to least bad
+PROBLEM_KINDS = ("missing", "size", "hash", "modified")
+
+
+class Problem(NamedTuple):
+    package: str
+    path: str
+    kind: str
+
+
+class EnvReport(NamedTuple):
+    """
+    The result of verifying one env: how many `packages` and `files` were checked,
+    and the `problems` found.
+    """
+    prefix: str
+    packages: int
+    files: int
+    problems: List[Problem]
+
+    @property
+    def ok(self) -> bool:
+        return not self.problems
+
+    def broken_packages(self) -> List[str]:
+        """
+        Returns the packages to reinstall: those with missing or changed files.
+        """
+        return sorted({p.package for p in self.problems})
+
+    def repair_command(self, conda: str = "conda") -> List[str]:
+        """
+        Returns the conda command that reinstalls the broken packages, exactly as
+        they were, or [] if there is nothing to repair.
+        """
+        packages = self.broken_packages()
+        if not packages:
+            return []
+        return [conda, "install", "-y", "-p", self.prefix, "--force-reinstall",
+                "--no-deps", *packages]
+
+    def summary(self) -> str:
+        """
+        Returns a one-line summary, eg '/path/.env: 3 problems in 2 packages (missing
+        2, size 1)'.
+        """
+        if self.ok:
+            return f"{self.prefix}: OK ({self.files} files in {self.packages} packages)"
+        counts = {kind: 0 for kind in PROBLEM_KINDS}
+        for problem in self.problems:
+            counts[problem.kind] += 1
+        kinds = ", ".join(f"{kind} {n}" for kind, n in counts.items() if n)
+        return f"{self.prefix}: {len(self.problems)} problems in " \
+               f"{len(self.broken_packages())} packages ({kinds})"
+
+
+def sha256_file(path: str) -> str:
+    """
+    Returns the sha256 of the file at `path`, read in large sequential chunks into
+    one reused buffer.
+    """
+    import hashlib
+    digest = hashlib.sha256()
+    buffer = bytearray(_HASH_CHUNK)
+    view = memoryview(buffer)
+    with open(path, "rb", buffering=0) as f:
+        if hasattr(os, "posix_fadvise"):
+            try:
+                os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+            except OSError:
+                pass
+        while True:
+            n = f.readinto(buffer)
+            if not n:
+                break
+            digest.update(view[:n])
+    return digest.hexdigest()
+
+
+def _check_path(prefix: str,
+                path: Dict,
+                installed: float,
+                full: bool) -> Optional[str]:
+    """
+    Returns the kind of problem with one paths_data entry, or None if it is fine.
+    """
+    full_path = os.path.join(prefix, path["_path"])
+    path_type = path.get("path_type", "hardlink")
+    try:
+        st = os.stat(full_path, follow_symlinks=False)
+    except OSError:
+        return "missing"
+    if path_type == "directory" or path_type == "softlink":
+        return None
+
+    # files conda rewrote the prefix in only have a known hash if conda recorded it,
+    # and text files change size
+    rewritten = bool(path.get("prefix_placeholder"))
+    expected_size = path.get("size_in_bytes")
+    if expected_size is not None and path_type == "hardlink" and \
+            not (rewritten and path.get("file_mode", "text") == "text") and \
+            st.st_size != expected_size:
+        return "size"
+
+    if path_type != "hardlink":
+        return None
+    expected = path.get("sha256_in_prefix") if rewritten else path.get("sha256")
+    if full and expected:
+        return "hash" if sha256_file(full_path) != expected else None
+    # without a hash to compare, a file written after the package was linked has
+    # been changed by something else
+    if st.st_mtime > installed + _MTIME_SLACK and not rewritten:
+        return "modified"
+    return None
+
+
+def verify_package(prefix: str,
+                   record_path: str,
+                   full: bool = False) -> Tuple[List[Problem], int]:
+    """
+    Checks the files of the package whose conda-meta record is at `record_path`.
+    Returns (the problems found, the number of files checked).
+    """
+    try:
+        with open(record_path) as f:
+            record = json.load(f)
+        installed = os.stat(record_path).st_mtime
+    except (OSError, ValueError):
+        return [Problem(os.path.basename(record_path)[:-len(".json")],
+                        os.path.relpath(record_path, prefix), "missing")], 0
+
+    package = f"{record.get('name')}={record.get('version')}={record.get('build')}"
+    paths = {p["_path"]: p for p in record.get("paths_data", {}).get("paths", ())}
+    # the installer only lists the special files in paths_data, the rest are only
+    # known by name
+    for rel in record.get("files", ()):
+        paths.setdefault(rel, {"_path": rel})
+
+    problems = []
+    for rel, path in paths.items():
+        kind = _check_path(prefix, path, installed, full)
+        if kind is not None:
+            problems.append(Problem(package, rel, kind))
+    return problems, len(paths)
+
+
+def _records(prefix: str) -> List[str]:
+    directory = meta_dir(prefix)
+    try:
+        return sorted(entry.path for entry in os.scandir(directory)
+                      if entry.name.endswith(".json"))
+    except OSError:
+        return []
+
+
+def verify(prefixes: Iterable[str],
+           full: bool = False,
+           workers: int = VERIFY_WORKERS) -> Iterator[EnvReport]:
+    """
+    Verifies every env in `prefixes` and yields one EnvReport per env, in order.
+
+    The packages of all the envs go through one thread pool, so the pool stays busy
+    from one env to the next, but only a bounded number of packages are queued at
+    any time, so a large fleet is never listed in memory all at once.
+
+    Parameters
+    ----------
+    prefixes : iterable of str
+        The envs
+    full : bool, optional
+        Hash every file instead of only checking sizes and mtimes, by default False
+    workers : int, optional
+        How many packages to check at once, by default VERIFY_WORKERS
+    """
+    from collections import deque
+    from concurrent.futures import ThreadPoolExecutor
+
+    workers = max(1, workers)
+    # (prefix, future) for every package queued, then (prefix, None) once all of the
+    # env's packages are queued; FIFO, so envs finish in order
+    pending = deque()
+    totals = {}
+
+    def _drain(limit):
+        while len(pending) > limit:
+            prefix, future = pending.popleft()
+            if future is None:
+                packages, files, problems = totals.pop(prefix)
+                yield EnvReport(prefix, packages, files, problems)
+                continue
+            problems, files = future.result()
+            totals[prefix][1] += files
+            totals[prefix][2] += problems
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for prefix in dict.fromkeys(os.path.abspath(p) for p in prefixes):
+            records = _records(prefix)
+            totals[prefix] = [len(records), 0, []]
+            for record_path in records:
+                pending.append((prefix, pool.submit(verify_package, prefix, record_path,
+                                                    full)))
+                yield from _drain(4 * workers)
+            pending.append((prefix, None))
+        yield from _drain(0)
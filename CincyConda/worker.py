@@ -0,0 +1,811 @@
+"""
+A long-lived worker process that runs conda commands for every notebook of a user.
+
+Each conda command started from a notebook pays for a new Python process: importing
+conda, loading its plugins and context, and reading the channels' repodata, before
+the actual work starts. That is most of the time of a small install. The worker
+pays for it once: it imports conda's Python API at start and runs the commands it is
+sent in its own process, where conda keeps the repodata it has loaded in memory
+(SubdirData) from one command to the next.
+
+- notebooks reach the worker over a Unix socket in a folder only the user can open
+  ($XDG_RUNTIME_DIR, or /tmp/cincyconda-<uid>), one socket per conda installation.
+  Both sides refuse a folder or socket that is not the user's own and private, and
+  the peer of every connection must be the same user (SO_PEERCRED, where the
+  platform has it), so commands and their environment never cross to another user
+- the protocol is JSON lines: one request, then the command's output line by line,
+  then one result
+- commands are queued and run in order; conda's global context means only one runs
+  in the process at a time, and every command holds a lock on the prefix it changes
+- the worker also answers environment discovery from its own warm cache, see
+  envs.discover_envs
+
+The worker is opt-in: `CincyConda._run` of an object created with `worker=True` (or
+that called StartWorker) sends the solving commands (create, install, update,
+remove, env) to the worker when it is running, and runs them as subprocesses
+otherwise. Commands with a timeout, and those of background
+operations (which can be cancelled), always run as subprocesses: a command running in
+the worker's process can be neither killed nor cancelled.
+
+Each command carries the client's environment variables and working directory. In
+subprocess mode they are passed to the subprocess. In-process, conda reads them from
+the process, so they are swapped into os.environ and the cwd for the duration of the
+command, on the one thread that runs commands; every other thread of the worker uses
+the environment it was started with (see Worker.environ), never the live one.
+
+If the conda API cannot be imported (eg the worker was started with another Python
+than the conda installation's), the worker still queues and locks, but runs every
+command as a subprocess, WORKER_THREADS at a time.
+
+Usage
+-----
+    python worker.py --conda /path/to/bin/conda [--subprocess] [--socket PATH]
+
+or `CincyConda.StartWorker()` / `CincyConda.StopWorker()` from a notebook.
+"""
+
+import os
+import sys
+import json
+import stat
+import time
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+from runner import run, CommandResult
+from explicit import conda_root
+from envs import CondaEnv, discover_envs, envs_dirs
+
+# conda subcommands that are sent to the worker
+WORKER_COMMANDS = {"create", "install", "update", "remove", "env"}
+
+# commands run at once when the worker runs them as subprocesses
+WORKER_THREADS = 4
+
+# seconds a client waits to connect, and StartWorker waits for a new worker
+WORKER_CONNECT_TIMEOUT = 2
+WORKER_START_TIMEOUT = 60
+
+# the environment variables discover_envs depends on; the worker only answers
+# discovery for clients that have the same ones
+_DISCOVERY_VARS = ("HOME", "CONDA_ENVS_DIRS", "CONDA_ENVS_PATH")
+
+# the longest request line a worker reads
+_MAX_REQUEST = 16 * 1024 * 1024
+
+
+def socket_path(conda: str) -> str:
+    """
+    Returns the path of the worker socket for the conda installation at `conda`:
+    $CINCYCONDA_WORKER_SOCKET, or a socket named after the installation in the
+    user's runtime folder.
+    """
+    path = os.environ.get("CINCYCONDA_WORKER_SOCKET")
+    if path:
+        return path
+    import hashlib
+    key = hashlib.sha256(conda_root(conda).encode("utf-8")).hexdigest()[:12]
+    runtime = os.environ.get("XDG_RUNTIME_DIR")
+    if not runtime or not os.path.isdir(runtime):
+        runtime = os.path.join("/tmp", f"cincyconda-{os.getuid()}")
+    return os.path.join(runtime, f"cincyconda-worker-{key}.sock")
+
+
+def _private_dir_error(directory: str) -> Optional[str]:
+    """
+    Returns why `directory` may not hold a worker socket, or None if it is a real
+    folder owned by this user that no one else can open.
+    """
+    try:
+        st = os.lstat(directory)
+    except OSError as e:
+        return f"{directory}: {e.strerror}"
+    if not stat.S_ISDIR(st.st_mode):
+        return f"{directory} is not a folder"
+    if st.st_uid != os.getuid():
+        return f"{directory} belongs to another user"
+    if st.st_mode & 0o077:
+        return f"other users can open {directory} (mode {stat.S_IMODE(st.st_mode):o})"
+    return None
+
+
+def _socket_error(path: str) -> Optional[str]:
+    """
+    Returns why the worker socket at `path` may not be trusted, or None if it is this
+    user's own socket, in a private folder, that no one else can connect to.
+    """
+    error = _private_dir_error(os.path.dirname(os.path.abspath(path)))
+    if error:
+        return error
+    try:
+        st = os.lstat(path)
+    except OSError as e:
+        return f"{path}: {e.strerror}"
+    if not stat.S_ISSOCK(st.st_mode):
+        return f"{path} is not a socket"
+    if st.st_uid != os.getuid():
+        return f"{path} belongs to another user"
+    if st.st_mode & 0o077:
+        return f"other users can connect to {path} (mode {stat.S_IMODE(st.st_mode):o})"
+    return None
+
+
+def _peer_uid(sock) -> Optional[int]:
+    """
+    Returns the user id of the process at the other end of a Unix socket, or None on
+    platforms without SO_PEERCRED (where the private folder is the only check).
+    """
+    import socket
+    import struct
+    option = getattr(socket, "SO_PEERCRED", None)
+    if option is None:
+        return None
+    size = struct.calcsize("3i")
+    _, uid, _ = struct.unpack("3i", sock.getsockopt(socket.SOL_SOCKET, option, size))
+    return uid
+
+
+def target_prefix(args: List[str], root: str, cwd: str,
+                  environ: Dict[str, str] = None) -> Optional[str]:
+    """
+    Returns the prefix a conda command changes, from its -p/--prefix or -n/--name
+    option, or None if it names none. Relative paths are taken from `cwd` and the
+    envs dirs from `environ` (the command's, rather than this process's).
+    """
+    prefix = name = None
+    for i, arg in enumerate(args):
+        value = args[i + 1] if i + 1 < len(args) else None
+        if arg in ("-p", "--prefix"):
+            prefix = value
+        elif arg.startswith("--prefix="):
+            prefix = arg[len("--prefix="):]
+        elif arg in ("-n", "--name"):
+            name = value
+        elif arg.startswith("--name="):
+            name = arg[len("--name="):]
+    if prefix:
+        return os.path.normpath(os.path.join(cwd, os.path.expanduser(prefix)))
+    if name:
+        if name == "base":
+            return root
+        return os.path.join(envs_dirs(root, environ or {}, cwd)[0], name)
+    return None
+
+
+def _exit_code(code) -> int:
+    if code is None:
+        return 0
+    return code if isinstance(code, int) else 1
+
+
+class _Terminated(BaseException):
+    """
+    Raised on the main thread when the worker is sent SIGTERM. It is neither an
+    Exception nor a SystemExit, so a command running in-process does not take it for
+    its own exit.
+    """
+
+
+class _LineWriter:
+    """
+    A text stream that passes every complete line to `emit(stream, line)` and keeps
+    all the text, used as sys.stdout / sys.stderr while conda runs in the worker.
+    """
+    encoding = "utf-8"
+    errors = "replace"
+
+    def __init__(self, name: str, emit: Callable[[str, str], None]):
+        self.name = name
+        self.emit = emit
+        self.parts = []
+        self._pending = ""
+
+    def write(self, text: str) -> int:
+        self.parts.append(text)
+        lines = (self._pending + text).split("\n")
+        self._pending = lines.pop()
+        for line in lines:
+            self.emit(self.name, line)
+        return len(text)
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        if self._pending:
+            self.emit(self.name, self._pending)
+            self._pending = ""
+
+    def isatty(self) -> bool:
+        return False
+
+    def writable(self) -> bool:
+        return True
+
+    @property
+    def text(self) -> str:
+        return "".join(self.parts)
+
+
+class _Job:
+    def __init__(self, args: List[str], env: Dict[str, str], cwd: str, prefix: Optional[str],
+                 emit: Callable[[str, str], None]):
+        self.args = args
+        self.env = env
+        self.cwd = cwd
+        self.prefix = prefix
+        self.emit = emit
+        self.result = None
+        self.done = threading.Event()
+
+
+class Worker:
+    """
+    The worker side: a queue of conda commands and the threads that run them. See
+    the module docstring.
+
+    Parameters
+    ----------
+    conda : str
+        The conda executable the worker runs commands for
+    in_process : bool, optional
+        Run commands with conda's Python API in this process, by default when this
+        Python belongs to the conda installation at `conda`
+    """
+    def __init__(self, conda: str, in_process: bool = None):
+        self.conda = conda
+        self.root = conda_root(conda)
+
+        # the worker's own environment and folder, read once here: while a command
+        # runs in-process, os.environ and the cwd are the command's
+        self.environ = dict(os.environ)
+        self.cwd = os.getcwd()
+        if in_process is None:
+            in_process = os.path.realpath(sys.prefix) == os.path.realpath(self.root)
+        if in_process:
+            import importlib
+            try:
+                # the conda API, and the commands the worker runs
+                for module in ("main", "main_create", "main_install", "main_update",
+                               "main_remove", "main_env"):
+                    importlib.import_module(f"conda.cli.{module}")
+            except ImportError:
+                in_process = False
+        self.in_process = in_process
+        self.started = time.time()
+        self.served = 0
+        self.stopping = False
+        # the signal the worker was stopped with, see terminate
+        self.terminated = None
+
+        # the queue, and prefix -> lock for the prefixes being changed
+        import queue
+        self.jobs = queue.Queue()
+        self._locks = {}
+        self._locks_lock = threading.Lock()
+
+        # held while a command runs in-process, ie while os.environ is not the worker's
+        self._process_state = threading.Lock()
+
+    def status(self) -> dict:
+        return {"conda": self.conda, "pid": os.getpid(), "in_process": self.in_process,
+                "started": self.started, "served": self.served,
+                "queued": self.jobs.qsize()}
+
+    def warm_up(self) -> None:
+        """
+        Loads conda's plugins and context, as the first command would.
+        """
+        if self.in_process:
+            self._run_in_process(_Job([self.conda, "info", "--json"], self.environ,
+                                      self.cwd, None, lambda stream, line: None))
+            if self.terminated is not None:
+                # caught by conda's exception handler, see serve_jobs
+                raise _Terminated(self.terminated)
+
+    def submit(self, args: List[str], env: Dict[str, str], cwd: str,
+               emit: Callable[[str, str], None]) -> Optional[dict]:
+        """
+        Queues a command, waits for it to run and returns its result, or None if the
+        worker is stopping.
+        """
+        job = _Job(args, env, cwd, target_prefix(args[1:], self.root, cwd, env), emit)
+        with self._locks_lock:
+            if self.stopping:
+                return None
+            self.jobs.put(job)
+        job.done.wait()
+        return job.result
+
+    def stop(self, threads: int) -> None:
+        """
+        Lets the `threads` threads running serve_jobs return once the commands
+        already queued have run. Commands submitted from now on are refused.
+        """
+        with self._locks_lock:
+            if self.stopping:
+                return
+            self.stopping = True
+            for _ in range(threads):
+                self.jobs.put(None)
+
+    def terminate(self, signum: int, frame) -> None:
+        """
+        The SIGTERM handler: interrupts the command running in-process, which is then
+        reported as failed with -signum, and stops the worker.
+        """
+        self.terminated = signum
+        raise _Terminated(signum)
+
+    def _prefix_lock(self, prefix: Optional[str]) -> threading.Lock:
+        with self._locks_lock:
+            return self._locks.setdefault(prefix, threading.Lock())
+
+    def serve_jobs(self) -> None:
+        """
+        Runs queued commands until a None is queued.
+        """
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                return
+            start = time.perf_counter()
+            with self._prefix_lock(job.prefix):
+                try:
+                    job.result = self._run_in_process(job) if self.in_process \
+                        else self._run_subprocess(job)
+                    if self.terminated is not None:
+                        # conda's own exception handler catches everything, the
+                        # exception terminate raised included
+                        raise _Terminated(self.terminated)
+                except _Terminated:
+                    job.result = {"returncode": -self.terminated, "stdout": "",
+                                  "stderr": f"The CincyConda worker was stopped (signal "
+                                            f"{self.terminated}) while the command ran.\n",
+                                  "cpu_time": 0.0, "peak_rss": 0}
+                    job.done.set()
+                    raise
+                except Exception as e:
+                    job.result = {"returncode": 1, "stdout": "", "stderr": f"{e}\n",
+                                  "cpu_time": 0.0, "peak_rss": 0}
+            self.served += 1
+            job.done.set()
+            print(f"{time.strftime('%H:%M:%S')} {' '.join(job.args[1:3])} "
+                  f"{job.prefix or ''}: exit {job.result['returncode']} in "
+                  f"{time.perf_counter() - start:.2f}s", file=sys.__stderr__, flush=True)
+
+    def _run_subprocess(self, job: _Job) -> dict:
+        result = run(job.args, stream=False, env=job.env, cwd=job.cwd, on_line=job.emit)
+        return {"returncode": result.returncode, "stdout": result.stdout,
+                "stderr": result.stderr, "cpu_time": result.cpu_time,
+                "peak_rss": result.peak_rss}
+
+    def _run_in_process(self, job: _Job) -> dict:
+        import resource
+        from contextlib import redirect_stdout, redirect_stderr
+        from conda.cli.main import main
+
+        stdout, stderr = _LineWriter("stdout", job.emit), _LineWriter("stderr", job.emit)
+        self._process_state.acquire()
+        cpu = time.thread_time()
+        try:
+            # conda reads its settings from the environment and the working directory,
+            # so the command gets the client's. Only this thread changes them, and the
+            # others never read them (see Worker.environ)
+            os.environ.clear()
+            os.environ.update(job.env)
+            os.chdir(job.cwd)
+            with redirect_stdout(stdout), redirect_stderr(stderr):
+                try:
+                    code = _exit_code(main(*job.args[1:]))
+                except SystemExit as e:
+                    code = _exit_code(e.code)
+                except Exception:
+                    # conda reports its own errors, this is anything it did not catch
+                    import traceback
+                    traceback.print_exc()
+                    code = 1
+        finally:
+            stdout.close()
+            stderr.close()
+            os.environ.clear()
+            os.environ.update(self.environ)
+            os.chdir(self.cwd)
+            self._process_state.release()
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        # ru_maxrss is in kilobytes on Linux and bytes on macOS; it is the worker's peak
+        return {"returncode": code, "stdout": stdout.text, "stderr": stderr.text,
+                "cpu_time": time.thread_time() - cpu,
+                "peak_rss": usage.ru_maxrss * (1 if sys.platform == "darwin" else 1024)}
+
+    def envs(self, env: Dict[str, str], refresh: bool) -> Optional[List[Tuple[str, str]]]:
+        """
+        Returns the discovered envs, or None if the client's environment would find
+        different ones than the worker's, or a command is running in-process (discovery
+        reads os.environ, which is then the command's): the client looks itself.
+        """
+        if any(env.get(var) != self.environ.get(var) for var in _DISCOVERY_VARS):
+            return None
+        if not self._process_state.acquire(blocking=False):
+            return None
+        try:
+            return [list(e) for e in discover_envs(self.conda, refresh=refresh)]
+        finally:
+            self._process_state.release()
+
+
+def _handler(worker: Worker, stop: Callable[[], None]):
+    import socketserver
+
+    class _Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            try:
+                request = json.loads(self.rfile.readline(_MAX_REQUEST))
+            except ValueError:
+                return
+            op = request.get("op")
+            if op == "ping":
+                self._send({"result": worker.status()})
+            elif op == "envs":
+                self._send({"result": worker.envs(request.get("env") or {},
+                                                  bool(request.get("refresh")))})
+            elif op == "shutdown":
+                self._send({"result": worker.status()})
+                stop()
+            elif op == "run":
+                self._run(request)
+            else:
+                self._send({"error": f"unknown op {op!r}"})
+
+        def _run(self, request):
+            args = [str(a) for a in request.get("args") or ()]
+            if len(args) < 2 or conda_root(args[0]) != worker.root:
+                self._send({"error": f"not a command of {worker.conda}: {args[:2]}"})
+                return
+            lost = []
+
+            def _emit(stream, line):
+                if not lost:
+                    try:
+                        self._send({"stream": stream, "line": line})
+                    except OSError:
+                        # the client is gone, but the command runs to the end anyway
+                        lost.append(True)
+
+            result = worker.submit(args, request.get("env") or worker.environ,
+                                   request.get("cwd") or worker.cwd, _emit)
+            if result is None:
+                # stopping: the client runs the command itself
+                self._send({"unavailable": True})
+            elif not lost:
+                self._send({"result": result})
+
+        def _send(self, message):
+            self.wfile.write(json.dumps(message).encode("utf-8") + b"\n")
+            self.wfile.flush()
+
+    return _Handler
+
+
+def serve(conda: str, path: str = None, in_process: bool = None) -> None:
+    """
+    Runs a worker for the conda installation at `conda` until it is sent a shutdown
+    request (or SIGTERM, which fails the command running in-process). Commands run on
+    the calling (main) thread.
+
+    Raises
+    ------
+    AssertionError
+        If a worker is already serving the socket, or the socket's folder is not a
+        private folder of this user
+    """
+    import signal
+    import socketserver
+
+    path = os.path.abspath(path or socket_path(conda))
+    directory = os.path.dirname(path)
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    error = _private_dir_error(directory)
+    assert error is None, f"Refusing to start a CincyConda worker at {path}: {error}. \
+Please use a folder only you can open, eg set CINCYCONDA_WORKER_SOCKET."
+    if os.path.lexists(path):
+        assert WorkerClient(conda, path).ping() is None, \
+            f"A CincyConda worker is already running at {path}."
+        os.remove(path)
+
+    worker = Worker(conda, in_process)
+
+    class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+        daemon_threads = True
+        request_queue_size = 128
+
+        def verify_request(self, request, client_address):
+            # only this user's processes may send commands
+            return _peer_uid(request) in (None, os.getuid())
+
+    def _remove_socket():
+        # only this worker's socket: a new worker may already be listening at `path`
+        try:
+            if os.stat(path).st_ino == inode:
+                os.remove(path)
+        except OSError:
+            pass
+
+    def _stop():
+        # new clients fall back to subprocesses straight away
+        _remove_socket()
+        worker.stop(1 if worker.in_process else WORKER_THREADS)
+
+    previous = os.umask(0o177)
+    try:
+        server = _Server(path, _handler(worker, _stop))
+    finally:
+        os.umask(previous)
+    inode = os.stat(path).st_ino
+    # inside a link transaction conda has its own SIGTERM handler, which rolls the
+    # transaction back and fails the command; the worker then keeps serving
+    signal.signal(signal.SIGTERM, worker.terminate)
+    serving = threading.Thread(target=server.serve_forever, daemon=True)
+    try:
+        worker.warm_up()
+        serving.start()
+        print(f"CincyConda worker {os.getpid()} for {conda} at {path} "
+              f"({'in-process' if worker.in_process else 'subprocess'} mode)",
+              file=sys.__stderr__, flush=True)
+        if worker.in_process:
+            worker.serve_jobs()
+        else:
+            threads = [threading.Thread(target=worker.serve_jobs, daemon=True)
+                       for _ in range(WORKER_THREADS)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+    except _Terminated:
+        print(f"CincyConda worker {os.getpid()} stopped by signal {worker.terminated}",
+              file=sys.__stderr__, flush=True)
+    finally:
+        # shutdown waits for serve_forever, so only once it runs
+        if serving.is_alive():
+            server.shutdown()
+        server.server_close()
+        _remove_socket()
+
+
+class WorkerClient:
+    """
+    The notebook side: sends commands to the worker for the conda installation at
+    `conda`, if one is running. Nothing is connected or started until a method is
+    called. A socket that is not this user's own, in a private folder, and served by a
+    process of this user is refused (with a message, once), and the command runs as a
+    subprocess instead.
+
+    Parameters
+    ----------
+    conda : str
+        The conda executable
+    path : str, optional
+        The worker socket, by default socket_path(conda)
+
+    Example Usage
+    -------------
+    >>> client = WorkerClient('/opt/conda/bin/conda')
+    >>> client.ping()
+    {'conda': '/opt/conda/bin/conda', 'pid': 4242, 'in_process': True, ...}
+    >>> client.run(['/opt/conda/bin/conda', 'install', '-y', '-p', './.env', 'polars'])
+    CommandResult(args=[...], returncode=0, ...)
+    """
+    def __init__(self, conda: str, path: str = None):
+        self.conda = conda
+        self._path = path
+        self._refused = False
+
+    def __repr__(self):
+        return f"WorkerClient({self.path!r})"
+
+    @property
+    def path(self) -> str:
+        if self._path is None:
+            self._path = socket_path(self.conda)
+        return self._path
+
+    def available(self) -> bool:
+        """
+        Returns whether a worker socket exists (the worker may still have died).
+        """
+        return os.path.exists(self.path)
+
+    def handles(self, args: List[str]) -> bool:
+        """
+        Returns whether `args` is a command the worker runs.
+        """
+        return len(args) > 1 and str(args[0]) == self.conda and str(args[1]) in WORKER_COMMANDS
+
+    def _request(self, message: dict, timeout: float = None):
+        """
+        Sends `message` and returns the socket's reader, or None if no worker answered.
+        """
+        if not self.available():
+            return None
+        error = _socket_error(self.path)
+        if error is not None:
+            self._refuse(error)
+            return None
+        # imported here so that importing CincyConda stays cheap
+        import socket
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.settimeout(WORKER_CONNECT_TIMEOUT)
+            sock.connect(self.path)
+            # the message (which can hold the environment's tokens) only goes to a
+            # worker of this user
+            uid = _peer_uid(sock)
+            if uid is not None and uid != os.getuid():
+                self._refuse(f"{self.path} is served by another user (uid {uid})")
+                sock.close()
+                return None
+            sock.settimeout(timeout)
+            sock.sendall(json.dumps(message).encode("utf-8") + b"\n")
+            reader = sock.makefile("rb")
+        except OSError:
+            sock.close()
+            return None
+        sock.close()
+        return reader
+
+    def _refuse(self, error: str) -> None:
+        if not self._refused:
+            self._refused = True
+            print(f"Not using the CincyConda worker: {error}.", file=sys.stderr)
+
+    def _call(self, message: dict, timeout: float = WORKER_CONNECT_TIMEOUT):
+        reader = self._request(message, timeout)
+        if reader is None:
+            return None
+        try:
+            with reader:
+                response = json.loads(reader.readline() or "null")
+        except (OSError, ValueError):
+            return None
+        return response.get("result") if response else None
+
+    def ping(self) -> Optional[dict]:
+        """
+        Returns the worker's status, or None if no worker is running.
+        """
+        return self._call({"op": "ping"})
+
+    def shutdown(self) -> Optional[dict]:
+        """
+        Stops the worker once the commands already queued have run. Returns its last
+        status, or None if no worker was running.
+        """
+        return self._call({"op": "shutdown"})
+
+    def envs(self, refresh: bool = False) -> Optional[List[CondaEnv]]:
+        """
+        Returns the envs the worker discovers, or None if no worker is running or it
+        would find different ones than this process (other HOME or envs dirs).
+        """
+        env = {var: os.environ[var] for var in _DISCOVERY_VARS if var in os.environ}
+        envs = self._call({"op": "envs", "env": env, "refresh": refresh})
+        return [CondaEnv(*e) for e in envs] if envs is not None else None
+
+    def run(self,
+            args: List[str],
+            stream: bool = True,
+            env: Dict[str, str] = None,
+            cwd: str = None,
+            on_line: Callable[[str, str], None] = None) -> Optional[CommandResult]:
+        """
+        Runs a command in the worker, like runner.run, and returns its CommandResult,
+        or None if the worker does not run this command or is not running (run it as
+        a subprocess instead). `cpu_time` is what the command used in the worker, and
+        `peak_rss` the worker's peak memory. The command runs with `env` (by default
+        this process's environment) and `cwd`, which are only ever sent to a worker of
+        this user, see the class docstring.
+        """
+        if not self.handles(args):
+            return None
+        args = [str(a) for a in args]
+        start = time.perf_counter()
+        reader = self._request({"op": "run", "args": args,
+                                "env": dict(os.environ) if env is None else env,
+                                "cwd": os.path.abspath(cwd or os.getcwd())})
+        if reader is None:
+            return None
+
+        stdout, stderr, result = [], [], None
+        try:
+            with reader:
+                for line in reader:
+                    message = json.loads(line)
+                    if "line" in message:
+                        name, text = message["stream"], message["line"]
+                        (stdout if name == "stdout" else stderr).append(text + "\n")
+                        if stream:
+                            echo = sys.stdout if name == "stdout" else sys.stderr
+                            echo.write(text + "\n")
+                            echo.flush()
+                        if on_line is not None:
+                            on_line(name, text)
+                    elif "result" in message:
+                        result = message["result"]
+                        break
+                    elif message.get("unavailable"):
+                        return None
+                    else:
+                        return CommandResult(args, 1, "".join(stdout),
+                                             f"CincyConda worker: {message.get('error')}\n",
+                                             time.perf_counter() - start, 0.0, 0, False)
+        except (OSError, ValueError) as e:
+            stderr.append(f"Lost the connection to the CincyConda worker: {e}\n")
+        wall_time = time.perf_counter() - start
+
+        if result is None:
+            # the command may have run partly, so it is not retried as a subprocess
+            stderr.append("The CincyConda worker stopped before the command finished.\n")
+            return CommandResult(args, 1, "".join(stdout), "".join(stderr), wall_time,
+                                 0.0, 0, False)
+        return CommandResult(args, result["returncode"], result["stdout"], result["stderr"],
+                             wall_time, result["cpu_time"], result["peak_rss"], False)
+
+
+def start_worker(conda: str, python: str = None, wait: float = WORKER_START_TIMEOUT) -> dict:
+    """
+    Starts a worker for the conda installation at `conda` in the background, with
+    the installation's own Python (so it can use conda's API), and waits until it
+    answers. Returns its status; if a worker is already running, that one's.
+
+    Raises
+    ------
+    AssertionError
+        If the worker exits or does not answer within `wait` seconds
+    """
+    import subprocess
+    from cache import cache_dir
+
+    client = WorkerClient(conda)
+    status = client.ping()
+    if status is not None:
+        return status
+
+    if python is None:
+        python = os.path.join(conda_root(conda), "bin", "python")
+        if not os.path.exists(python):
+            python = sys.executable
+    log = os.path.join(cache_dir("worker"),
+                       os.path.basename(client.path).replace(".sock", ".log"))
+    with open(log, "ab") as f:
+        process = subprocess.Popen([python, os.path.abspath(__file__), "--conda", conda],
+                                   stdin=subprocess.DEVNULL, stdout=f, stderr=f,
+                                   cwd=os.path.dirname(os.path.abspath(__file__)),
+                                   start_new_session=True)
+
+    deadline = time.monotonic() + wait
+    while time.monotonic() < deadline:
+        status = client.ping()
+        if status is not None:
+            return status
+        if process.poll() is not None:
+            break
+        time.sleep(0.05)
+    with open(log, errors="replace") as f:
+        tail = "".join(f.readlines()[-10:])
+    raise AssertionError(f"The CincyConda worker did not start. From {log}:\n{tail}")
+
+
+def main(argv: List[str] = None) -> int:
+    import argparse
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--conda", required=True, help="the conda executable")
+    parser.add_argument("--socket", help="the socket path, by default per installation")
+    parser.add_argument("--subprocess", action="store_true",
+                        help="run commands as subprocesses instead of with conda's API")
+    args = parser.parse_args(argv)
+    serve(args.conda, args.socket, in_process=False if args.subprocess else None)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,325 @@
+"""
+End-to-end benchmark of CincyConda against a fake conda executable.
+
+Every scenario builds a throwaway conda installation in a temporary directory: a base
+environment, `--envs` named environments, a file:// CincyPy channel, and
+fake_conda.py standing in for bin/conda with scripted latencies. CincyConda is pointed
+at it through `conda_install_path`, and each operation is timed.
+
+For every operation the results separate the time spent inside (fake) conda commands
+from the time CincyConda itself spent (parsing, lookups, spawning processes), so
+wrapper-side regressions show up even though the conda latencies are made up.
+
+Usage
+-----
+    python benchmarks/bench_cincyconda.py [--envs 10,100,1000] [--packages 1,10,50]
+                                          [--latency 0.05] [--repeat 3]
+                                          [--output results.json]
+    python benchmarks/bench_cincyconda.py --compare old.json new.json
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+import tempfile
+import argparse
+import threading
+import subprocess
+import contextlib
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, os.pardir, "CincyConda"))
+
+import envs as _envs
+import inventory as _inventory
+import channel_index as _channel_index
+from CincyConda import CincyConda, CINCYPY_CHANNEL
+
+OPERATIONS = ["Create", "Create (cached solve)", "Install", "Install (worker)",
+              "Env (cold)", "Env (warm)",
+              "Activate", "Run", "SyncKernels", "FindPackage (cold)",
+              "FindPackage (warm)", "Setup", "Request", "Analyze",
+              "Verify"]
+
+
+class _StubIndexHandler(BaseHTTPRequestHandler):
+    """
+    A PyPI simple index with every fake package on it: HEAD /simple/<name>/ answers
+    200 for the server's `projects` and 404 for anything else.
+    """
+    # keep connections open, so the checker's connection pool is used as with PyPI
+    protocol_version = "HTTP/1.1"
+
+    def do_HEAD(self):
+        name = self.path.strip("/").split("/")[-1]
+        self.send_response(200 if name in self.server.projects else 404)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class _StubIndexServer(ThreadingHTTPServer):
+    # the default backlog of 5 drops concurrent connections, which then wait a second
+    # to retry
+    request_queue_size = 128
+    daemon_threads = True
+
+
+class FakeInstallation:
+    """
+    A temporary conda installation driven by fake_conda.py. Use as a context manager;
+    HOME and the CincyConda cache are redirected into the temporary directory while it
+    is active.
+    """
+    def __init__(self, env_count: int, package_count: int, latency: float):
+        self.env_count = env_count
+        self.package_count = package_count
+        self.latency = latency
+
+    def __enter__(self):
+        self.tmp = tempfile.mkdtemp(prefix="cincyconda-bench-")
+        self.root = os.path.join(self.tmp, "conda")
+        self.home = os.path.join(self.tmp, "home")
+        self.channel_alias = f"file://{self.tmp}/server"
+        self.packages = [f"pkg{i:04d}" for i in range(2 * self.package_count)]
+
+        os.makedirs(os.path.join(self.root, "conda-meta"))
+        for i in range(self.env_count):
+            meta = os.path.join(self.root, "envs", f"env{i:05d}", "conda-meta")
+            os.makedirs(meta)
+            with open(os.path.join(meta, "ipykernel-6.0.0-0.json"), "w") as f:
+                json.dump({"name": "ipykernel", "version": "6.0.0", "build": "0"}, f)
+        os.makedirs(self.home)
+        # what Setup writes, minus `defaults`, so solves only read the local channel
+        with open(os.path.join(self.home, ".condarc"), "w") as f:
+            f.write(f"channel_alias: {self.channel_alias}/repo\n"
+                    f"channels:\n  - {CINCYPY_CHANNEL}\n")
+
+        # a file:// channel with a small placeholder file per package
+        channel_dir = os.path.join(self.tmp, "server", "repo", CINCYPY_CHANNEL)
+        for subdir in ("noarch", _channel_index.platform_subdir()):
+            os.makedirs(os.path.join(channel_dir, subdir))
+        repodata = {"packages": {}}
+        for name in self.packages:
+            fn = f"{name}-1.0-0.tar.bz2"
+            content = f"fake package {name}\n".encode("utf-8") * 64
+            with open(os.path.join(channel_dir, "noarch", fn), "wb") as f:
+                f.write(content)
+            repodata["packages"][fn] = {"name": name, "version": "1.0", "build": "0",
+                                        "md5": hashlib.md5(content).hexdigest()}
+        for subdir in ("noarch", _channel_index.platform_subdir()):
+            with open(os.path.join(channel_dir, subdir, "repodata.json"), "w") as f:
+                json.dump(repodata if subdir == "noarch" else {}, f)
+
+        script = os.path.join(self.tmp, "fake_conda.json")
+        with open(script, "w") as f:
+            json.dump({"latency": {"default": self.latency},
+                       "root": self.root,
+                       "channel": f"{self.channel_alias}/repo/{CINCYPY_CHANNEL}"}, f)
+
+        self.conda = os.path.join(self.root, "bin", "conda")
+        os.makedirs(os.path.dirname(self.conda))
+        with open(self.conda, "w") as f:
+            f.write(f'#!/bin/sh\nexec "{sys.executable}" "{os.path.join(HERE, "fake_conda.py")}" "$@"\n')
+        os.chmod(self.conda, 0o755)
+
+        self.index = _StubIndexServer(("127.0.0.1", 0), _StubIndexHandler)
+        self.index.projects = set(self.packages)
+        threading.Thread(target=self.index.serve_forever, daemon=True).start()
+
+        self._saved = {k: os.environ.get(k)
+                       for k in ("HOME", "FAKE_CONDA_SCRIPT", "CINCYCONDA_CACHE_DIR",
+                                 "CONDA_PKGS_DIRS", "JUPYTER_DATA_DIR", "XDG_DATA_HOME",
+                                 "CINCYCONDA_PYPI_INDEX", "CINCYCONDA_PYPI_SNAPSHOT")}
+        os.environ["HOME"] = self.home
+        os.environ["FAKE_CONDA_SCRIPT"] = script
+        os.environ["CINCYCONDA_CACHE_DIR"] = os.path.join(self.tmp, "cache")
+        os.environ["CONDA_PKGS_DIRS"] = os.path.join(self.tmp, "pkgs")
+        os.environ["JUPYTER_DATA_DIR"] = os.path.join(self.home, ".local", "share", "jupyter")
+        os.environ.pop("XDG_DATA_HOME", None)
+        os.environ["CINCYCONDA_PYPI_INDEX"] = f"http://127.0.0.1:{self.index.server_port}/simple"
+        os.environ.pop("CINCYCONDA_PYPI_SNAPSHOT", None)
+        return self
+
+    def __exit__(self, *exc):
+        self.index.shutdown()
+        self.index.server_close()
+        for key, value in self._saved.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def cincyconda(self, path: str, **kwargs) -> CincyConda:
+        return CincyConda(conda_install_path=self.conda,
+                          channel_alias=self.channel_alias,
+                          path=path,
+                          name=os.path.basename(path),
+                          lazy=True,
+                          **kwargs)
+
+
+def _forget_discovery() -> None:
+    """
+    Drops CincyConda's in-process environment caches, to time a cold lookup.
+    """
+    _envs._CACHE.clear()
+    _envs._INDEX = (None, None)
+
+
+def measure(cc: CincyConda, fn) -> dict:
+    """
+    Runs fn() with its output silenced and returns its total wall time, the time spent
+    inside external commands, and the difference (CincyConda's own overhead).
+    """
+    first = len(cc.commands)
+    error = None
+    start = time.perf_counter()
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull), \
+            contextlib.redirect_stderr(devnull):
+        try:
+            fn()
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+    wall = time.perf_counter() - start
+    commands = cc.commands[first:]
+    command_time = sum(c.wall_time for c in commands)
+    return {"wall_s": wall,
+            "commands_s": command_time,
+            "wrapper_s": wall - command_time,
+            "commands": len(commands),
+            "error": error}
+
+
+def run_scenario(env_count: int, package_count: int, latency: float, repeat: int) -> list:
+    results = {op: [] for op in OPERATIONS}
+    for r in range(repeat):
+        with FakeInstallation(env_count, package_count, latency) as fake:
+            work = os.path.join(fake.tmp, "work")
+            packages = fake.packages[:package_count]
+            extra = fake.packages[package_count:]
+
+            cc = fake.cincyconda(os.path.join(work, f"project{r}", ".env"))
+            results["Create"].append(measure(cc, lambda: cc.Create(packages=packages)))
+
+            cached = fake.cincyconda(os.path.join(work, f"cached{r}", ".env"))
+            results["Create (cached solve)"].append(
+                measure(cached, lambda: cached.Create(packages=packages)))
+
+            results["Install"].append(measure(cc, lambda: cc.Install(package=extra)))
+
+            # the same install through the worker (the packages are there by now, so
+            # it runs fewer commands); fake conda is not importable, so this times the
+            # worker's queue and socket round trips, not a warm conda
+            cc.StartWorker()
+            try:
+                results["Install (worker)"].append(
+                    measure(cc, lambda: cc.Install(package=extra)))
+            finally:
+                cc.StopWorker()
+
+            target = f"env{env_count // 2:05d}"
+            _forget_discovery()
+            results["Env (cold)"].append(measure(cc, lambda: cc.Env(target)))
+            results["Env (warm)"].append(measure(cc, lambda: cc.Env(target)))
+            results["Activate"].append(measure(cc, lambda: cc.Activate(target)))
+            results["Run"].append(measure(cc, lambda: cc.Run(target, ["true"])))
+            results["SyncKernels"].append(measure(cc, lambda: cc.SyncKernels()))
+            _inventory._TABLES.clear()
+            results["FindPackage (cold)"].append(
+                measure(cc, lambda: cc.FindPackage("ipykernel<7")))
+            results["FindPackage (warm)"].append(
+                measure(cc, lambda: cc.FindPackage("ipykernel<7")))
+            results["Setup"].append(measure(cc, lambda: cc.Setup()))
+            results["Request"].append(
+                measure(cc, lambda: cc.Request(packages, reason="benchmark")))
+            results["Analyze"].append(measure(cc, lambda: cc.Analyze()))
+            results["Verify"].append(measure(cc, lambda: cc.Verify(all_envs=True)))
+
+    rows = []
+    for op, runs in results.items():
+        runs.sort(key=lambda run: run["wall_s"])
+        median = runs[len(runs) // 2]
+        rows.append(dict(median, op=op, envs=env_count, packages=package_count,
+                         runs=len(runs)))
+    return rows
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=HERE,
+                              stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                              universal_newlines=True).stdout.strip()
+    except OSError:
+        return ""
+
+
+def compare(old_path: str, new_path: str) -> None:
+    """
+    Prints the wrapper overhead and total wall time of two result files side by side.
+    """
+    with open(old_path) as f:
+        old = {(r["op"], r["envs"], r["packages"]): r for r in json.load(f)["results"]}
+    with open(new_path) as f:
+        new = json.load(f)["results"]
+
+    print(f"{'operation':<24}{'envs':>7}{'pkgs':>6}{'wrapper old':>14}{'wrapper new':>14}"
+          f"{'wall old':>11}{'wall new':>11}")
+    for row in new:
+        before = old.get((row["op"], row["envs"], row["packages"]))
+        if before is None:
+            continue
+        print(f"{row['op']:<24}{row['envs']:>7}{row['packages']:>6}"
+              f"{before['wrapper_s'] * 1000:>12.1f}ms{row['wrapper_s'] * 1000:>12.1f}ms"
+              f"{before['wall_s']:>10.2f}s{row['wall_s']:>10.2f}s")
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--envs", default="10,100,1000",
+                        help="comma-separated env counts (default 10,100,1000)")
+    parser.add_argument("--packages", default="1,10,50",
+                        help="comma-separated package-list sizes (default 1,10,50)")
+    parser.add_argument("--latency", type=float, default=0.05,
+                        help="seconds each fake conda command takes (default 0.05)")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="runs per scenario, the median is reported (default 3)")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"),
+                        help="compare two result files instead of running")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        compare(*args.compare)
+        return 0
+
+    rows = []
+    for env_count in [int(n) for n in args.envs.split(",")]:
+        for package_count in [int(n) for n in args.packages.split(",")]:
+            rows.extend(run_scenario(env_count, package_count, args.latency, args.repeat))
+
+    document = {"commit": _git_commit(),
+                "python": sys.version.split()[0],
+                "latency_s": args.latency,
+                "results": rows}
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(document, f, indent=2)
+
+    print(f"{'operation':<24}{'envs':>7}{'pkgs':>6}{'wall':>10}{'wrapper':>12}{'cmds':>6}")
+    for row in rows:
+        note = f"  ({row['error']})" if row["error"] else ""
+        print(f"{row['op']:<24}{row['envs']:>7}{row['packages']:>6}{row['wall_s']:>9.3f}s"
+              f"{row['wrapper_s'] * 1000:>10.1f}ms{row['commands']:>6}{note}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
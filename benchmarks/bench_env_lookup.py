@@ -0,0 +1,114 @@
+"""
+Environment lookup benchmark for CincyConda.
+
+Builds an EnvIndex over synthetic environments (10,000 by default, spread over many
+users' home directories like on the shared server) and times exact, prefix and
+substring lookups against the list-scanning approach `Env` used before the index.
+
+Usage
+-----
+    python benchmarks/bench_env_lookup.py [--envs 10000] [--lookups 1000] [--json]
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir,
+                                "CincyConda"))
+
+from envs import CondaEnv, EnvIndex
+
+
+def synthetic_envs(count: int, seed: int = 0) -> list:
+    """
+    Returns `count` CondaEnv records: a base env, named envs and `./.env` prefix envs
+    under many users' project folders.
+    """
+    rng = random.Random(seed)
+    envs = [CondaEnv("base", "/rsystem/Rapps/anaconda310")]
+    for i in range(1, count):
+        user = f"user{rng.randrange(count // 20 + 1):04d}"
+        if i % 3 == 0:
+            envs.append(CondaEnv(f"proj{i:05d}",
+                                 f"/rsystem/Rapps/anaconda310/envs/proj{i:05d}"))
+        else:
+            envs.append(CondaEnv("", f"/home/{user}/projects/analysis{i:05d}/.env"))
+    return envs
+
+
+def naive_lookup(envs: list, name: str):
+    """
+    The list-scanning lookup that `Env` did before the index, for comparison.
+    """
+    if name in [env.name for env in envs]:
+        return [env for env in envs if env.name == name][0]
+    matches = [env for env in envs if name in env.name]
+    if not matches:
+        matches = [env for env in envs if name in env.path]
+    return matches
+
+
+def indexed_lookup(index: EnvIndex, name: str):
+    exact = index.exact(name)
+    if exact:
+        return exact[0]
+    return index.search(name, "name") or index.search(name, "path")
+
+
+def _time(fn, queries) -> float:
+    start = time.perf_counter()
+    for q in queries:
+        fn(q)
+    return (time.perf_counter() - start) / len(queries) * 1e6
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--envs", type=int, default=10000)
+    parser.add_argument("--lookups", type=int, default=1000)
+    parser.add_argument("--json", action="store_true",
+                        help="print the results as JSON")
+    args = parser.parse_args(argv)
+
+    envs = synthetic_envs(args.envs)
+    rng = random.Random(1)
+
+    start = time.perf_counter()
+    index = EnvIndex(envs)
+    # the fuzzy indexes are built on first use, so include them in the build time
+    index.search("warm-up", "name")
+    index.search("warm-up", "path")
+    build_ms = (time.perf_counter() - start) * 1000
+
+    named = [env for env in envs if env.name]
+    queries = {
+        "exact name": [rng.choice(named).name for _ in range(args.lookups)],
+        "exact path": [rng.choice(envs).path for _ in range(args.lookups)],
+        "name prefix": [rng.choice(named).name[:7] for _ in range(args.lookups)],
+        "path substring": [f"analysis{rng.randrange(args.envs):05d}"
+                           for _ in range(args.lookups)],
+    }
+
+    results = {"envs": args.envs, "build_ms": build_ms, "lookups_us": {}}
+    for kind, qs in queries.items():
+        results["lookups_us"][kind] = {
+            "indexed": _time(lambda q: indexed_lookup(index, q), qs),
+            "naive": _time(lambda q: naive_lookup(envs, q), qs[:max(1, len(qs) // 10)]),
+        }
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(f"{args.envs} envs, index built in {build_ms:.1f}ms")
+        print(f"    {'lookup':<16} {'indexed':>12} {'naive':>12}")
+        for kind, timing in results["lookups_us"].items():
+            print(f"    {kind:<16} {timing['indexed']:>10.1f}us {timing['naive']:>10.1f}us")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
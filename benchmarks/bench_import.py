@@ -0,0 +1,150 @@
+"""
+Import-time benchmark for CincyConda.
+
+Runs `python -X importtime -c "import CincyConda"` in a fresh interpreter and fails if
+importing the module takes longer than the budget, or if it pulls in any of the heavy
+modules that CincyConda only needs once a method is called. It also constructs a
+`CincyConda(lazy=True)` object in a fresh interpreter and fails if that starts any
+subprocess or opens any network connection.
+
+Usage
+-----
+    python benchmarks/bench_import.py [--budget-ms 100] [--runs 5] [--json]
+
+Exits with status 1 if any check fails.
+"""
+
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+PACKAGE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir,
+                           "CincyConda")
+
+# modules that must not be imported by `import CincyConda` or by the constructor
+HEAVY_MODULES = ["pandas", "numpy", "requests", "urllib3", "yaml", "sqlite3",
+                 "concurrent.futures"]
+
+# run in a fresh interpreter: records every subprocess / network call made while
+# constructing the object, then prints the result as JSON
+_CONSTRUCT_SCRIPT = r"""
+import os, sys, json, socket, subprocess
+calls = []
+_popen_init = subprocess.Popen.__init__
+def _popen(self, *args, **kwargs):
+    calls.append(("subprocess", repr(args[:1])))
+    return _popen_init(self, *args, **kwargs)
+subprocess.Popen.__init__ = _popen
+_system = os.system
+def _os_system(cmd):
+    calls.append(("os.system", cmd))
+    return _system(cmd)
+os.system = _os_system
+_connect = socket.socket.connect
+def _socket_connect(self, address):
+    calls.append(("network", repr(address)))
+    return _connect(self, address)
+socket.socket.connect = _socket_connect
+
+import CincyConda
+c = CincyConda.CincyConda(lazy=True)
+str(c)
+print(json.dumps({"calls": calls,
+                  "heavy": [m for m in %(heavy)r if m in sys.modules]}))
+"""
+
+
+def import_time_us() -> (int, list):
+    """
+    Imports CincyConda in a fresh interpreter with -X importtime.
+
+    Returns
+    -------
+    (int, list)
+        The cumulative import time of CincyConda in microseconds, and the names of
+        every module imported along the way
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import CincyConda"],
+                            cwd=PACKAGE_DIR,
+                            stdout=subprocess.PIPE,
+                            stderr=subprocess.PIPE,
+                            universal_newlines=True,
+                            check=True)
+    total, modules = None, []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not cumulative.strip().isdigit():
+            # the header line
+            continue
+        modules.append(name.strip())
+        if name.strip() == "CincyConda":
+            total = int(cumulative)
+    return total, modules
+
+
+def construct_side_effects() -> dict:
+    """
+    Constructs CincyConda(lazy=True) in a fresh interpreter and returns the
+    subprocess / network calls it made and the heavy modules it imported.
+    """
+    result = subprocess.run([sys.executable, "-c",
+                             _CONSTRUCT_SCRIPT % {"heavy": HEAVY_MODULES}],
+                            cwd=PACKAGE_DIR,
+                            stdout=subprocess.PIPE,
+                            universal_newlines=True,
+                            check=True)
+    return json.loads(result.stdout.splitlines()[-1])
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--budget-ms", type=float, default=100.0,
+                        help="fail if the median import time is above this (default 100)")
+    parser.add_argument("--runs", type=int, default=5,
+                        help="number of fresh interpreters to time (default 5)")
+    parser.add_argument("--json", action="store_true",
+                        help="print the results as JSON")
+    args = parser.parse_args(argv)
+
+    times, modules = [], []
+    for _ in range(args.runs):
+        total, modules = import_time_us()
+        times.append(total / 1000.0)
+    times.sort()
+    median_ms = times[len(times) // 2]
+
+    heavy_on_import = [m for m in HEAVY_MODULES if m in modules]
+    side_effects = construct_side_effects()
+
+    failures = []
+    if median_ms > args.budget_ms:
+        failures.append(f"import took {median_ms:.1f}ms, budget is {args.budget_ms:.1f}ms")
+    if heavy_on_import:
+        failures.append(f"heavy modules imported at import time: {heavy_on_import}")
+    if side_effects["heavy"]:
+        failures.append(f"heavy modules imported by the constructor: {side_effects['heavy']}")
+    if side_effects["calls"]:
+        failures.append(f"constructor made subprocess/network calls: {side_effects['calls']}")
+
+    if args.json:
+        print(json.dumps({"import_ms": times,
+                          "median_ms": median_ms,
+                          "budget_ms": args.budget_ms,
+                          "failures": failures}, indent=2))
+    else:
+        print(f"import CincyConda: median {median_ms:.1f}ms over {args.runs} runs "
+              f"(budget {args.budget_ms:.1f}ms)")
+        for failure in failures:
+            print(f"FAIL: {failure}")
+        if not failures:
+            print("OK")
+
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
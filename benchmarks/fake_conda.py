@@ -0,0 +1,236 @@
+"""
+A stand-in for the conda executable, for benchmarking CincyConda without a real conda
+or the CincyPy channel.
+
+It understands the subset of the conda command line that CincyConda uses, sleeps for
+a scripted latency per subcommand, and makes the same changes on disk that conda
+would (conda-meta records, environments.txt, a stub bin/python), so CincyConda's own
+discovery and bookkeeping code sees a realistic installation.
+
+The script is read from the JSON file named by the FAKE_CONDA_SCRIPT environment
+variable, eg:
+
+    {"latency": {"default": 0.05, "create": 0.5, "install": 0.3},
+     "root": "/tmp/bench/conda",
+     "channel": "file:///tmp/bench/channel",
+     "output": {"clean": "Will remove 0 packages"},
+     "fail": ["update"]}
+
+Latencies are in seconds. A `--dry-run` (ie a solve) uses the "solve" latency if it is
+given. Subcommands listed under "fail" exit with status 1 after their latency; as with
+the latency, a `--dry-run` only fails if "solve" is listed. Run it through bench_cincyconda.py rather than directly.
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+
+FAKE_MD5 = "0" * 32
+
+
+def _script() -> dict:
+    path = os.environ.get("FAKE_CONDA_SCRIPT")
+    if not path:
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def _option(argv: list, *names: str):
+    for name in names:
+        if name in argv:
+            i = argv.index(name)
+            return argv[i + 1] if i + 1 < len(argv) else None
+    return None
+
+
+def _positional(argv: list) -> list:
+    """
+    The package specs on the command line: everything that is not an option or an
+    option's value.
+    """
+    takes_value = {"--prefix", "-p", "--name", "-n", "--file", "-c", "--channel"}
+    specs, skip = [], False
+    for arg in argv:
+        if skip:
+            skip = False
+        elif arg in takes_value:
+            skip = True
+        elif not arg.startswith("-"):
+            specs.append(arg)
+    return specs
+
+
+_REPODATA = {}
+
+
+def _channel_md5(channel: str, fn: str) -> str:
+    """
+    The md5 of `fn` from the channel's noarch repodata.json, for file:// channels that
+    have one, so downloads of the fake packages can be verified like real ones.
+    """
+    if channel not in _REPODATA:
+        _REPODATA[channel] = {}
+        if channel.startswith("file://"):
+            try:
+                with open(os.path.join(channel[len("file://"):], "noarch",
+                                       "repodata.json")) as f:
+                    _REPODATA[channel] = json.load(f).get("packages", {})
+            except (OSError, ValueError):
+                pass
+    return _REPODATA[channel].get(fn, {}).get("md5", FAKE_MD5)
+
+
+def _record(name: str, channel: str) -> dict:
+    fn = f"{name}-1.0-0.tar.bz2"
+    return {"name": name, "version": "1.0", "build": "0", "build_number": 0,
+            "channel": channel, "subdir": "noarch", "fn": fn,
+            "url": f"{channel}/noarch/{fn}", "md5": _channel_md5(channel, fn),
+            "depends": [], "files": [], "size": 1024}
+
+
+def _spec_name(spec: str) -> str:
+    for i, ch in enumerate(spec):
+        if ch in " =<>!~[":
+            return spec[:i]
+    return spec
+
+
+def _installed(prefix: str) -> set:
+    meta = os.path.join(prefix, "conda-meta")
+    if not os.path.isdir(meta):
+        return set()
+    return {fn.rsplit("-", 2)[0] for fn in os.listdir(meta) if fn.endswith(".json")}
+
+
+def _link(prefix: str, records: list) -> None:
+    """
+    Writes what conda would leave behind after linking `records` into `prefix`.
+    """
+    meta = os.path.join(prefix, "conda-meta")
+    os.makedirs(meta, exist_ok=True)
+    for record in records:
+        with open(os.path.join(meta, record["fn"][:-len(".tar.bz2")] + ".json"), "w") as f:
+            json.dump(record, f)
+    with open(os.path.join(meta, "history"), "a") as f:
+        f.write(f"==> {time.strftime('%Y-%m-%d %H:%M:%S')} <==\n")
+
+    python = os.path.join(prefix, "bin", "python")
+    if not os.path.exists(python):
+        os.makedirs(os.path.dirname(python), exist_ok=True)
+        with open(python, "w") as f:
+            f.write("#!/bin/sh\nexit 0\n")
+        os.chmod(python, 0o755)
+
+    registry = os.path.join(os.path.expanduser("~"), ".conda", "environments.txt")
+    os.makedirs(os.path.dirname(registry), exist_ok=True)
+    with open(registry, "a") as f:
+        f.write(os.path.abspath(prefix) + "\n")
+
+
+def _unlink(prefix: str, names: list) -> None:
+    """
+    Removes the conda-meta records of the packages called `names` from `prefix`.
+    """
+    meta = os.path.join(prefix, "conda-meta")
+    for fn in os.listdir(meta):
+        if fn.endswith(".json") and fn.rsplit("-", 2)[0] in names:
+            os.remove(os.path.join(meta, fn))
+    with open(os.path.join(meta, "history"), "a") as f:
+        f.write(f"==> {time.strftime('%Y-%m-%d %H:%M:%S')} <==\n")
+
+
+def _explicit_records(path: str, channel: str) -> list:
+    records = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#") or line == "@EXPLICIT":
+                continue
+            url = line.split("#")[0]
+            fn = url.rsplit("/", 1)[-1]
+            name = fn.rsplit("-", 2)[0]
+            record = _record(name, channel)
+            record["url"] = url
+            records.append(record)
+    return records
+
+
+def main(argv: list) -> int:
+    script = _script()
+    latency = script.get("latency", {})
+    channel = script.get("channel", "file:///fake-channel")
+
+    if not argv or argv[0] in ("--version", "-V"):
+        print("conda 0.0.0 (fake)")
+        return 0
+
+    command = argv[0]
+    if command == "env" and len(argv) > 1:
+        command = f"env {argv[1]}"
+    dry_run = "--dry-run" in argv
+
+    time.sleep(latency.get("solve" if dry_run else command, latency.get("default", 0.0)))
+
+    if command in script.get("output", {}):
+        print(script["output"][command])
+
+    if "--help" in argv:
+        print(f"usage: conda {command} [options] (fake)")
+        return 0
+
+    if ("solve" if dry_run else command) in script.get("fail", []):
+        print(f"CondaError: {command} failed (fake)", file=sys.stderr)
+        return 1
+
+    prefix = _option(argv, "--prefix", "-p")
+
+    if command in ("create", "install", "update"):
+        spec_file = _option(argv, "--file")
+        if spec_file:
+            records = _explicit_records(spec_file, channel)
+        else:
+            installed = _installed(prefix) if command != "create" else set()
+            records = [_record(_spec_name(s), channel) for s in _positional(argv[1:])
+                       if _spec_name(s) not in installed]
+
+        if dry_run:
+            link = [{"dist_name": r["fn"][:-len(".tar.bz2")], "name": r["name"],
+                     "version": r["version"], "build_string": r["build"],
+                     "platform": "noarch", "channel": channel, "base_url": channel,
+                     "build_number": 0} for r in records]
+            print(json.dumps({"success": True, "dry_run": True,
+                              "actions": {"FETCH": records, "LINK": link,
+                                          "PREFIX": prefix}}))
+            return 0
+        if "--download-only" in argv:
+            return 0
+        if command == "create" and prefix and os.path.exists(prefix) \
+                and os.listdir(prefix):
+            print(f"CondaValueError: prefix already exists: {prefix}", file=sys.stderr)
+            return 1
+        _link(prefix, records)
+        return 0
+
+    names = [_spec_name(s) for s in _positional(argv[1:])]
+    if command == "remove" and names and "--all" not in argv:
+        if prefix and os.path.isdir(prefix):
+            _unlink(prefix, names)
+        return 0
+
+    if command in ("env remove", "remove"):
+        name = _option(argv, "--name", "-n")
+        if name and not prefix and script.get("root"):
+            prefix = os.path.join(script["root"], "envs", name)
+        if prefix and os.path.isdir(prefix):
+            shutil.rmtree(prefix)
+        return 0
+
+    # config, clean, repo, init, ...: nothing to do beyond the latency
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
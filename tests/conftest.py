@@ -0,0 +1,36 @@
+"""
+Shared fixtures. The CincyConda modules import each other by their bare names, so
+the package folder is put on sys.path, as the benchmarks do.
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir,
+                                "CincyConda"))
+
+
+@pytest.fixture(autouse=True)
+def cache(tmp_path, monkeypatch):
+    """
+    Points the CincyConda cache and HOME at temporary folders for every test.
+    """
+    monkeypatch.setenv("CINCYCONDA_CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.setenv("HOME", str(tmp_path / "home"))
+    (tmp_path / "home").mkdir()
+    return tmp_path / "cache"
+
+
+@pytest.fixture
+def fake():
+    """
+    A throwaway conda installation driven by benchmarks/fake_conda.py, with a file://
+    CincyPy channel, see bench_cincyconda.FakeInstallation.
+    """
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir,
+                                    "benchmarks"))
+    from bench_cincyconda import FakeInstallation
+    with FakeInstallation(env_count=2, package_count=3, latency=0.0) as installation:
+        yield installation
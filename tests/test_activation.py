@@ -0,0 +1,60 @@
+import os
+import json
+import stat
+
+import pytest
+
+from activation import DELTA_FILE_MODE, activation_delta
+from cache import cache_dir
+
+
+@pytest.fixture
+def environ():
+    """
+    Puts os.environ back as it was after a test that activates environments.
+    """
+    saved = dict(os.environ)
+    yield
+    os.environ.clear()
+    os.environ.update(saved)
+
+
+def test_commands_keep_the_active_environment(fake, environ):
+    env = fake.cincyconda(os.path.join(fake.tmp, "work", ".env"))
+    env.Create(packages=fake.packages[:1])
+
+    env.Activate(env.path)
+    assert os.environ["CONDA_PREFIX"] == env.path
+
+    env.Install(package=fake.packages[1])
+    env.Sync(packages=fake.packages[:3])
+    env.update(fake.packages[0])
+    assert os.environ["CONDA_PREFIX"] == env.path
+
+    deltas = [entry.path for entry in os.scandir(cache_dir("activation"))]
+    assert deltas
+    for delta in deltas:
+        assert stat.S_IMODE(os.stat(delta).st_mode) == DELTA_FILE_MODE
+
+
+def test_a_delta_others_can_write_is_not_used(tmp_path):
+    prefix = tmp_path / "env"
+    (prefix / "conda-meta").mkdir(parents=True)
+    conda_root = str(tmp_path / "conda")
+    delta = activation_delta(conda_root, str(prefix))
+
+    [cached] = [entry.path for entry in os.scandir(cache_dir("activation"))]
+    with open(cached) as f:
+        data = json.load(f)
+    data["delta"]["path"] = [str(tmp_path / "evil")]
+    with open(cached, "w") as f:
+        json.dump(data, f)
+    os.chmod(cached, 0o666)
+
+    assert activation_delta(conda_root, str(prefix)) == delta
+    assert stat.S_IMODE(os.stat(cached).st_mode) == DELTA_FILE_MODE
+
+    # the same file, once it is only writable by its owner again, is used as is
+    with open(cached, "w") as f:
+        json.dump(data, f)
+    assert activation_delta(conda_root, str(prefix))["path"] == [str(tmp_path / "evil")]
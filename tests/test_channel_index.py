@@ -0,0 +1,54 @@
+import json
+import os
+import stat
+
+from cache import atomic_write, DEFAULT_FILE_MODE
+from channel_index import ChannelIndex, platform_subdir
+
+
+def _channel(tmp_path, names):
+    channel = tmp_path / "channel"
+    for subdir in ("noarch", platform_subdir()):
+        (channel / subdir).mkdir(parents=True)
+        packages = {}
+        if subdir == "noarch":
+            packages = {f"{name}-1.0-0.tar.bz2": {"name": name, "version": "1.0",
+                                                  "build": "0"} for name in names}
+        (channel / subdir / "repodata.json").write_text(json.dumps({"packages": packages}))
+    return f"file://{channel}"
+
+
+def test_index_is_stored_as_json(tmp_path):
+    url = _channel(tmp_path, ["numpy", "pandas"])
+    index = ChannelIndex(url)
+    assert index.missing(["numpy", "pandas>=1", "polars"]) == ["polars"]
+    fingerprint = index.fingerprint()
+
+    with open(index.path) as f:
+        assert json.load(f)["packages"]["numpy"] == {"1.0": ["0"]}
+
+    reloaded = ChannelIndex(url)
+    assert "pandas" in reloaded
+    assert reloaded.fingerprint() == fingerprint
+
+
+def test_index_ignores_a_corrupt_file(tmp_path):
+    url = _channel(tmp_path, ["numpy"])
+    index = ChannelIndex(url)
+    with open(index.path, "wb") as f:
+        f.write(b"\x80\x04not json")
+    assert "numpy" in index
+
+
+def test_atomic_write_modes(tmp_path):
+    path = tmp_path / "file"
+    atomic_write(str(path), b"one")
+    assert stat.S_IMODE(os.stat(path).st_mode) == DEFAULT_FILE_MODE
+
+    os.chmod(path, 0o600)
+    atomic_write(str(path), b"two")
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+    assert path.read_bytes() == b"two"
+
+    atomic_write(str(path), b"three", mode=0o640)
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o640
@@ -0,0 +1,86 @@
+import os
+import stat
+
+import pytest
+
+import condarc
+
+CONDARC = """\
+# our proxy, ask IT before changing it
+proxy_servers:
+  https: http://proxy.example.com:3128
+channels:
+  - defaults
+"""
+
+
+def _mode(path):
+    return stat.S_IMODE(os.stat(path).st_mode)
+
+
+def test_new_files_are_only_readable_by_their_owner(tmp_path):
+    path = str(tmp_path / ".continuum" / "anaconda-client" / "config.yaml")
+    assert condarc.update_yaml(path, condarc.cincypy_repo_config("https://repo.example"))
+    assert _mode(path) == 0o600
+    assert condarc.read_yaml(path)["default_site"] == "anaconda"
+
+
+def test_existing_files_keep_their_mode_and_comments(tmp_path):
+    pytest.importorskip("ruamel.yaml")
+    path = str(tmp_path / ".condarc")
+    with open(path, "w") as f:
+        f.write(CONDARC)
+    os.chmod(path, 0o640)
+
+    update = condarc.cincypy_condarc("https://repo.example", "cincypy")
+    assert condarc.update_yaml(path, update)
+    assert not condarc.update_yaml(path, update)
+
+    assert _mode(path) == 0o640
+    with open(path) as f:
+        assert "# our proxy, ask IT before changing it" in f.read()
+    config = condarc.read_yaml(path)
+    assert config["channels"] == ["cincypy", "defaults"]
+    assert config["proxy_servers"] == {"https": "http://proxy.example.com:3128"}
+
+
+def test_without_ruamel_the_mapping_is_still_updated(tmp_path, monkeypatch):
+    monkeypatch.setattr(condarc, "_round_trip_yaml", lambda: None)
+    path = str(tmp_path / ".condarc")
+    with open(path, "w") as f:
+        f.write(CONDARC)
+
+    assert condarc.update_yaml(path, condarc.cincypy_condarc("https://repo.example",
+                                                             "cincypy"))
+    assert condarc.read_yaml(path)["channel_alias"] == "https://repo.example/repo"
+
+
+@pytest.mark.parametrize("shell, rc, block", [
+    ("bash", ".bashrc", "# >>> conda initialize >>>\n# <<< conda initialize <<<\n"),
+    ("xonsh", ".xonshrc", "# >>> conda initialize >>>\n# <<< conda initialize <<<\n"),
+    ("powershell", os.path.join(".config", "powershell", "profile.ps1"),
+     "#region conda initialize\n#endregion\n"),
+])
+def test_shell_initialized(tmp_path, monkeypatch, shell, rc, block):
+    monkeypatch.setenv("HOME", str(tmp_path))
+    assert not condarc.shell_initialized(shell)
+    path = tmp_path / rc
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(block)
+    assert condarc.shell_initialized(shell)
+
+
+def test_shells_conda_init_does_not_support_are_refused():
+    with pytest.raises(AssertionError, match="not supported"):
+        condarc.shell_initialized("tcsh")
+
+
+def test_setup_again_starts_no_processes(fake):
+    with open(os.path.join(fake.home, ".bashrc"), "w") as f:
+        f.write("# >>> conda initialize >>>\n# <<< conda initialize <<<\n")
+    env = fake.cincyconda(os.path.join(fake.tmp, "work", ".env"))
+
+    env.Setup()
+    assert env.Setup() == dict.fromkeys(["init", "condarc", "repo_config", "clean",
+                                         "login"], False)
+    assert env.commands == []
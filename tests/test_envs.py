@@ -0,0 +1,65 @@
+import os
+import shutil
+
+import pytest
+
+import envs
+from envs import discover_envs, register_env
+from CincyConda import CincyConda
+
+
+@pytest.fixture
+def root(tmp_path, monkeypatch):
+    root = tmp_path / "conda"
+    (root / "conda-meta").mkdir(parents=True)
+    (root / "envs" / "named" / "conda-meta").mkdir(parents=True)
+    monkeypatch.delenv("CONDA_ENVS_DIRS", raising=False)
+    monkeypatch.delenv("CONDA_ENVS_PATH", raising=False)
+    envs._CACHE.clear()
+    yield root
+    envs._CACHE.clear()
+
+
+def _prefix_env(path):
+    (path / "conda-meta").mkdir(parents=True)
+    register_env(str(path))
+    return str(path)
+
+
+def _paths(root):
+    return [env.path for env in discover_envs(str(root / "bin" / "conda"))]
+
+
+def test_new_envs_are_seen_at_once(root, tmp_path):
+    assert _paths(root) == [str(root), str(root / "envs" / "named")]
+    prefix = _prefix_env(tmp_path / "project" / ".env")
+    assert prefix in _paths(root)
+    (root / "envs" / "other" / "conda-meta").mkdir(parents=True)
+    assert str(root / "envs" / "other") in _paths(root)
+
+
+def test_deleted_prefix_envs_are_seen_after_the_ttl(root, tmp_path, monkeypatch):
+    prefix = _prefix_env(tmp_path / "project" / ".env")
+    assert prefix in _paths(root)
+    calls = []
+    real = envs._prefixes_key
+    monkeypatch.setattr(envs, "_prefixes_key",
+                        lambda prefixes: calls.append(prefixes) or real(prefixes))
+
+    # within the TTL a lookup does not look at the prefix envs at all
+    shutil.rmtree(prefix)
+    assert prefix in _paths(root)
+    assert calls == []
+
+    monkeypatch.setattr(envs, "DISCOVERY_TTL", 0)
+    assert prefix not in _paths(root)
+
+
+def test_env_refuses_ambiguous_names(root, tmp_path, monkeypatch):
+    other = tmp_path / "more-envs"
+    (other / "named" / "conda-meta").mkdir(parents=True)
+    monkeypatch.setenv("CONDA_ENVS_DIRS", str(other))
+    cc = CincyConda(conda_install_path=str(root / "bin" / "conda"), lazy=True)
+    with pytest.raises(AssertionError, match="2 environments named 'named'"):
+        cc.Env("named")
+    assert cc.Env(str(other / "named")).path == str(other / "named")
@@ -0,0 +1,57 @@
+import os
+import json
+
+import pytest
+
+import inventory
+
+
+def _env(tmp_path):
+    prefix = tmp_path / "env"
+    (prefix / "conda-meta").mkdir(parents=True)
+    for name in ("numpy", "pandas"):
+        with open(prefix / "conda-meta" / f"{name}-1.0-0.json", "w") as f:
+            json.dump({"name": name, "version": "1.0", "build": "0", "size": 10,
+                       "channel": "https://conda.anaconda.org/conda-forge/noarch",
+                       "files": ["a", "b"]}, f)
+    return str(prefix)
+
+
+def test_tables_are_cached_on_disk_as_json(tmp_path):
+    prefix = _env(tmp_path)
+    table = inventory.env_packages(prefix)
+    assert table.column("name") == ("numpy", "pandas")
+
+    path = inventory._cache_path(prefix)
+    assert path.endswith(".json")
+    with open(path) as f:
+        assert json.load(f)["columns"] == {c: list(v) for c, v in table.columns.items()}
+
+    inventory._TABLES.clear()
+    assert inventory.env_packages(prefix).columns == table.columns
+
+
+def test_a_corrupt_cache_file_is_read_again(tmp_path):
+    prefix = _env(tmp_path)
+    inventory.env_packages(prefix)
+    inventory._TABLES.clear()
+    path = inventory._cache_path(prefix)
+    with open(path) as f:
+        data = json.load(f)
+    data["columns"]["name"].pop()
+    with open(path, "w") as f:
+        json.dump(data, f)
+
+    assert inventory.env_packages(prefix).column("name") == ("numpy", "pandas")
+
+
+def test_callers_cannot_change_the_cached_table(tmp_path):
+    prefix = _env(tmp_path)
+    names = inventory.env_packages(prefix).column("name")
+    with pytest.raises(AttributeError):
+        names.append("scipy")
+
+    combined = inventory.scan([prefix, prefix])
+    assert combined.column("name") == ("numpy", "pandas")
+    assert inventory.env_packages(prefix).where("numpy").column("name") == ("numpy",)
+    assert len(inventory.env_packages(prefix)) == 2
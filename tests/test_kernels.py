@@ -0,0 +1,99 @@
+import os
+import json
+import stat
+
+import kernels
+from envs import CondaEnv
+
+
+def _env(root, name, ipykernel=True):
+    prefix = os.path.join(root, "envs", name)
+    os.makedirs(os.path.join(prefix, "conda-meta"))
+    os.makedirs(os.path.join(prefix, "bin"))
+    with open(os.path.join(prefix, "bin", "python"), "w"):
+        pass
+    if ipykernel:
+        with open(os.path.join(prefix, "conda-meta", "ipykernel-6.29.0-pyh0_0.json"), "w"):
+            pass
+    return CondaEnv(name, prefix)
+
+
+def _spec(directory, name, spec):
+    os.makedirs(os.path.join(directory, name))
+    with open(os.path.join(directory, name, "kernel.json"), "w") as f:
+        json.dump(spec, f)
+
+
+def _read(directory, name):
+    with open(os.path.join(directory, name, "kernel.json")) as f:
+        return json.load(f)
+
+
+def test_other_kernels_in_conda_envs_are_left_alone(tmp_path):
+    directory = str(tmp_path / "kernels")
+    r = _env(str(tmp_path), "r-env")
+    sas = os.path.join(str(tmp_path), "gone", "sas")
+    specs = {
+        "ir": {"argv": [os.path.join(r.path, "bin", "R"), "--slave", "-e",
+                        "IRkernel::main()", "--args", "{connection_file}"],
+               "display_name": "R", "language": "R", "env": {"R_LIBS_USER": "/x"}},
+        # its env is gone, but it is not an ipykernel so it is not ours to remove
+        "sas": {"argv": [os.path.join(sas, "bin", "python"), "-m", "sas_kernel",
+                         "-f", "{connection_file}"],
+                "display_name": "SAS", "language": "sas"},
+    }
+    for name, spec in specs.items():
+        _spec(directory, name, spec)
+
+    result = kernels.sync_kernels([r], directory)
+
+    assert result["added"] == ["r-env"]
+    assert result["removed"] == []
+    for name, spec in specs.items():
+        assert _read(directory, name) == spec
+
+
+def test_ipykernel_specs_are_recognised_but_not_rewritten(tmp_path):
+    directory = str(tmp_path / "kernels")
+    env = _env(str(tmp_path), "analysis")
+    spec = {"argv": [os.path.join(env.path, "bin", "python"), "-m", "ipykernel_launcher",
+                     "-f", "{connection_file}", "--matplotlib=inline"],
+            "display_name": "Analysis", "language": "python", "env": {"TOKEN": "x"}}
+    _spec(directory, "mine", spec)
+
+    result = kernels.sync_kernels([env], directory)
+
+    assert result == {"added": [], "updated": [], "removed": [], "unchanged": ["mine"]}
+    assert _read(directory, "mine") == spec
+
+
+def test_own_specs_keep_user_changes_and_are_world_readable(tmp_path):
+    directory = str(tmp_path / "kernels")
+    env = _env(str(tmp_path), "analysis")
+    spec_dir, written = kernels.write_kernel(env.path, "analysis", directory=directory)
+    assert written
+    kernel_json = os.path.join(spec_dir, "kernel.json")
+    assert stat.S_IMODE(os.stat(kernel_json).st_mode) == 0o644
+
+    spec = _read(directory, "analysis")
+    spec["env"] = {"OMP_NUM_THREADS": "4"}
+    spec["argv"].append("--debug")
+    with open(kernel_json, "w") as f:
+        json.dump(spec, f)
+
+    kernels.write_kernel(env.path, "analysis", "Analysis (new)", directory=directory)
+    updated = _read(directory, "analysis")
+    assert updated["env"] == {"OMP_NUM_THREADS": "4"}
+    assert updated["argv"][-1] == "--debug"
+    assert updated["display_name"] == "Analysis (new)"
+
+
+def test_stale_own_specs_are_removed(tmp_path):
+    directory = str(tmp_path / "kernels")
+    env = _env(str(tmp_path), "old")
+    kernels.write_kernel(env.path, "old", directory=directory)
+    os.remove(os.path.join(env.path, "bin", "python"))
+
+    result = kernels.sync_kernels([], directory)
+
+    assert result["removed"] == ["old"]
@@ -0,0 +1,71 @@
+import os
+
+import pytest
+
+from conda_meta import read_records
+from explicit import read_explicit
+from channel_index import platform_subdir
+
+
+def _installed(prefix):
+    return sorted((r["name"], r["version"], r["build"], r["url"])
+                  for r in read_records(prefix))
+
+
+def test_lock_round_trip(fake):
+    work = os.path.join(fake.tmp, "work")
+    source = fake.cincyconda(os.path.join(work, "source", ".env"))
+    source.Create(packages=fake.packages[:3])
+    lockfile = source.Lock(os.path.join(work, "lock.txt"))
+
+    records, header = read_explicit(lockfile)
+    assert sorted(r["url"] for r in records) == \
+        sorted(url for *_, url in _installed(source.path))
+    assert all(r["url"].startswith("file://") and r["md5"] for r in records)
+    assert f"platform: {platform_subdir()}" in header
+
+    copy = fake.cincyconda(os.path.join(work, "copy", ".env"))
+    copy.FromLock(lockfile)
+    assert _installed(copy.path) == _installed(source.path)
+
+    # the packages were fetched into the package cache and checked against the lock
+    cache = os.environ["CONDA_PKGS_DIRS"]
+    for record in records:
+        assert os.path.exists(os.path.join(cache, record["url"].rsplit("/", 1)[-1]))
+
+    with pytest.raises(AssertionError, match="already exists"):
+        copy.FromLock(lockfile)
+
+
+def test_lock_refuses_packages_without_url(fake):
+    cc = fake.cincyconda(os.path.join(fake.tmp, "work", ".env"))
+    cc.Create(packages=fake.packages[:1])
+    meta = os.path.join(cc.path, "conda-meta")
+    for fn in os.listdir(meta):
+        if fn.endswith(".json"):
+            path = os.path.join(meta, fn)
+            with open(path) as f:
+                text = f.read()
+            with open(path, "w") as f:
+                f.write(text.replace('"url": ', '"old_url": '))
+    with pytest.raises(AssertionError, match="no URL"):
+        cc.Lock(os.path.join(fake.tmp, "lock.txt"))
+
+
+def test_from_lock_checks_downloads(fake, monkeypatch):
+    from download import ChecksumError
+
+    work = os.path.join(fake.tmp, "work")
+    source = fake.cincyconda(os.path.join(work, "source", ".env"))
+    source.Create(packages=fake.packages[:1])
+    lockfile = source.Lock(os.path.join(work, "lock.txt"))
+
+    # a package changed on the channel after it was locked, and is not cached here
+    url = read_explicit(lockfile)[0][0]["url"]
+    with open(url[len("file://"):], "ab") as f:
+        f.write(b"tampered")
+    monkeypatch.setenv("CONDA_PKGS_DIRS", os.path.join(fake.tmp, "other-pkgs"))
+
+    copy = fake.cincyconda(os.path.join(work, "copy", ".env"))
+    with pytest.raises(ChecksumError):
+        copy.FromLock(lockfile)
@@ -0,0 +1,44 @@
+import json
+import os
+
+import pytest
+
+
+@pytest.fixture
+def failing(fake, monkeypatch):
+    """
+    Makes the fake conda fail the given subcommands.
+    """
+    def fail(*commands):
+        with open(os.environ["FAKE_CONDA_SCRIPT"]) as f:
+            script = json.load(f)
+        script["fail"] = list(commands)
+        path = os.path.join(fake.tmp, "failing.json")
+        with open(path, "w") as f:
+            json.dump(script, f)
+        monkeypatch.setenv("FAKE_CONDA_SCRIPT", path)
+    return fail
+
+
+def test_failed_install_and_update_raise(fake, failing):
+    env = fake.cincyconda(os.path.join(fake.tmp, "work", ".env"))
+    env.Create(packages=fake.packages[:1])
+
+    failing("install", "update")
+    with pytest.raises(AssertionError, match="conda install failed"):
+        env.Install(package=fake.packages[1])
+    with pytest.raises(AssertionError, match="conda update failed"):
+        env.update(fake.packages[0])
+
+
+def test_failed_async_install_and_update_report_failure(fake, failing):
+    env = fake.cincyconda(os.path.join(fake.tmp, "work", ".env"))
+    env.Create(packages=fake.packages[:1])
+
+    failing("install", "update")
+    install = env.InstallAsync(package=fake.packages[1])
+    with pytest.raises(AssertionError, match="conda install failed"):
+        install.result(timeout=30)
+    update = env.updateAsync(fake.packages[0])
+    with pytest.raises(AssertionError, match="conda update failed"):
+        update.result(timeout=30)
@@ -0,0 +1,130 @@
+import os
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import pypi
+from pypi import PyPIIndex, load_snapshot, normalize_name, project_name
+
+PROJECTS = {"pandas", "scikit-learn", "requests"}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def _answer(self):
+        self.server.hits.append((self.command, self.path))
+        if self.server.broken:
+            self.send_response(500)
+        elif self.command == "HEAD" and self.server.no_head:
+            self.send_response(405)
+        else:
+            self.send_response(200 if self.path.strip("/").split("/")[-1] in PROJECTS else 404)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    do_HEAD = do_GET = _answer
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def index():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    server.daemon_threads = True
+    server.block_on_close = False
+    server.hits = []
+    server.no_head = False
+    server.broken = False
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server, f"http://127.0.0.1:{server.server_port}/simple"
+    server.shutdown()
+    server.server_close()
+
+
+def test_names():
+    assert normalize_name("Scikit_Learn") == "scikit-learn"
+    assert normalize_name("zope.interface") == "zope-interface"
+    assert project_name("requests[socks]>=2") == "requests"
+    assert project_name("  Pandas >=2") == "pandas"
+    assert project_name(">=2") is None
+
+
+def test_checks_each_project_once_and_caches_the_answers(index):
+    server, url = index
+    names = ["pandas", "Scikit_Learn", "scikit-learn", "not-a-real-package"]
+    assert PyPIIndex(url).check(names) == {"pandas": True, "Scikit_Learn": True,
+                                           "scikit-learn": True,
+                                           "not-a-real-package": False}
+    assert sorted(path for _, path in server.hits) == \
+        ["/simple/not-a-real-package/", "/simple/pandas/", "/simple/scikit-learn/"]
+    assert all(method == "HEAD" for method, _ in server.hits)
+
+    # a new process reads the answers from the cache
+    server.hits.clear()
+    assert PyPIIndex(url).missing(names) == ["not-a-real-package"]
+    assert server.hits == []
+
+
+def test_negative_answers_expire_sooner(index, monkeypatch):
+    server, url = index
+    PyPIIndex(url).check(["pandas", "not-a-real-package"])
+    server.hits.clear()
+
+    monkeypatch.setattr(pypi, "PYPI_NEGATIVE_TTL", 0)
+    assert "not-a-real-package" not in PyPIIndex(url)
+    assert "pandas" in PyPIIndex(url)
+    assert server.hits == [("HEAD", "/simple/not-a-real-package/")]
+
+
+def test_falls_back_to_get_without_head(index):
+    server, url = index
+    server.no_head = True
+    assert PyPIIndex(url).check(["requests"]) == {"requests": True}
+    assert server.hits == [("HEAD", "/simple/requests/"), ("GET", "/simple/requests/")]
+
+
+def test_errors_are_reported_and_not_cached(index):
+    server, url = index
+    server.broken = True
+    with pytest.raises(AssertionError, match="CINCYCONDA_PYPI_SNAPSHOT"):
+        PyPIIndex(url).check(["pandas"])
+
+    server.broken = False
+    assert PyPIIndex(url).check(["pandas"]) == {"pandas": True}
+
+
+@pytest.mark.parametrize("content", [
+    json.dumps({"meta": {"api-version": "1.0"},
+                "projects": [{"name": "Pandas"}, {"name": "scikit_learn"}]}),
+    '<html><body><a href="/simple/pandas/">Pandas</a>\n'
+    '<a href="/simple/scikit-learn/">scikit_learn</a></body></html>',
+    "Pandas\nscikit_learn\n",
+])
+def test_snapshot_formats(tmp_path, content):
+    path = tmp_path / "simple.txt"
+    path.write_text(content)
+    assert load_snapshot(str(path)) == {"pandas", "scikit-learn"}
+    assert PyPIIndex(snapshot=str(path)).check(["Scikit-Learn", "numpy"]) == \
+        {"Scikit-Learn": True, "numpy": False}
+
+
+def test_parsed_snapshots_are_cached_as_json(tmp_path, cache):
+    path = tmp_path / "simple.txt"
+    path.write_text("pandas\n")
+    load_snapshot(str(path))
+    cached, = (cache / "pypi").iterdir()
+    assert json.loads(cached.read_text())["names"] == ["pandas"]
+
+    pypi._SNAPSHOTS.clear()
+    assert load_snapshot(str(path)) == {"pandas"}
+
+    # an edited snapshot is parsed again
+    path.write_text("pandas\nrequests\n")
+    assert load_snapshot(str(path)) == {"pandas", "requests"}
+
+
+def test_missing_snapshot(tmp_path):
+    with pytest.raises(AssertionError, match="save_snapshot"):
+        load_snapshot(str(tmp_path / "nope.json"))
@@ -0,0 +1,39 @@
+import os
+
+import pytest
+
+import CincyConda
+from request_store import REQUEST_STORE_FILE, RequestStore, default_store_path
+
+
+@pytest.fixture(autouse=True)
+def no_db(monkeypatch):
+    monkeypatch.delenv("CINCYCONDA_REQUESTS_DB", raising=False)
+
+
+def test_there_is_no_per_user_fallback():
+    with pytest.raises(AssertionError, match="REQUESTS_DB_PATH"):
+        default_store_path("https://repo.example/repo/restricted_channel")
+    with pytest.raises(AssertionError, match="REQUESTS_DB_PATH"):
+        RequestStore()
+
+
+def test_store_locations(tmp_path, monkeypatch):
+    channel = f"file://{tmp_path}/channel"
+    assert default_store_path(channel) == \
+        os.path.join(str(tmp_path), "channel", REQUEST_STORE_FILE)
+    assert default_store_path(channel, "/srv/cincypy/requests.sqlite") == \
+        "/srv/cincypy/requests.sqlite"
+
+    monkeypatch.setenv("CINCYCONDA_REQUESTS_DB", "/data/requests.sqlite")
+    assert default_store_path(channel, "/srv/cincypy/requests.sqlite") == \
+        "/data/requests.sqlite"
+
+
+def test_cincyconda_uses_the_configured_store(fake, monkeypatch):
+    path = os.path.join(fake.tmp, "shared", "requests.sqlite")
+    os.makedirs(os.path.dirname(path))
+    monkeypatch.setattr(CincyConda, "REQUESTS_DB_PATH", path)
+
+    env = fake.cincyconda(os.path.join(fake.tmp, "work", ".env"))
+    assert env._request_store().path == path
@@ -0,0 +1,58 @@
+import time
+
+import runner
+
+
+def test_run_captures_output():
+    result = runner.run(["sh", "-c", "echo out; echo err >&2; exit 3"])
+    assert result.returncode == 3
+    assert result.stdout.strip() == "out"
+    assert result.stderr.strip() == "err"
+
+
+def test_timeout_kills_processes_the_command_started():
+    # the background sleep holds stdout open after its parent is killed
+    start = time.perf_counter()
+    result = runner.run(["sh", "-c", "sleep 30 & sleep 30"], timeout=0.5)
+    assert time.perf_counter() - start < 5
+    assert result.returncode != 0
+
+
+def test_output_of_a_background_process_does_not_block(monkeypatch):
+    monkeypatch.setattr(runner, "OUTPUT_GRACE", 0.5)
+    start = time.perf_counter()
+    result = runner.run(["sh", "-c", "echo done; sleep 30 &"])
+    assert time.perf_counter() - start < 5
+    assert result.returncode == 0
+    assert result.stdout.strip() == "done"
+
+
+def test_kill_group_never_signals_a_reaped_command():
+    started = []
+    result = runner.run(["sh", "-c", "exit 0"], on_start=started.append)
+    proc, = started
+    assert result.returncode == 0
+    assert proc.exited.is_set()
+    assert not runner.kill_group(proc)
+
+
+def test_kill_group_from_another_thread():
+    import signal
+    import threading
+
+    started = threading.Event()
+    procs = []
+
+    def _on_start(proc):
+        procs.append(proc)
+        started.set()
+
+    def _cancel():
+        started.wait()
+        assert runner.kill_group(procs[0], signal.SIGTERM)
+
+    canceller = threading.Thread(target=_cancel)
+    canceller.start()
+    result = runner.run(["sleep", "30"], on_start=_on_start)
+    canceller.join()
+    assert result.returncode == -signal.SIGTERM
@@ -0,0 +1,85 @@
+import os
+import time
+
+import solve_cache
+from solve_cache import (SolveCache, channel_urls, channels_fingerprint,
+                         config_fingerprint)
+
+
+def _key(**kwargs):
+    args = dict(specs=["numpy", "pandas"], channel_fingerprint="abc", platform="linux-64")
+    args.update(kwargs)
+    return SolveCache.key(**args)
+
+
+def test_key_covers_command_backend_and_config():
+    base = _key()
+    assert _key(specs=["pandas", "numpy"]) == base
+    assert _key(command="install") != base
+    assert _key(backend=["mamba", "create"]) != _key(backend=["conda", "create"])
+    assert _key(config="one") != _key(config="two")
+    assert _key(installed=["numpy-1.0-0"]) != base
+
+
+def test_config_fingerprint_follows_condarc(tmp_path, monkeypatch):
+    conda = str(tmp_path / "conda" / "bin" / "conda")
+    before = config_fingerprint(conda)
+    condarc = tmp_path / "home" / ".condarc"
+    condarc.write_text("channels:\n  - conda-forge\n")
+    after = config_fingerprint(conda)
+    assert after != before
+    monkeypatch.setenv("CONDA_CHANNEL_PRIORITY", "strict")
+    assert config_fingerprint(conda) != after
+    # the shell's activation state is not configuration
+    monkeypatch.setenv("CONDA_SHLVL", "2")
+    monkeypatch.setenv("CONDA_PREFIX", str(tmp_path))
+    monkeypatch.delenv("CONDA_CHANNEL_PRIORITY")
+    assert config_fingerprint(conda) == after
+
+
+def test_channel_urls(tmp_path):
+    conda = str(tmp_path / "conda" / "bin" / "conda")
+    assert channel_urls(conda) == solve_cache.DEFAULT_CHANNELS
+    (tmp_path / "home" / ".condarc").write_text(
+        "channel_alias: https://repo.example.com/repo\n"
+        "channels:\n  - restricted_channel\n  - defaults\n  - file:///srv/local\n"
+        "default_channels:\n  - https://mirror.example.com/main\n")
+    assert channel_urls(conda) == ["https://repo.example.com/repo/restricted_channel",
+                                   "https://mirror.example.com/main", "file:///srv/local"]
+
+
+def test_channels_fingerprint_follows_repodata(tmp_path, monkeypatch):
+    monkeypatch.setattr(solve_cache, "_VALIDATORS", {})
+    monkeypatch.setattr(solve_cache, "INDEX_MAX_AGE", 0)
+    repodata = tmp_path / "channel" / "noarch" / "repodata.json"
+    repodata.parent.mkdir(parents=True)
+    repodata.write_text("{}")
+    url = f"file://{tmp_path / 'channel'}"
+    first = channels_fingerprint([url], ["noarch"])
+    assert first is not None
+    os.utime(repodata, (time.time() + 10, time.time() + 10))
+    assert channels_fingerprint([url], ["noarch"]) != first
+
+
+def test_unreachable_channel_disables_the_cache(monkeypatch):
+    monkeypatch.setattr(solve_cache, "_VALIDATORS", {})
+    monkeypatch.setattr(solve_cache, "CHANNEL_CHECK_TIMEOUT", 1)
+    assert channels_fingerprint(["http://127.0.0.1:9/channel"], ["noarch"]) is None
+
+
+def test_install_without_urls_does_not_reuse_the_create_solve(fake):
+    from channel_index import get_channel_index
+
+    cc = fake.cincyconda(os.path.join(fake.tmp, "work", ".env"))
+    cc.Create(packages=fake.packages[:2])
+    index = get_channel_index(f"{fake.channel_alias}/repo/restricted_channel")
+    create_key = cc._solve_key(fake.packages[:2], index, "create")
+    meta = os.path.join(cc.path, "conda-meta")
+    for fn in os.listdir(meta):
+        if fn.endswith(".json"):
+            path = os.path.join(meta, fn)
+            with open(path) as f:
+                text = f.read()
+            with open(path, "w") as f:
+                f.write(text.replace('"url": ', '"old_url": '))
+    assert cc._solve_key(fake.packages[:2], index, "install") != create_key
@@ -0,0 +1,107 @@
+import os
+import json
+
+import pytest
+
+from conda_meta import read_records
+from specs import parse_spec, sync_plan, split_subdir
+
+# trimmed from conda-meta/numpy-1.26.4-py311h64a7726_0.json of a real env
+NUMPY_RECORD = {
+    "build": "py311h64a7726_0",
+    "build_number": 0,
+    "channel": "https://conda.anaconda.org/conda-forge/linux-64",
+    "constrains": ["numpy-base <0a0"],
+    "depends": ["libblas >=3.9.0,<4.0a0", "libcblas >=3.9.0,<4.0a0", "libgcc-ng >=12",
+                "python >=3.11,<3.12.0a0", "python_abi 3.11.* *_cp311"],
+    "fn": "numpy-1.26.4-py311h64a7726_0.conda",
+    "license": "BSD-3-Clause",
+    "md5": "a502d7aad449a1206efb366d6a12c52d",
+    "name": "numpy",
+    "requested_spec": "conda-forge::numpy=1.26",
+    "sha256": "3f4365e11b28e244c95ba8579942b0802761ba7bb31c026f50d1a9ea9c728149",
+    "size": 8065890,
+    "subdir": "linux-64",
+    "timestamp": 1707225421156,
+    "url": "https://conda.anaconda.org/conda-forge/linux-64/"
+           "numpy-1.26.4-py311h64a7726_0.conda",
+    "version": "1.26.4",
+}
+
+
+@pytest.fixture
+def env(tmp_path):
+    meta = tmp_path / "env" / "conda-meta"
+    meta.mkdir(parents=True)
+    with open(meta / "numpy-1.26.4-py311h64a7726_0.json", "w") as f:
+        json.dump(NUMPY_RECORD, f)
+    return str(tmp_path / "env")
+
+
+@pytest.mark.parametrize("text", [
+    "conda-forge::numpy",
+    "conda-forge::numpy=1.26",
+    "https://conda.anaconda.org/conda-forge::numpy",
+    "conda-forge/linux-64::numpy",
+    "numpy[channel=conda-forge]",
+    "numpy[channel=conda-forge,subdir=linux-64]",
+])
+def test_channel_matches_a_conda_meta_record(env, text):
+    record, = read_records(env)
+    assert parse_spec(text).matches(record)
+
+
+@pytest.mark.parametrize("text", [
+    "defaults::numpy",
+    "conda-forge/osx-arm64::numpy",
+    "numpy[channel=conda-forge,subdir=noarch]",
+])
+def test_other_channels_do_not_match(env, text):
+    record, = read_records(env)
+    assert not parse_spec(text).matches(record)
+
+
+def test_sync_plan_of_a_matching_env_is_empty(env):
+    assert not sync_plan(read_records(env), ["conda-forge::numpy>=1.24,<2"])
+
+
+@pytest.mark.parametrize("text, version, build, channel", [
+    ('numpy[version=">=1.2"]', ">=1.2", None, None),
+    ("numpy[version='>=1.24, <2', build=py311*]", ">=1.24,<2", "py311*", None),
+    ('conda-forge::numpy[build_number=0, version="1.26.*"]', "1.26.*", None,
+     "conda-forge"),
+    ("numpy >=1.2 [build=py*]", ">=1.2", "py*", None),
+])
+def test_bracket_specs(text, version, build, channel):
+    spec = parse_spec(text)
+    assert (spec.name, spec.version, spec.build, spec.channel) == \
+        ("numpy", version, build, channel)
+    assert spec.matches(NUMPY_RECORD)
+
+
+def test_unreadable_brackets_are_refused():
+    with pytest.raises(AssertionError, match="Could not read the package spec"):
+        parse_spec("numpy[version]")
+
+
+def test_split_subdir():
+    assert split_subdir("https://conda.anaconda.org/conda-forge/noarch/") == \
+        ("https://conda.anaconda.org/conda-forge", "noarch")
+    assert split_subdir("conda-forge") == ("conda-forge", None)
+    assert split_subdir("linux-64") == ("linux-64", None)
+
+
+def test_sync_prune_removes_then_installs_through_the_solver(fake):
+    env = fake.cincyconda(os.path.join(fake.tmp, "work", ".env"))
+    env.Create(packages=fake.packages[:2])
+
+    plan = env.Sync(packages=fake.packages[1:3], prune=True)
+    assert [spec.name for spec in plan.add] == [fake.packages[2]]
+    assert plan.remove == [fake.packages[0]]
+    assert sorted(r["name"] for r in read_records(env.path)) == fake.packages[1:3]
+
+    commands = [c.args for c in env.commands[-2:]]
+    assert commands == [env._solver_command("remove", "--prefix", env.path, "-y",
+                                            fake.packages[0]),
+                        env._solver_command("install", "--prefix", env.path, "-y",
+                                            fake.packages[2])]
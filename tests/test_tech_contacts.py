@@ -0,0 +1,130 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from get_tech_contacts import get_tech_contacts, get_tech_contacts_async
+
+CONTACTS = {"Andy": "andy@example.com"}
+OTHER_CONTACTS = {"Beth": "beth@example.com"}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.server.hits += 1
+        if self.server.delay:
+            time.sleep(self.server.delay)
+        if self.server.down:
+            self.send_response(503)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        body = json.dumps(self.server.contacts).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def _start(contacts):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    server.daemon_threads = True
+    server.block_on_close = False
+    server.hits = 0
+    server.delay = 0
+    server.down = False
+    server.contacts = contacts
+    server.endpoint = f"http://127.0.0.1:{server.server_port}/api/get-tech-contacts"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def _stop(server):
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def server():
+    server = _start(CONTACTS)
+    yield server
+    _stop(server)
+
+
+@pytest.fixture
+def other_server():
+    server = _start(OTHER_CONTACTS)
+    yield server
+    _stop(server)
+
+
+def _dead_endpoint():
+    # a port nothing listens on
+    probe = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    port = probe.server_port
+    probe.server_close()
+    return f"http://127.0.0.1:{port}/api/get-tech-contacts"
+
+
+def test_fetches_then_uses_the_cache(server):
+    assert get_tech_contacts(endpoint=server.endpoint) == CONTACTS
+    assert get_tech_contacts(endpoint=server.endpoint) == CONTACTS
+    assert server.hits == 1
+
+    # an expired copy is fetched again
+    assert get_tech_contacts(endpoint=server.endpoint, max_age=0) == CONTACTS
+    assert server.hits == 2
+
+
+def test_each_endpoint_has_its_own_copy(server, other_server):
+    assert get_tech_contacts(endpoint=server.endpoint) == CONTACTS
+    assert get_tech_contacts(endpoint=other_server.endpoint) == OTHER_CONTACTS
+    assert get_tech_contacts(endpoint=server.endpoint) == CONTACTS
+    assert (server.hits, other_server.hits) == (1, 1)
+
+
+def test_stale_copy_when_the_server_is_down(server):
+    get_tech_contacts(endpoint=server.endpoint)
+    server.down = True
+    assert get_tech_contacts(endpoint=server.endpoint, max_age=0) == CONTACTS
+    # a copy of one endpoint is never used for another
+    with pytest.raises(requests.RequestException):
+        get_tech_contacts(endpoint=_dead_endpoint(), max_age=0)
+
+
+def test_stale_copy_when_the_server_is_slow(server):
+    get_tech_contacts(endpoint=server.endpoint)
+    server.delay = 2
+    start = time.perf_counter()
+    assert get_tech_contacts(endpoint=server.endpoint, max_age=0, timeout=0.2) == CONTACTS
+    assert time.perf_counter() - start < 1.5
+
+
+def test_error_without_a_cached_copy():
+    with pytest.raises(requests.RequestException):
+        get_tech_contacts(endpoint=_dead_endpoint())
+
+
+def test_async(server):
+    server.delay = 0.3
+    start = time.perf_counter()
+    future = get_tech_contacts_async(endpoint=server.endpoint)
+    assert time.perf_counter() - start < 0.2
+    assert future.result(timeout=5) == CONTACTS
+
+    server.delay = 0
+    server.down = True
+    failed = get_tech_contacts_async(endpoint=server.endpoint, max_age=0)
+    # the cached copy from the first call
+    assert failed.result(timeout=5) == CONTACTS
+
+    # and an endpoint without a cached copy reports the error
+    with pytest.raises(requests.RequestException):
+        get_tech_contacts_async(endpoint=_dead_endpoint()).result(timeout=5)
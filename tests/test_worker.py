@@ -0,0 +1,111 @@
+import os
+import signal
+import time
+
+import pytest
+
+import worker
+from worker import WorkerClient, serve, target_prefix
+
+CONDA = "/opt/conda/bin/conda"
+
+
+def _socket_dir(tmp_path, mode):
+    directory = tmp_path / "run"
+    directory.mkdir()
+    os.chmod(directory, mode)
+    # a stand-in for a socket left there by someone else
+    path = directory / "cincyconda-worker.sock"
+    path.write_text("")
+    return str(path)
+
+
+def test_the_client_refuses_a_folder_others_can_open(tmp_path, capsys):
+    client = WorkerClient(CONDA, _socket_dir(tmp_path, 0o777))
+    assert client.ping() is None
+    assert client.run([CONDA, "install", "-y", "-p", "/x", "polars"]) is None
+    # said once, not on every command
+    assert capsys.readouterr().err.count("Not using the CincyConda worker") == 1
+
+
+def test_the_client_refuses_a_socket_of_another_user(tmp_path, monkeypatch, capsys):
+    path = _socket_dir(tmp_path, 0o700)
+    monkeypatch.setattr(worker.os, "getuid", lambda: os.stat(path).st_uid + 1)
+    assert WorkerClient(CONDA, path).ping() is None
+    assert "belongs to another user" in capsys.readouterr().err
+
+
+def test_the_client_refuses_what_is_not_a_socket(tmp_path, capsys):
+    assert WorkerClient(CONDA, _socket_dir(tmp_path, 0o700)).ping() is None
+    assert "is not a socket" in capsys.readouterr().err
+
+
+def test_the_worker_refuses_a_shared_folder(tmp_path):
+    shared = tmp_path / "shared"
+    shared.mkdir()
+    os.chmod(shared, 0o1777)
+    with pytest.raises(AssertionError, match="Refusing to start a CincyConda worker"):
+        serve(CONDA, str(shared / "worker.sock"), in_process=False)
+
+
+def test_target_prefix_uses_the_command_environment(tmp_path, monkeypatch):
+    monkeypatch.setenv("CONDA_ENVS_DIRS", "/somewhere/else")
+    environ = {"CONDA_ENVS_DIRS": "~/envs", "HOME": "/home/analyst"}
+    assert target_prefix(["install", "-n", "py311"], "/opt/conda", "/work", environ) == \
+        "/home/analyst/envs/py311"
+    assert target_prefix(["install", "--prefix=.env"], "/opt/conda", "/work", environ) == \
+        "/work/.env"
+    assert target_prefix(["install", "-n", "base"], "/opt/conda", "/work", environ) == \
+        "/opt/conda"
+    assert target_prefix(["clean", "--all"], "/opt/conda", "/work", environ) is None
+
+
+def test_the_worker_is_opt_in(fake):
+    assert fake.cincyconda(os.path.join(fake.tmp, "a", ".env"))._worker is None
+    assert fake.cincyconda(os.path.join(fake.tmp, "b", ".env"), worker=True)._worker \
+        is not None
+
+
+def test_commands_run_in_the_worker(fake, tmp_path, monkeypatch):
+    run = tmp_path / "run"
+    run.mkdir(mode=0o700)
+    monkeypatch.setenv("CINCYCONDA_WORKER_SOCKET", str(run / "worker.sock"))
+    cc = fake.cincyconda(os.path.join(fake.tmp, "work", ".env"), worker=True)
+    cc.StartWorker()
+    try:
+        assert oct(os.stat(run / "worker.sock").st_mode & 0o777) == "0o600"
+        cc.Create(packages=fake.packages[:2])
+        assert os.path.isdir(os.path.join(cc.path, "conda-meta"))
+        assert cc._worker.ping()["served"] > 0
+    finally:
+        assert cc.StopWorker()
+
+
+@pytest.mark.parametrize("conda_catches_everything", [False, True])
+def test_sigterm_fails_the_running_command(monkeypatch, conda_catches_everything):
+    w = worker.Worker(CONDA, in_process=False)
+    w.in_process = True
+
+    def _run_in_process(job):
+        # conda's main, interrupted by SIGTERM half way through
+        try:
+            os.kill(os.getpid(), signal.SIGTERM)
+            time.sleep(5)
+        except BaseException:
+            if not conda_catches_everything:
+                raise
+        return {"returncode": 0, "stdout": "", "stderr": "", "cpu_time": 0.0,
+                "peak_rss": 0}
+    monkeypatch.setattr(w, "_run_in_process", _run_in_process)
+
+    job = worker._Job([CONDA, "install", "-y", "-p", "/x", "polars"], {}, "/", "/x",
+                      lambda stream, line: None)
+    w.jobs.put(job)
+    previous = signal.signal(signal.SIGTERM, w.terminate)
+    try:
+        with pytest.raises(worker._Terminated):
+            w.serve_jobs()
+    finally:
+        signal.signal(signal.SIGTERM, previous)
+    assert job.done.is_set()
+    assert job.result["returncode"] == -signal.SIGTERM